@@ -1,34 +1,210 @@
+import threading
 import cv2
 import numpy as np
 from google.cloud import vision
+from django.conf import settings
 from django.core.files.base import ContentFile
+from django.utils.module_loading import import_string
 from io import BytesIO
+from PIL import Image
 
 def combine_images(front_image_path, back_image_path):
-    front_image = cv2.imread(front_image_path)
-    back_image = cv2.imread(back_image_path)
+    with open(front_image_path, "rb") as f:
+        front_content = f.read()
+    with open(back_image_path, "rb") as f:
+        back_content = f.read()
+    return combine_image_bytes(front_content, back_content)
 
-    # Resize images to match the same height
-    height = max(front_image.shape[0], back_image.shape[0])
-    front_image = cv2.resize(front_image, (front_image.shape[1], height))
-    back_image = cv2.resize(back_image, (back_image.shape[1], height))
 
-    # Combine images horizontally
-    combined_image = np.hstack((front_image, back_image))
+# OpenCV can decode JPEGs straight to 1/2, 1/4 or 1/8 scale, skipping most of the IDCT work
+_REDUCED_FLAGS = [
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+]
 
-    return combined_image
+# EXIF orientations that rotate the image by 90 degrees, swapping width and height
+_ROTATED_ORIENTATIONS = (5, 6, 7, 8)
 
-def extract_text_from_image(image_path):
-    client = vision.ImageAnnotatorClient()
 
-    with open(image_path, "rb") as image_file:
-        content = image_file.read()
+def image_size(content):
+    """Return the displayed (width, height) of encoded image bytes, reading only the header."""
+    with Image.open(BytesIO(content)) as image:
+        width, height = image.size
+        if image.getexif().get(0x0112) in _ROTATED_ORIENTATIONS:
+            width, height = height, width
+    return width, height
+
+
+def decode_image(content, min_height=None):
+    """
+    Decode image bytes to a BGR array, as small as possible while still at least min_height tall.
+
+    Without min_height the image is decoded at full resolution.
+    """
+    flag = cv2.IMREAD_COLOR
+    if min_height:
+        try:
+            height = image_size(content)[1]
+        except (OSError, ValueError):
+            height = 0
+        for factor, reduced_flag in _REDUCED_FLAGS:
+            if height // factor >= min_height:
+                flag = reduced_flag
+                break
+
+    image = cv2.imdecode(np.frombuffer(content, np.uint8), flag)
+    if image is None:
+        raise ValueError("Could not decode image")
+    return image
+
+
+def _scan_setting(name, default):
+    return getattr(settings, name, default)
+
+
+def combine_image_bytes(front_content, back_content, max_height=None, max_width=None):
+    """
+    Decode the front and back images and place them side by side at a common height.
+
+    The output is capped at max_height x max_width (settings.SCAN_IMAGE_MAX_HEIGHT and
+    SCAN_IMAGE_MAX_WIDTH by default), which is all OCR needs. Both images are decoded at
+    reduced scale where possible and resized straight into one preallocated canvas.
+    """
+    if max_height is None:
+        max_height = _scan_setting('SCAN_IMAGE_MAX_HEIGHT', 1600)
+    if max_width is None:
+        max_width = _scan_setting('SCAN_IMAGE_MAX_WIDTH', 2400)
+
+    front_size = image_size(front_content)
+    back_size = image_size(back_content)
+
+    # Match the same height, as large as the taller image but within the limits
+    height = min(max_height, max(front_size[1], back_size[1]))
+    aspects = [w / h for w, h in (front_size, back_size)]
+    if height * sum(aspects) > max_width:
+        height = int(max_width / sum(aspects))
+    widths = [max(1, round(height * aspect)) for aspect in aspects]
+
+    canvas = np.empty((height, sum(widths), 3), dtype=np.uint8)
+    x = 0
+    for content, width in zip((front_content, back_content), widths):
+        image = decode_image(content, min_height=height)
+        target = canvas[:, x:x + width]
+        if image.shape[:2] == (height, width):
+            target[:] = image
+        else:
+            interpolation = cv2.INTER_AREA if image.shape[0] > height else cv2.INTER_LINEAR
+            cv2.resize(image, (width, height), dst=target, interpolation=interpolation)
+        del image
+        x += width
+
+    return canvas
+
+
+def encode_jpeg(image, quality=None):
+    """JPEG-encode a BGR array at settings.SCAN_JPEG_QUALITY."""
+    if quality is None:
+        quality = _scan_setting('SCAN_JPEG_QUALITY', 90)
+    ok, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    if not ok:
+        raise ValueError("Could not encode image")
+    return buffer.tobytes()
+
+
+class GoogleVisionOCR:
+    """
+    OCR backend backed by Google Cloud Vision.
+
+    The ImageAnnotatorClient (gRPC channel and credentials) is created on first use and
+    shared by every request in the process.
+    """
+    # Vision accepts at most 16 images per synchronous batch request
+    max_batch_size = 16
 
-    image = vision.Image(content=content)
-    response = client.text_detection(image=image)
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
 
-    if response.error.message:
-        raise Exception(f"{response.error.message}")
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._create_client()
+        return self._client
+
+    def _create_client(self):
+        endpoint = _scan_setting('VISION_API_ENDPOINT', None)
+        if not endpoint:
+            return vision.ImageAnnotatorClient()
+        # A Vision-compatible REST endpoint without Google credentials, e.g. the benchmark stand-in
+        from google.auth.credentials import AnonymousCredentials
+        return vision.ImageAnnotatorClient(
+            transport='rest', credentials=AnonymousCredentials(), client_options={'api_endpoint': endpoint},
+        )
+
+    def extract_text(self, content):
+        response = self.client.text_detection(image=vision.Image(content=content))
+        return self._text_from_response(response)
+
+    def extract_texts(self, contents):
+        texts = []
+        feature = vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION)
+        for start in range(0, len(contents), self.max_batch_size):
+            batch_requests = [
+                vision.AnnotateImageRequest(image=vision.Image(content=content), features=[feature])
+                for content in contents[start:start + self.max_batch_size]
+            ]
+            batch = self.client.batch_annotate_images(requests=batch_requests)
+            texts.extend(self._text_from_response(response) for response in batch.responses)
+        return texts
+
+    def _text_from_response(self, response):
+        if response.error.message:
+            raise Exception(f"{response.error.message}")
+
+        texts = response.text_annotations
+        return texts[0].description if texts else ""
+
+
+_ocr_backend = None
+_ocr_backend_lock = threading.Lock()
+
+
+def get_ocr_backend():
+    """Return the process-wide OCR backend named by settings.OCR_BACKEND."""
+    global _ocr_backend
+    if _ocr_backend is None:
+        with _ocr_backend_lock:
+            if _ocr_backend is None:
+                backend_path = getattr(settings, 'OCR_BACKEND', 'api.ai_card.card_to_text.GoogleVisionOCR')
+                _ocr_backend = import_string(backend_path)()
+    return _ocr_backend
+
+
+def set_ocr_backend(backend):
+    """Swap the OCR backend, e.g. for a local fake in tests. Pass None to reload from settings."""
+    global _ocr_backend
+    with _ocr_backend_lock:
+        _ocr_backend = backend
+
+
+def extract_text_from_bytes(content):
+    """Run OCR on encoded image bytes (JPEG/PNG) without touching the disk."""
+    return get_ocr_backend().extract_text(content)
+
+
+def extract_text_from_images(contents):
+    """Run OCR on several encoded images, batched into as few upstream calls as the backend allows."""
+    backend = get_ocr_backend()
+    if hasattr(backend, 'extract_texts'):
+        return backend.extract_texts(list(contents))
+    return [backend.extract_text(content) for content in contents]
+
+
+def extract_text_from_image(image_path):
+    with open(image_path, "rb") as image_file:
+        content = image_file.read()
 
-    texts = response.text_annotations
-    return texts[0].description if texts else ""
+    return extract_text_from_bytes(content)
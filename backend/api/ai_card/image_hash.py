@@ -0,0 +1,42 @@
+import hashlib
+import cv2
+import numpy as np
+
+
+def sha256_of(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def dhash(content, hash_size=8):
+    """
+    Difference hash of an encoded image.
+
+    The image is decoded at reduced size in grayscale, shrunk to (hash_size + 1) x hash_size
+    and each bit records whether a pixel is brighter than its right neighbour. Re-scans of
+    the same card give hashes a few bits apart, unlike an exact digest of the file.
+    """
+    image = cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if image is None:
+        return None
+    small = cv2.resize(image, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    diff = small[:, 1:] > small[:, :-1]
+    value = 0
+    for bit in diff.flatten():
+        value = (value << 1) | int(bit)
+    return value
+
+
+def fingerprint(content):
+    """(sha256 hex digest, dHash or None) of encoded image bytes."""
+    return sha256_of(content), dhash(content)
+
+
+def hash_bands(value, bands=4, bits=64):
+    """Split a hash into equal bands. Hashes within bands - 1 bits of each other share at least one band."""
+    width = bits // bands
+    mask = (1 << width) - 1
+    return [(value >> (width * i)) & mask for i in range(bands)]
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
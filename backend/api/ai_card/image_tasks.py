@@ -0,0 +1,71 @@
+"""
+CPU-bound image work run through api.image_work.
+
+These functions take and return plain bytes and values, never touch Django settings or
+the database, and so can run in a worker process as well as in a thread.
+"""
+import time
+
+import cv2
+
+from .card_to_text import combine_image_bytes, decode_image, encode_jpeg, image_size
+from .image_hash import fingerprint
+
+
+_THUMBNAIL_ENCODE_FLAGS = {
+    'webp': ('.webp', cv2.IMWRITE_WEBP_QUALITY),
+    'jpeg': ('.jpg', cv2.IMWRITE_JPEG_QUALITY),
+}
+THUMBNAIL_EXTENSIONS = {fmt: extension for fmt, (extension, _) in _THUMBNAIL_ENCODE_FLAGS.items()}
+
+
+def combine_task(front_content, back_content, max_height, max_width, quality):
+    """JPEG bytes of the front and back images side by side, as sent to OCR."""
+    return encode_jpeg(combine_image_bytes(front_content, back_content, max_height, max_width), quality)
+
+
+def upload_task(front_content, back_content, combine, max_height, max_width, quality):
+    """
+    All image work an upload needs up front, in one round trip to the pool.
+
+    Returns {'sha256', 'dhash', 'combined', 'timings'}; combined is None unless combine is
+    set, and timings holds the seconds spent in each stage, for api.metrics.
+    """
+    timings = {}
+    start = time.perf_counter()
+    sha256, dhash = fingerprint(front_content)
+    timings['hash'] = time.perf_counter() - start
+
+    combined = None
+    if combine:
+        start = time.perf_counter()
+        canvas = combine_image_bytes(front_content, back_content, max_height, max_width)
+        timings['combine'] = time.perf_counter() - start
+        start = time.perf_counter()
+        combined = encode_jpeg(canvas, quality)
+        timings['encode'] = time.perf_counter() - start
+    return {'sha256': sha256, 'dhash': dhash, 'combined': combined, 'timings': timings}
+
+
+def render_variants(content, sizes, formats, quality):
+    """
+    Render encoded image bytes at each width in sizes and each format.
+
+    Returns {'<width>.<format>': bytes}. Images narrower than a width are not upscaled.
+    """
+    width, height = image_size(content)
+    sizes = sorted(sizes, reverse=True)
+    image = decode_image(content, min_height=-(-sizes[0] * height // width))
+
+    variants = {}
+    # Each size is scaled down from the previous one, which is cheaper and looks the same with INTER_AREA
+    for size in sizes:
+        if image.shape[1] > size:
+            image = cv2.resize(image, (size, max(1, round(image.shape[0] * size / image.shape[1]))), interpolation=cv2.INTER_AREA)
+        for fmt in formats:
+            extension, quality_flag = _THUMBNAIL_ENCODE_FLAGS[fmt]
+            ok, buffer = cv2.imencode(extension, image, [quality_flag, int(quality)])
+            if not ok:
+                raise ValueError(f"Could not encode {fmt} thumbnail")
+            variants[f'{size}.{fmt}'] = buffer.tobytes()
+    return variants
@@ -0,0 +1,207 @@
+"""
+Persistent memo of LLM identifications.
+
+Results are stored in the LLMResult table under a hash of (kind, prompt version, model,
+normalized OCR text). The prompt version is a digest of the prompt text itself, so
+editing a prompt or its schema starts a fresh set of keys. prune() deletes entries from
+old prompt versions, entries unused for longer than settings.LLM_CACHE_MAX_AGE_DAYS,
+and the least recently used ones beyond settings.LLM_CACHE_MAX_ENTRIES. It runs from
+manage.py prune_llm_cache, and in a background thread after every LLM_CACHE_PRUNE_EVERY
+writes, so no request waits on it.
+"""
+import hashlib
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from pydantic import ValidationError
+
+from ..metrics import count_cache, stage
+
+logger = logging.getLogger(__name__)
+
+# kind -> current prompt version, filled in by register_prompt()
+PROMPT_VERSIONS = {}
+
+_writes = 0
+_writes_lock = threading.Lock()
+_pruning = False
+
+
+def normalize_text(text):
+    """Collapse whitespace and case so trivially different OCR output shares a key."""
+    return " ".join(text.split()).lower()
+
+
+def register_prompt(kind, *prompt_parts):
+    """Record the prompt used for kind and return its version string."""
+    digest = hashlib.sha256("\x00".join(prompt_parts).encode("utf-8")).hexdigest()[:16]
+    PROMPT_VERSIONS[kind] = digest
+    return digest
+
+
+def cache_key(kind, prompt_version, model, text):
+    raw = "\x00".join([kind, prompt_version, model, normalize_text(text)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def memoized(kind, model, text, schema, compute):
+    """
+    Return the cached schema instance for this text, or call compute() and cache its result.
+
+    compute must return an instance of the pydantic model schema.
+    """
+    from ..models import LLMResult
+
+    if not getattr(settings, 'LLM_CACHE_ENABLED', True):
+        with stage('llm'):
+            return compute()
+
+    prompt_version = PROMPT_VERSIONS[kind]
+    key = cache_key(kind, prompt_version, model, text)
+
+    row = LLMResult.objects.filter(key=key).values_list('result', flat=True).first()
+    if row is not None:
+        try:
+            result = schema.model_validate(row)
+        except ValidationError:
+            result = None
+        if result is not None:
+            LLMResult.objects.filter(key=key).update(hits=F('hits') + 1, last_used_at=timezone.now())
+            count_cache('llm', hit=True)
+            return result
+
+    count_cache('llm', hit=False)
+    with stage('llm'):
+        result = compute()
+    now = timezone.now()
+    LLMResult.objects.bulk_create(
+        [LLMResult(
+            key=key, kind=kind, prompt_version=prompt_version, model=model,
+            result=result.model_dump(mode='json'), last_used_at=now,
+        )],
+        update_conflicts=True,
+        unique_fields=['key'],
+        update_fields=['result', 'last_used_at'],
+    )
+    _maybe_prune()
+    return result
+
+
+def memoized_many(kind, model, texts, schema, compute_many):
+    """
+    memoized() for several texts at once.
+
+    The cached results are read with one query, and the texts that miss are passed to a
+    single compute_many(missing_texts) call, which returns one result per text: a schema
+    instance, or the exception identifying that text raised. Exceptions are returned in
+    place and not cached.
+    """
+    from ..models import LLMResult
+
+    if not getattr(settings, 'LLM_CACHE_ENABLED', True):
+        with stage('llm'):
+            return compute_many(list(texts))
+
+    prompt_version = PROMPT_VERSIONS[kind]
+    keys = [cache_key(kind, prompt_version, model, text) for text in texts]
+    rows = dict(LLMResult.objects.filter(key__in=set(keys)).values_list('key', 'result'))
+
+    results = [None] * len(texts)
+    hits = set()
+    missing = {}  # key -> indexes of the texts sharing it
+    for index, key in enumerate(keys):
+        row = rows.get(key)
+        if row is not None:
+            try:
+                results[index] = schema.model_validate(row)
+                hits.add(key)
+                continue
+            except ValidationError:
+                pass
+        missing.setdefault(key, []).append(index)
+
+    if hits:
+        LLMResult.objects.filter(key__in=hits).update(hits=F('hits') + 1, last_used_at=timezone.now())
+    missed = sum(len(indexes) for indexes in missing.values())
+    count_cache('llm', hit=True, count=len(texts) - missed)
+    count_cache('llm', hit=False, count=missed)
+    if not missing:
+        return results
+
+    with stage('llm'):
+        computed = compute_many([texts[indexes[0]] for indexes in missing.values()])
+    now = timezone.now()
+    new_rows = []
+    for (key, indexes), result in zip(missing.items(), computed):
+        for index in indexes:
+            results[index] = result
+        if not isinstance(result, Exception):
+            new_rows.append(LLMResult(
+                key=key, kind=kind, prompt_version=prompt_version, model=model,
+                result=result.model_dump(mode='json'), last_used_at=now,
+            ))
+    if new_rows:
+        LLMResult.objects.bulk_create(
+            new_rows,
+            update_conflicts=True,
+            unique_fields=['key'],
+            update_fields=['result', 'last_used_at'],
+        )
+        _maybe_prune(len(new_rows))
+    return results
+
+
+def _maybe_prune(count=1):
+    global _writes
+    every = getattr(settings, 'LLM_CACHE_PRUNE_EVERY', 500)
+    if not every:
+        return
+    with _writes_lock:
+        due = (_writes + count) // every > _writes // every
+        _writes += count
+    if due:
+        transaction.on_commit(_prune_in_background)
+
+
+def _prune_in_background():
+    global _pruning
+    with _writes_lock:
+        if _pruning:
+            return
+        _pruning = True
+    threading.Thread(target=_run_prune, name='llm-cache-prune', daemon=True).start()
+
+
+def _run_prune():
+    global _pruning
+    try:
+        prune()
+    except Exception:
+        logger.exception("Pruning the LLM cache failed")
+    finally:
+        close_old_connections()
+        with _writes_lock:
+            _pruning = False
+
+
+def prune():
+    """Evict stale prompt versions, old entries and the overflow past the size limit."""
+    from ..models import LLMResult
+
+    deleted = 0
+    for kind, version in PROMPT_VERSIONS.items():
+        deleted += LLMResult.objects.filter(kind=kind).exclude(prompt_version=version).delete()[0]
+
+    max_age = timedelta(days=getattr(settings, 'LLM_CACHE_MAX_AGE_DAYS', 90))
+    deleted += LLMResult.objects.filter(last_used_at__lt=timezone.now() - max_age).delete()[0]
+
+    max_entries = getattr(settings, 'LLM_CACHE_MAX_ENTRIES', 50000)
+    cutoff = LLMResult.objects.order_by('-last_used_at').values_list('last_used_at', flat=True)[max_entries:max_entries + 1].first()
+    if cutoff is not None:
+        deleted += LLMResult.objects.filter(last_used_at__lte=cutoff).delete()[0]
+    return deleted
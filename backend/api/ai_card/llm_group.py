@@ -0,0 +1,76 @@
+"""
+Grouped LLM identification for bulk scans.
+
+Instead of one chat completion per card, several cards' OCR texts go into one prompt and
+the model answers with one object per text, in order. If a grouped answer doesn't line
+up with the texts it was asked about, each text of that group is asked on its own.
+"""
+import json
+import logging
+
+from django.conf import settings
+from pydantic import ValidationError
+
+logger = logging.getLogger(__name__)
+
+
+GROUP_INSTRUCTIONS = (
+    "\nYou will be given the extracted text of several cards, numbered from 1. Respond with a JSON "
+    "object of the form {\"cards\": [...]} holding one object in the schema above per card, in the same order."
+)
+
+
+def group_size():
+    return max(1, getattr(settings, 'LLM_GROUP_SIZE', 8))
+
+
+def ask_group(client, model, system_prompt, user_prompt, texts, schema):
+    """Identify several texts with one chat completion. Raises ValueError if the answer doesn't match them."""
+    chat_completion = client.chat.completions.create(
+        messages=[
+            {
+                "role": "system",
+                "content": system_prompt + GROUP_INSTRUCTIONS,
+            },
+            {
+                "role": "user",
+                "content": "\n\n".join(
+                    f"Card {number}: {user_prompt.format(card_text=text)}" for number, text in enumerate(texts, 1)
+                ),
+            },
+        ],
+        model=model,
+        temperature=0.5,
+        stream=False,
+        response_format={"type": "json_object"},
+    )
+    try:
+        cards = json.loads(chat_completion.choices[0].message.content)["cards"]
+        if len(cards) != len(texts):
+            raise ValueError(f"got {len(cards)} answers")
+        return [schema.model_validate(card) for card in cards]
+    except (KeyError, TypeError, ValueError, ValidationError) as e:
+        raise ValueError(f"Grouped answer doesn't match the {len(texts)} cards asked: {e}") from e
+
+
+def ask_many(texts, ask_group_fn, ask_one):
+    """
+    Identify texts in groups of settings.LLM_GROUP_SIZE. Returns one result per text: the
+    schema instance, or the exception raised identifying it.
+    """
+    results = []
+    size = group_size()
+    for start in range(0, len(texts), size):
+        group = texts[start:start + size]
+        if len(group) > 1:
+            try:
+                results.extend(ask_group_fn(group))
+                continue
+            except Exception as e:
+                logger.warning("Grouped prompt failed, asking one card at a time: %s", e)
+        for text in group:
+            try:
+                results.append(ask_one(text))
+            except Exception as e:
+                results.append(e)
+    return results
@@ -1,14 +1,20 @@
 import json
+import logging
 import os
 from typing import List, Optional
 from dotenv import load_dotenv
 from pydantic import BaseModel
 from groq import Groq
+from .llm_cache import memoized, memoized_many, register_prompt
+from .llm_group import ask_group, ask_many
+from ..log import log_payload
 
 load_dotenv()
 
 groq = Groq(api_key=os.environ.get("GROQ_API_KEY"))
 
+logger = logging.getLogger(__name__)
+
 
 # Card model for generating card info
 class Card(BaseModel):
@@ -23,25 +29,46 @@ class Card(BaseModel):
     grade_company: Optional[str] = None
 
 
+MODEL = "llama-3.3-70b-specdec"
+
+CARD_SYSTEM_PROMPT = (
+    "You are a productivity assistant that uses extracted trading card text to determine what the card is.\n"
+    f"The JSON object must use the schema: {json.dumps(Card.model_json_schema(), indent=2)}"
+)
+CARD_USER_PROMPT = "Using the extracted text. What is this trading card? Numeration looks like '10/25' for example. : '{card_text}'"
+register_prompt("card", CARD_SYSTEM_PROMPT, CARD_USER_PROMPT)
+
+
 def create_card(card_text: str):
-    print("Card text: " + card_text)
+    log_payload(logger, "Card text: %s", card_text)
+    return memoized("card", MODEL, card_text, Card, lambda: _ask_card(card_text))
+
+
+def create_cards(card_texts):
+    """create_card for several texts, asked in grouped prompts. Failed texts get their exception."""
+    return memoized_many("card", MODEL, card_texts, Card, lambda texts: ask_many(texts, _ask_card_group, _ask_card))
+
+
+def _ask_card_group(card_texts):
+    return ask_group(groq, MODEL, CARD_SYSTEM_PROMPT, CARD_USER_PROMPT, card_texts, Card)
+
+
+def _ask_card(card_text: str):
     chat_completion = groq.chat.completions.create(
         messages=[
             {
                 "role": "system",
-                "content": "You are a productivity assistant that uses extracted trading card text to determine what the card is.\n"
-                f"The JSON object must use the schema: {json.dumps(Card.model_json_schema(), indent=2)}",
+                "content": CARD_SYSTEM_PROMPT,
             },
             {
                 "role": "user",
-                "content": f"Using the extracted text. What is this trading card? Numeration looks like '10/25' for example. : '{card_text}'",
+                "content": CARD_USER_PROMPT.format(card_text=card_text),
             },
         ],
-        model="llama-3.3-70b-specdec",
+        model=MODEL,
         temperature=0.5,
         stream=False,
         response_format={"type": "json_object"},
     )
-    print(chat_completion.choices[0].message.content)
+    log_payload(logger, "LLM answer: %s", chat_completion.choices[0].message.content)
     return Card.model_validate_json(chat_completion.choices[0].message.content)
-
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # Registers the signal receivers that keep collection totals up to date
+        from . import collection_value  # noqa: F401
+        # Registers the receivers that drop changed users from the authentication cache
+        from . import authentication  # noqa: F401
+        # Recovers queued and stale scan jobs on the first request after a restart
+        from . import jobs  # noqa: F401
@@ -0,0 +1,116 @@
+"""
+Async version of the scan pipeline, used by the ASGI upload view.
+
+Upstream lookups go through async_http on the event loop. Blocking steps (the ORM, OCR
+and LLM clients) run in worker threads, and image work stays on the image pool. Slow
+steps that also query the database run through in_db_thread, which closes the worker
+thread's connection afterwards. A Pokémon lookup already returns the card's price, which
+is cached with the card. Other cards are priced in the background once they are
+identified, so the next /card_price/ request is a cache hit.
+"""
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from rest_framework import status
+
+from .metrics import stage
+from .serializers import CardSerializer
+from .pipeline import (
+    cache_match_price, clean_pokemon_number, confident_match, create_generic_card, create_magic_card,
+    create_pokemon_card, manual_payload, prepare_card_image, reuse_previous_scan, store_extracted_text,
+)
+from .price_cache import PRICE_FETCH_ERRORS, aget_card_price
+from .ai_card.card_to_text import extract_text_from_bytes
+from .ai_card.text_to_card import create_card
+from .card_types.magic import ai_name_year_magic, amagic_name_and_year
+from .card_types.pokemon import PokemonAPIError, ai_name_set_number_pokemon, alookup_pokemon_card
+
+logger = logging.getLogger(__name__)
+
+
+def in_thread(fn):
+    """Run a blocking call that doesn't touch the database (OCR, image work) in the thread pool."""
+    return sync_to_async(fn, thread_sensitive=False)
+
+
+def in_db_thread(fn):
+    """
+    in_thread for a slow call that also uses the ORM outside a transaction (LLM calls read and
+    write LLMResult, prepare_card_image saves the image). The pool thread's connection is
+    closed before and after, as a request's is, since request_started and request_finished
+    never run on that thread.
+    """
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return in_thread(run)
+
+
+# Background price prefetches, kept referenced until they finish
+_prefetches = set()
+
+
+async def _prefetch(card):
+    try:
+        await aget_card_price(card.card_company, card.name, card.number, card.set)
+    except PRICE_FETCH_ERRORS:
+        # Already logged; the price is fetched again when it's asked for
+        pass
+
+
+def prefetch_price(card):
+    """Warm the price cache for card without making the response wait for it."""
+    task = asyncio.create_task(_prefetch(card))
+    _prefetches.add(task)
+    task.add_done_callback(_prefetches.discard)
+
+
+async def ascan_card_image(card_image, owner, images=None, combined=None):
+    """Async scan_card_image. Returns (payload, http_status)."""
+    reused = await sync_to_async(reuse_previous_scan)(card_image, owner, images, combined)
+    if reused is not None:
+        return reused
+
+    combined_bytes = await in_db_thread(prepare_card_image)(card_image, images, combined)
+    with stage('ocr'):
+        extracted_text = await in_thread(extract_text_from_bytes)(combined_bytes)
+    await sync_to_async(store_extracted_text)(card_image, extracted_text)
+    return await aidentify_card(extracted_text, card_image, owner)
+
+
+async def aidentify_card(extracted_text, card_image, owner):
+    """Async identify_card."""
+    if "MAGIC" in extracted_text:
+        magic_card = await in_db_thread(ai_name_year_magic)(extracted_text)
+        with stage('lookup'):
+            magic_info = await amagic_name_and_year(magic_card.name, magic_card.year)
+        if not magic_info:
+            return manual_payload(magic_card.name, magic_card.year, 'Magic the Gathering', card_image)
+        card = await sync_to_async(create_magic_card)(owner, card_image, magic_info)
+        prefetch_price(card)
+    elif "Pokémon" in extracted_text:
+        pokemon_card = await in_db_thread(ai_name_set_number_pokemon)(extracted_text)
+        set_number = clean_pokemon_number(pokemon_card.set_number)
+
+        try:
+            with stage('lookup'):
+                match = await alookup_pokemon_card(pokemon_card.name, set_number)
+        except PokemonAPIError as e:
+            logger.warning("PokémonTCG lookup failed: %s", e)
+            match = None
+        if not confident_match(match):
+            return manual_payload(pokemon_card.name, set_number, 'Pokémon', card_image)
+        card = await sync_to_async(create_pokemon_card)(owner, card_image, match.card, set_number)
+        await sync_to_async(cache_match_price)(card, match)
+    else:
+        card_data = await in_db_thread(create_card)(extracted_text)
+        card = await sync_to_async(create_generic_card)(owner, card_image, card_data)
+        prefetch_price(card)
+
+    payload = await sync_to_async(lambda: CardSerializer(card).data)()
+    return payload, status.HTTP_201_CREATED
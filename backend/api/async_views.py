@@ -0,0 +1,103 @@
+"""
+Native async views for the ASGI stack (backend/asgi.py).
+
+DRF's APIView can only be synchronous, so these are plain async Django views that mirror
+CardImageUploadView and RetrieveCardPrice: same JWT authentication, request fields and
+responses. Upstream calls use the async HTTP client, so a request waiting on Scryfall,
+PokémonTCG or ScraperAPI no longer holds a worker thread.
+"""
+import logging
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+
+from .authentication import CachedJWTAuthentication
+from .models import Card
+from .serializers import CardImageSerializer
+from .views import read_uploaded_images, scan_in_background, store_upload
+from .async_pipeline import ascan_card_image, in_thread
+from .image_work import ImageWorkBusy, run_image_task, scan_image_limits
+from .jobs import enqueue_scan
+from .price_cache import PRICE_FETCH_ERRORS, acard_price, with_cached_price
+from .ai_card.image_tasks import upload_task
+
+logger = logging.getLogger(__name__)
+
+
+def json_response(data, status=status.HTTP_200_OK, **kwargs):
+    return JsonResponse(data, status=status, encoder=DjangoJSONEncoder, safe=False, **kwargs)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncAPIView(View):
+    """Authenticates the JWT bearer token like the DRF views, then calls the async handler."""
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            result = await CachedJWTAuthentication().aauthenticate(request)
+        except AuthenticationFailed as e:
+            return json_response({'detail': str(e.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+        if result is None:
+            return json_response(
+                {'detail': 'Authentication credentials were not provided.'}, status=status.HTTP_401_UNAUTHORIZED
+            )
+        request.user = result[0]
+        return await super().dispatch(request, *args, **kwargs)
+
+
+def _validate_upload(request):
+    # Parsing the multipart body and validating the images with Pillow is blocking work
+    data = request.POST.copy()
+    data.update(request.FILES)
+    serializer = CardImageSerializer(data=data)
+    if not serializer.is_valid():
+        return serializer, None
+    return serializer, read_uploaded_images(request.FILES)
+
+
+class AsyncCardImageUploadView(AsyncAPIView):
+    async def post(self, request):
+        serializer, images = await sync_to_async(_validate_upload)(request)
+        if images is None:
+            logger.info("Upload rejected: %s", serializer.errors)
+            return json_response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        run_async = scan_in_background(request.GET.get('async', request.POST.get('async')))
+        try:
+            prepared = await in_thread(run_image_task)(upload_task, *images, not run_async, *scan_image_limits())
+        except ImageWorkBusy as e:
+            return json_response(
+                {'detail': str(e.detail)}, status=e.status_code, headers={'Retry-After': str(e.wait)}
+            )
+
+        card_image = await sync_to_async(store_upload)(serializer, images, prepared)
+
+        if run_async:
+            job = await sync_to_async(enqueue_scan)(card_image, request.user)
+            return json_response({
+                'job_id': str(job.id),
+                'status': job.status,
+                'image_id': card_image.id
+            }, status=status.HTTP_202_ACCEPTED)
+
+        payload, http_status = await ascan_card_image(card_image, request.user, images, prepared['combined'])
+        return json_response(payload, status=http_status)
+
+
+class AsyncCardPriceView(AsyncAPIView):
+    async def get(self, request, pk):
+        card = await with_cached_price(Card.objects.filter(pk=pk)).afirst()
+        if card is None:
+            return json_response({'detail': 'No Card matches the given query.'}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            price = await acard_price(card)
+        except PRICE_FETCH_ERRORS as e:
+            return json_response({"price": None, "detail": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
+        return json_response({"price": price})
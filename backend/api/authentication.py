@@ -0,0 +1,154 @@
+"""
+JWT authentication without a user query on every request.
+
+simplejwt's JWTAuthentication verifies the access token's signature and expiry, then loads
+the User named by its user_id claim: one query per authenticated request. CachedJWTAuthentication
+verifies the token the same way and trusts its claims, but keeps the users it has loaded in a
+per-process cache for settings.AUTH_USER_CACHE_TTL seconds. Every request gets its own User
+built from the cached field values, so a view changing request.user doesn't touch the cache.
+
+A user's entry is dropped when they are saved or deleted and when one of their refresh tokens
+is blacklisted, so deactivating them or changing their password applies from the next request
+in this process. Other processes see the change once their entry expires.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .metrics import count_cache
+
+
+class UserCache:
+    """Thread-safe LRU of user id -> (expires_at, database, field values), with entries expiring after ttl seconds."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by every discard, so a user loaded before it isn't cached after it
+        self._generation = 0
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._data.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._data[user_id]
+                return None
+            self._data.move_to_end(user_id)
+        expires_at, db, values = entry
+        return User.from_db(db, _FIELD_NAMES, values)
+
+    def set(self, user, generation):
+        """Cache user, unless a discard happened since generation was read (the user may be stale)."""
+        values = tuple(getattr(user, name) for name in _FIELD_NAMES)
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._data[user.pk] = (time.monotonic() + self.ttl, user._state.db, values)
+            self._data.move_to_end(user.pk)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def discard(self, user_id):
+        with self._lock:
+            self._generation += 1
+            self._data.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+
+_FIELD_NAMES = [field.attname for field in User._meta.concrete_fields]
+_users = UserCache(getattr(settings, 'AUTH_USER_CACHE_SIZE', 10000), getattr(settings, 'AUTH_USER_CACHE_TTL', 60))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that loads the token's user from the process's user cache when it can."""
+
+    def get_user(self, validated_token):
+        user = self.get_cached_user(validated_token)
+        if user is None:
+            user = self._load_user(validated_token)
+        return user
+
+    def get_cached_user(self, validated_token):
+        """The token's user from the cache, checked like get_user does, or None if it isn't cached."""
+        if api_settings.USER_ID_FIELD != 'id':
+            return None
+        user = _users.get(self._user_id(validated_token))
+        count_cache('auth_user', hit=user is not None)
+        if user is None:
+            return None
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
+
+    async def aauthenticate(self, request):
+        """authenticate() for async views: only a cache miss goes to a thread for the query."""
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+
+        user = self.get_cached_user(validated_token)
+        if user is None:
+            user = await sync_to_async(self._load_user)(validated_token)
+        return user, validated_token
+
+    def _load_user(self, validated_token):
+        generation = _users.generation
+        user = super().get_user(validated_token)
+        if api_settings.USER_ID_FIELD == 'id':
+            _users.set(user, generation)
+        return user
+
+    def _user_id(self, validated_token):
+        try:
+            return int(validated_token[api_settings.USER_ID_CLAIM])
+        except (KeyError, TypeError, ValueError) as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+
+def forget_user(user_id):
+    """Drop a user from this process's cache, e.g. after changing them with a queryset update()."""
+    _users.discard(user_id)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def _forget_changed_user(sender, instance, **kwargs):
+    forget_user(instance.pk)
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def _forget_blacklisted_user(sender, instance, **kwargs):
+    if instance.token.user_id is not None:
+        forget_user(instance.token.user_id)
@@ -0,0 +1,244 @@
+"""
+Bulk scans: many cards' front/back pairs in one request.
+
+A shop scanning a box of cards sends them in one multipart POST, either with
+card_front_image and card_back_image repeated (paired in order) or as a zip archive of
+<name>_front.jpg and <name>_back.jpg files. Request files are streamed to temporary files
+and zip members are read one pair at a time, so the body is never held in memory.
+
+Small batches are scanned in the request, BULK_SCAN_CHUNK_SIZE pairs at a time, with
+pipeline.scan_card_images(): one OCR call per chunk, grouped LLM prompts and one
+bulk insert. Larger ones (or ?async=1) are stored and queued as a ScanBatch, one ScanJob
+per pair, which the scan workers run through the same batch pipeline.
+"""
+import mimetypes
+import os
+import re
+import zipfile
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+from rest_framework import status
+
+from .models import ScanBatch, ScanJob
+from .serializers import CardImageSerializer
+from .image_work import run_image_task, scan_image_limits
+from .ai_card.image_tasks import upload_task
+
+
+# "<name>_front.jpg", "<name>-back.png", "<name> front.jpeg" ...
+SIDE_PATTERN = re.compile(r"^(?P<name>.*?)[ _-]?(?P<side>front|back)$", re.IGNORECASE)
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.heic')
+
+
+class BulkUploadError(Exception):
+    """The request isn't a usable bulk upload; the message is returned to the client."""
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class BulkItem:
+    """One front/back pair of a bulk upload. Zip members are only read when the pair is stored."""
+
+    def __init__(self, index, name, open_front, open_back):
+        self.index = index
+        self.name = name
+        self._open_front = open_front
+        self._open_back = open_back
+
+    def files(self):
+        return self._open_front(), self._open_back()
+
+
+def bulk_items(files):
+    """The pairs of a bulk upload's files, in order. Raises BulkUploadError if they don't pair up."""
+    archive = files.get('archive')
+    if archive is not None:
+        items = zip_items(archive)
+    else:
+        fronts = files.getlist('card_front_image')
+        backs = files.getlist('card_back_image')
+        if len(fronts) != len(backs):
+            raise BulkUploadError(f"Got {len(fronts)} front images but {len(backs)} back images.")
+        items = [
+            BulkItem(index, front.name, lambda front=front: front, lambda back=back: back)
+            for index, (front, back) in enumerate(zip(fronts, backs))
+        ]
+
+    if not items:
+        raise BulkUploadError("No card images were uploaded.")
+    max_items = _setting('BULK_SCAN_MAX_ITEMS', 500)
+    if len(items) > max_items:
+        raise BulkUploadError(f"At most {max_items} cards can be uploaded per request.")
+    return items
+
+
+def zip_items(archive):
+    """Pair the <name>_front / <name>_back images of a zip archive, sorted by name."""
+    try:
+        zip_file = zipfile.ZipFile(archive)
+    except zipfile.BadZipFile:
+        raise BulkUploadError("archive is not a valid zip file.")
+
+    max_bytes = _setting('BULK_SCAN_MAX_IMAGE_BYTES', 25 * 1024 * 1024)
+    pairs = {}
+    for member in zip_file.infolist():
+        path = member.filename
+        stem, extension = os.path.splitext(os.path.basename(path))
+        if member.is_dir() or path.startswith('__MACOSX/') or extension.lower() not in IMAGE_EXTENSIONS:
+            continue
+        match = SIDE_PATTERN.match(stem)
+        if match is None:
+            raise BulkUploadError(f"{path} is not named <name>_front or <name>_back.")
+        if member.file_size > max_bytes:
+            raise BulkUploadError(f"{path} is larger than {max_bytes} bytes.")
+        name = os.path.join(os.path.dirname(path), match.group('name'))
+        pairs.setdefault(name, {})[match.group('side').lower()] = member
+
+    items = []
+    for index, name in enumerate(sorted(pairs)):
+        sides = pairs[name]
+        if set(sides) != {'front', 'back'}:
+            raise BulkUploadError(f"{name} needs both a front and a back image.")
+        items.append(BulkItem(
+            index, name,
+            lambda member=sides['front']: _zip_file(zip_file, member),
+            lambda member=sides['back']: _zip_file(zip_file, member),
+        ))
+    return items
+
+
+def _zip_file(zip_file, member):
+    name = os.path.basename(member.filename)
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    return SimpleUploadedFile(name, zip_file.read(member), content_type=content_type)
+
+
+def store_item(item, combine):
+    """
+    Validate and store one pair. Returns (card_image, images, prepared), or
+    (None, None, errors) if the images are invalid.
+    """
+    from .views import read_uploaded_images, store_upload
+
+    front, back = item.files()
+    serializer = CardImageSerializer(data={'card_front_image': front, 'card_back_image': back})
+    if not serializer.is_valid():
+        return None, None, serializer.errors
+
+    images = read_uploaded_images({'card_front_image': front, 'card_back_image': back})
+    # Wait for the image pool rather than refusing half of a batch with a 503
+    prepared = run_image_task(upload_task, *images, combine, *scan_image_limits(), block=True)
+    return store_upload(serializer, images, prepared), images, prepared
+
+
+def use_background_scan(items, requested):
+    """Scan in the background when the client asks for it or the batch is too big to wait for."""
+    return requested or len(items) > _setting('BULK_SCAN_SYNC_MAX_ITEMS', 16)
+
+
+def scan_items(items, owner):
+    """Store and scan the pairs in the request, a chunk at a time. Returns the per-item results."""
+    from .pipeline import scan_card_images
+
+    chunk_size = _setting('BULK_SCAN_CHUNK_SIZE', 16)
+    results = []
+    for start in range(0, len(items), chunk_size):
+        stored = []
+        for item in items[start:start + chunk_size]:
+            try:
+                card_image, images, prepared = store_item(item, combine=True)
+            except Exception as e:
+                results.append(item_result(item.index, item.name, None, e))
+                continue
+            if card_image is None:
+                results.append(rejected_item(item, prepared))
+                continue
+            stored.append((item, card_image, images, prepared['combined']))
+
+        if not stored:
+            continue
+        outcomes = scan_card_images(
+            [card_image for _, card_image, _, _ in stored],
+            owner,
+            images=[images for _, _, images, _ in stored],
+            combined=[combined for _, _, _, combined in stored],
+        )
+        for (item, card_image, _, _), outcome in zip(stored, outcomes):
+            results.append(item_result(item.index, item.name, card_image.id, outcome))
+
+    results.sort(key=lambda result: result['index'])
+    return results
+
+
+def queue_items(items, owner):
+    """Store the pairs and queue one ScanJob per pair under a new ScanBatch."""
+    from .jobs import wake_workers
+
+    batch = ScanBatch.objects.create(owner=owner)
+    jobs = []
+    for item in items:
+        try:
+            card_image, _, errors = store_item(item, combine=False)
+        except Exception as e:
+            batch.rejected.append({'index': item.index, 'name': item.name, 'errors': str(e)})
+            continue
+        if card_image is None:
+            batch.rejected.append({'index': item.index, 'name': item.name, 'errors': errors})
+            continue
+        jobs.append(ScanJob(
+            owner=owner, card_image=card_image, batch=batch, batch_index=item.index, batch_name=item.name,
+        ))
+
+    ScanJob.objects.bulk_create(jobs)
+    batch.total = len(jobs)
+    batch.save(update_fields=['total', 'rejected'])
+    transaction.on_commit(wake_workers)
+    return batch
+
+
+def rejected_item(item, errors):
+    return {'index': item.index, 'name': item.name, 'status': 'invalid', 'errors': errors}
+
+
+def item_result(index, name, image_id, outcome):
+    """One entry of a bulk scan's results, from a (payload, http_status) pair or an exception."""
+    result = {'index': index, 'name': name, 'image_id': image_id}
+    if isinstance(outcome, Exception):
+        result.update(status='failed', error=str(outcome))
+    else:
+        payload, http_status = outcome
+        result.update(status='created' if http_status == status.HTTP_201_CREATED else 'manual', result=payload)
+    return result
+
+
+def batch_status(batch):
+    """The progress and per-item results of a queued bulk scan."""
+    counts = {state: 0 for state, _ in ScanJob.STATUS_CHOICES}
+    results = []
+    for job in batch.jobs.order_by('batch_index'):
+        counts[job.status] += 1
+        if job.status == ScanJob.DONE:
+            results.append(item_result(job.batch_index, job.batch_name, job.card_image_id, (job.result, job.result_status)))
+        elif job.status == ScanJob.FAILED:
+            results.append(item_result(job.batch_index, job.batch_name, job.card_image_id, Exception(job.error)))
+        else:
+            results.append({
+                'index': job.batch_index, 'name': job.batch_name, 'image_id': job.card_image_id,
+                'status': job.status, 'job_id': str(job.id),
+            })
+    for rejected in batch.rejected:
+        results.append({**rejected, 'status': 'invalid', 'image_id': None})
+    results.sort(key=lambda result: result['index'])
+
+    finished = counts[ScanJob.DONE] + counts[ScanJob.FAILED]
+    return {
+        'batch_id': str(batch.id),
+        'status': 'done' if finished == batch.total else 'running',
+        'total': batch.total,
+        'counts': counts,
+        'results': results,
+    }
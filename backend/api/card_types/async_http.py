@@ -0,0 +1,110 @@
+"""
+Async counterpart of http_client for the ASGI views.
+
+One httpx.AsyncClient per event loop keeps connections to every upstream open across
+requests. Each host gets the same timeouts, retry policy and concurrency cap as in
+http_client.HOST_CONFIG, and requests are counted in the same per-host metrics.
+"""
+import asyncio
+import time
+import weakref
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import httpx
+
+from . import http_client
+from .http_client import RETRY_STATUSES, HostBusy
+
+
+# What get() raises when an upstream can't be reached
+ERRORS = (httpx.HTTPError, HostBusy)
+
+
+class AsyncHostLimits:
+    def __init__(self, config):
+        self.config = config
+        connect, read = config['timeout']
+        self.timeout = httpx.Timeout(read, connect=connect)
+        self.slots = asyncio.Semaphore(config['max_concurrency'])
+
+
+class LoopClient:
+    """The AsyncClient and per-host limits for one event loop."""
+
+    def __init__(self):
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=50),
+            follow_redirects=True,
+        )
+        self.hosts = {}
+
+    def limits_for(self, host):
+        limits = self.hosts.get(host)
+        if limits is None:
+            config = {**http_client.DEFAULT_CONFIG, **http_client.HOST_CONFIG.get(host, {})}
+            limits = self.hosts[host] = AsyncHostLimits(config)
+        return limits
+
+
+_loop_clients = weakref.WeakKeyDictionary()
+
+
+def _loop_client():
+    loop = asyncio.get_running_loop()
+    loop_client = _loop_clients.get(loop)
+    if loop_client is None:
+        loop_client = _loop_clients[loop] = LoopClient()
+    return loop_client
+
+
+def _retry_delay(response, attempt, backoff_factor, max_wait):
+    """Seconds to wait before retrying: the upstream's Retry-After if it sent one, else backoff, at most max_wait."""
+    delay = backoff_factor * (2 ** attempt)
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after:
+        try:
+            delay = max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                delay = max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    return min(delay, max_wait)
+
+
+async def get(url, **kwargs):
+    """Async GET through the shared client, with the host's timeout, retries and concurrency cap."""
+    host = urlsplit(url).netloc
+    loop_client = _loop_client()
+    limits = loop_client.limits_for(host)
+    config = limits.config
+    stats_client = http_client.client_for(url)
+    kwargs.setdefault('timeout', limits.timeout)
+
+    try:
+        await asyncio.wait_for(limits.slots.acquire(), config['queue_timeout'])
+    except asyncio.TimeoutError:
+        stats_client._record(0.0, None, failed=True)
+        raise HostBusy(f"Too many concurrent requests to {host}")
+
+    start = time.perf_counter()
+    response = None
+    try:
+        for attempt in range(config['retries'] + 1):
+            try:
+                response = await loop_client.client.get(url, **kwargs)
+            except httpx.TransportError:
+                response = None
+                if attempt == config['retries']:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == config['retries']:
+                    return response
+            await asyncio.sleep(_retry_delay(response, attempt, config['backoff_factor'], config['max_retry_wait']))
+        return response
+    finally:
+        limits.slots.release()
+        status_code = response.status_code if response is not None else None
+        failed = response is None or status_code in RETRY_STATUSES
+        stats_client._record(time.perf_counter() - start, status_code, failed)
@@ -0,0 +1,170 @@
+"""
+Shared HTTP client for outbound lookups (Scryfall, PokémonTCG, ScraperAPI, Nominatim).
+
+Each upstream host gets one pooled requests.Session so connections (and TLS sessions)
+are reused across requests, plus its own timeouts, retry policy and concurrency cap.
+Latency and failure counts are kept per host and can be read with metrics().
+"""
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+DEFAULT_CONFIG = {
+    'timeout': (3.05, 15),     # (connect, read) seconds
+    'retries': 2,              # retries on connection errors and 429/5xx
+    'backoff_factor': 0.5,     # 0.5s, 1s, 2s, ... between retries
+    'max_retry_wait': 10,      # longest wait before a retry, whatever Retry-After asks for
+    'max_concurrency': 10,     # requests in flight to this host per process
+    'queue_timeout': 30,       # seconds to wait for a free slot before giving up
+}
+
+HOST_CONFIG = {
+    # Scryfall asks clients to stay under 10 requests per second
+    'api.scryfall.com': {'timeout': (3.05, 10), 'max_concurrency': 8},
+    'api.pokemontcg.io': {'timeout': (3.05, 20), 'max_concurrency': 10},
+    # ScraperAPI renders eBay pages and can legitimately take up to a minute
+    'api.scraperapi.com': {'timeout': (5, 70), 'retries': 1, 'max_concurrency': 5},
+    # OpenStreetMap's Nominatim allows one request at a time (and at most one a second)
+    'nominatim.openstreetmap.org': {'timeout': (3.05, 10), 'max_concurrency': 1},
+}
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class HostBusy(requests.exceptions.RequestException):
+    """Raised when no request slot for a host frees up within its queue_timeout."""
+
+
+class CappedRetry(Retry):
+    """Retry that waits at most max_retry_wait seconds, even when Retry-After asks for longer."""
+
+    def __init__(self, *args, max_retry_wait=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_retry_wait = max_retry_wait
+
+    def new(self, **kwargs):
+        retry = super().new(**kwargs)
+        retry.max_retry_wait = self.max_retry_wait
+        return retry
+
+    def get_retry_after(self, response):
+        seconds = super().get_retry_after(response)
+        if seconds is None or self.max_retry_wait is None:
+            return seconds
+        return min(seconds, self.max_retry_wait)
+
+
+class HostStats:
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.status_counts = {}
+
+    def snapshot(self):
+        return {
+            'requests': self.requests,
+            'failures': self.failures,
+            'avg_seconds': self.total_seconds / self.requests if self.requests else 0.0,
+            'max_seconds': self.max_seconds,
+            'status_counts': dict(self.status_counts),
+        }
+
+
+class HostClient:
+    def __init__(self, host, config):
+        self.host = host
+        self.config = config
+        self.session = requests.Session()
+        retry = CappedRetry(
+            total=config['retries'],
+            backoff_factor=config['backoff_factor'],
+            backoff_max=config['max_retry_wait'],
+            max_retry_wait=config['max_retry_wait'],
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=config['max_concurrency'],
+            max_retries=retry,
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.slots = threading.BoundedSemaphore(config['max_concurrency'])
+        self.stats = HostStats()
+        self.stats_lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.config['timeout'])
+        if not self.slots.acquire(timeout=self.config['queue_timeout']):
+            self._record(0.0, None, failed=True)
+            raise HostBusy(f"Too many concurrent requests to {self.host}")
+
+        start = time.perf_counter()
+        response = None
+        try:
+            response = self.session.request(method, url, **kwargs)
+            return response
+        finally:
+            self.slots.release()
+            status_code = response.status_code if response is not None else None
+            failed = response is None or status_code in RETRY_STATUSES
+            self._record(time.perf_counter() - start, status_code, failed)
+
+    def _record(self, seconds, status_code, failed):
+        with self.stats_lock:
+            stats = self.stats
+            stats.requests += 1
+            stats.failures += int(failed)
+            stats.total_seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            label = str(status_code) if status_code is not None else 'error'
+            stats.status_counts[label] = stats.status_counts.get(label, 0) + 1
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def configure_host(host, **config):
+    """Override the settings for a host. Takes effect for clients created afterwards."""
+    HOST_CONFIG[host] = {**HOST_CONFIG.get(host, {}), **config}
+    with _clients_lock:
+        _clients.pop(host, None)
+
+
+def client_for(url):
+    host = urlsplit(url).netloc
+    client = _clients.get(host)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(host)
+            if client is None:
+                client = HostClient(host, {**DEFAULT_CONFIG, **HOST_CONFIG.get(host, {})})
+                _clients[host] = client
+    return client
+
+
+def get(url, **kwargs):
+    """requests.get through the shared, pooled client for the url's host."""
+    return client_for(url).request('GET', url, **kwargs)
+
+
+def metrics():
+    """Per-host request counts, failures and latency since the process started."""
+    with _clients_lock:
+        clients = list(_clients.values())
+    result = {}
+    for client in clients:
+        with client.stats_lock:
+            result[client.host] = client.stats.snapshot()
+    return result
@@ -1,50 +1,119 @@
 import requests
 import json
+import logging
 import os
 from typing import List, Optional
 from dotenv import load_dotenv
 from pydantic import BaseModel
 from groq import Groq
+from . import async_http, http_client
+from ..ai_card.llm_cache import memoized, memoized_many, register_prompt
+from ..ai_card.llm_group import ask_group, ask_many
+from ..log import log_payload
 
 
 load_dotenv()
 
 groq = Groq(api_key=os.environ.get("GROQ_API_KEY"))
 
+logger = logging.getLogger(__name__)
+
+SCRYFALL_API_URL = os.environ.get("SCRYFALL_API_URL", "https://api.scryfall.com")
+
 class MagicCard(BaseModel):
     name: str
     year: str
 
+def _catalog_lookup(card_name, year):
+    """Try the local catalog mirror. Returns (cards, done)."""
+    from ..catalog import find_magic_cards, use_live_api
+    cards = find_magic_cards(card_name, year)
+    return cards, cards is not None or not use_live_api()
+
+
+def _search_params(card_name, year):
+    return {'q': f'!"{card_name}" year:{year}'}
+
+
+def _cards_from_response(response, card_name, year):
+    # Scryfall answers a search with no results with a 404
+    if response.status_code not in (200, 404):
+        logger.warning("Scryfall lookup failed: %s", response.status_code)
+        return None
+    data = response.json() if response.status_code == 200 else {}
+    if not data.get('total_cards'):
+        logger.info("No Magic cards found for %r in %s", card_name, year)
+        return None
+    return data['data']
+
+
 def magic_name_and_year(card_name, year):
-    base_url = "https://api.scryfall.com/cards/search"
-    query = f'!"{card_name}" year:{year}'
-    params = {'q': query}
-    response = requests.get(base_url, params=params)
-    if response.status_code == 200:
-        data = response.json()
-        if data['total_cards'] > 0:
-            return data['data']
-        else:
-            return f"No cards found for '{card_name}' in {year}."
-    else:
-        return f"Error: {response.status_code}"
+    """Scryfall's printings of the card from that year (search response 'data' dicts), or None if there are none or the lookup failed."""
+    # Try the local catalog mirror before going to the API
+    cards, done = _catalog_lookup(card_name, year)
+    if done:
+        return cards
+
+    try:
+        response = http_client.get(f"{SCRYFALL_API_URL}/cards/search", params=_search_params(card_name, year))
+    except requests.RequestException as e:
+        logger.warning("Scryfall lookup failed: %s", e)
+        return None
+    return _cards_from_response(response, card_name, year)
+
+
+async def amagic_name_and_year(card_name, year):
+    """Async magic_name_and_year: the catalog query runs in a thread, the API call on the loop."""
+    from asgiref.sync import sync_to_async
+    cards, done = await sync_to_async(_catalog_lookup)(card_name, year)
+    if done:
+        return cards
+
+    try:
+        response = await async_http.get(f"{SCRYFALL_API_URL}/cards/search", params=_search_params(card_name, year))
+    except async_http.ERRORS as e:
+        logger.warning("Scryfall lookup failed: %s", e)
+        return None
+    return _cards_from_response(response, card_name, year)
+
+
+MODEL = "llama-3.3-70b-specdec"
+
+MAGIC_SYSTEM_PROMPT = (
+    "You are a productivity assistant that uses extracted trading card text to determine what the card is.\n"
+    f"The JSON object must use the schema: {json.dumps(MagicCard.model_json_schema(), indent=2)}"
+)
+MAGIC_USER_PROMPT = "Using the extracted text. What is this magic card? : '{card_text}'"
+register_prompt("magic", MAGIC_SYSTEM_PROMPT, MAGIC_USER_PROMPT)
 
 
 def ai_name_year_magic(card_text: str):
-    print("Card text: " + card_text)
+    log_payload(logger, "Card text: %s", card_text)
+    return memoized("magic", MODEL, card_text, MagicCard, lambda: _ask_magic(card_text))
+
+
+def ai_name_year_magic_many(card_texts):
+    """ai_name_year_magic for several texts, asked in grouped prompts. Failed texts get their exception."""
+    return memoized_many("magic", MODEL, card_texts, MagicCard, lambda texts: ask_many(texts, _ask_magic_group, _ask_magic))
+
+
+def _ask_magic_group(card_texts):
+    return ask_group(groq, MODEL, MAGIC_SYSTEM_PROMPT, MAGIC_USER_PROMPT, card_texts, MagicCard)
+
+
+def _ask_magic(card_text: str):
     chat_completion = groq.chat.completions.create(
         messages=[
             {
                 "role": "system",
-                "content": "You are a productivity assistant that uses extracted trading card text to determine what the card is.\n"
-                f"The JSON object must use the schema: {json.dumps(MagicCard.model_json_schema(), indent=2)}",
+                "content": MAGIC_SYSTEM_PROMPT,
             },
             {
                 "role": "user",
-                "content": f"Using the extracted text. What is this magic card? : '{card_text}'",
+                "content": MAGIC_USER_PROMPT.format(card_text=card_text),
             },
         ],
-        model="llama-3.3-70b-specdec",
+        model=MODEL,
         temperature=0.5,
         stream=False,
         response_format={"type": "json_object"},
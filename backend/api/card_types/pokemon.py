@@ -1,62 +1,363 @@
+import asyncio
 import requests
 import os
 import json
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from pydantic import BaseModel
 from groq import Groq
-from symspellpy import SymSpell
+from symspellpy import SymSpell, Verbosity
+from . import async_http, http_client
+from ..ai_card.llm_cache import memoized, memoized_many, register_prompt
+from ..ai_card.llm_group import ask_group, ask_many
+from ..log import log_payload
 
 load_dotenv()
 
 groq = Groq(api_key=os.environ.get("GROQ_API_KEY"))
 
+logger = logging.getLogger(__name__)
+
+POKEMON_API_URL = os.environ.get("POKEMONTCG_API_URL", "https://api.pokemontcg.io/v2")
+
+# card_names.txt lives next to manage.py and is generated by the sync_catalog command
+CARD_NAMES_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    "card_names.txt",
+)
+
 class PokemonCard(BaseModel):
     name: str
     set_number: str
 
-def pokemon_name_and_set_number(card_name, set_number):
-    print("HERE 3")
-    base_url = "https://api.pokemontcg.io/v2/cards"
-    # Match name to most similar card name in the database
-    sym_spell = SymSpell(max_dictionary_edit_distance=2)
-    sym_spell.load_dictionary("card_names.txt", term_index=0, count_index=1)
-    suggestions = sym_spell.lookup(card_name, verbosity=2, max_edit_distance=2)
-    if suggestions:
-        card_name = suggestions[0].term
-        print(suggestions[0].term)
-
-    query = f'name:"{card_name}"'
-    params = {'q': query}
-    response = requests.get(base_url, params=params)
-    if response.status_code == 200:
-        data = response.json()
-        if data['totalCount'] > 0:
-            for card in data['data']:
-                if card['number'] == set_number:
-                    return card
-        else:
-            print(f"No cards found for '{card_name}' with set number {set_number}.")
+
+class CardNameIndex:
+    """
+    SymSpell index over card_names.txt, built once per process and shared by all requests.
+
+    The index is built lazily on first use and rebuilt when the file's mtime changes.
+    A pickled copy is written next to the dictionary so later workers can load it
+    instead of re-parsing the text file.
+    """
+
+    def __init__(self, path, max_edit_distance=2, check_interval=2.0):
+        self.path = path
+        self.pickle_path = os.path.splitext(path)[0] + ".pickle"
+        self.max_edit_distance = max_edit_distance
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._sym_spell = None
+        self._mtime = None
+        self._checked_at = 0.0
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _load_pickle(self, mtime):
+        if mtime is None or not os.path.exists(self.pickle_path):
             return None
+        if os.stat(self.pickle_path).st_mtime_ns < mtime:
+            return None
+        sym_spell = SymSpell(max_dictionary_edit_distance=self.max_edit_distance)
+        try:
+            if sym_spell.load_pickle(self.pickle_path):
+                return sym_spell
+        except Exception:
+            pass
+        return None
+
+    def _build(self, mtime):
+        sym_spell = self._load_pickle(mtime)
+        if sym_spell is not None:
+            return sym_spell
+
+        sym_spell = SymSpell(max_dictionary_edit_distance=self.max_edit_distance)
+        if mtime is not None:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    # Names contain spaces ("Mewtwo & Mew-GX 1"), so only split off the count
+                    term, _, count = line.rstrip("\n").rpartition(" ")
+                    if term and count.isdigit():
+                        sym_spell.create_dictionary_entry(term, int(count))
+            try:
+                sym_spell.save_pickle(self.pickle_path)
+            except OSError:
+                pass
+        return sym_spell
+
+    def get(self):
+        """Return the current SymSpell instance, (re)building it if the dictionary changed."""
+        now = time.monotonic()
+        sym_spell = self._sym_spell
+        if sym_spell is not None and now - self._checked_at < self.check_interval:
+            return sym_spell
+
+        mtime = self._file_mtime()
+        if sym_spell is not None and mtime == self._mtime:
+            self._checked_at = now
+            return sym_spell
+
+        with self._lock:
+            if self._sym_spell is None or mtime != self._mtime:
+                self._sym_spell = self._build(mtime)
+                self._mtime = mtime
+            self._checked_at = now
+            return self._sym_spell
+
+    def correct(self, card_name):
+        """Return the closest known card name, or the input unchanged if nothing is close enough."""
+        suggestions = self.get().lookup(
+            card_name, Verbosity.ALL, max_edit_distance=self.max_edit_distance
+        )
+        if suggestions:
+            return suggestions[0].term
+        return card_name
+
+
+card_name_index = CardNameIndex(CARD_NAMES_PATH)
+
+
+# Live lookups
+#
+# The PokémonTCG API is searched by name and number in one query. Only when that finds
+# nothing (e.g. the LLM read "SWSH020" as "SWSH20") are all cards with the name fetched,
+# page by page, and matched on a normalized number. Every candidate gets a confidence
+# score and the best one is returned.
+
+PAGE_SIZE = 250  # Maximum cards per page
+# Pages of a name-only search fetched at once
+PAGE_CONCURRENCY = 4
+# Newest printing first, so reprints with the same number resolve to the current one
+ORDER_BY = "-set.releaseDate"
+
+
+class PokemonMatch(BaseModel):
+    card: dict
+    # 1.0 for an exact name and number match, lower for normalized or ambiguous matches
+    confidence: float
+    # "catalog" for the local mirror, "api" for a live PokémonTCG response
+    source: str
+
+    @property
+    def price(self):
+        return self.card.get("cardmarket", {}).get("prices", {}).get("averageSellPrice")
+
+
+class PokemonAPIError(Exception):
+    """Raised when the PokémonTCG API can't be reached or answers with an error."""
+
+
+def _number_key(number):
+    """Drop leading zeros after any set prefix: "065" -> "65", "SWSH020" -> "SWSH20"."""
+    prefix, digits = re.match(r"([A-Za-z]*)(.*)", number.strip()).groups()
+    return prefix.upper() + (digits.lstrip("0") or "0")
+
+
+def _name_key(name):
+    return " ".join(name.split()).lower()
+
+
+def _score(card, card_name, set_number):
+    """How well a returned card matches the name and number read off the scan (0 if it doesn't)."""
+    if card.get("number") == set_number:
+        score = 1.0
+    elif _number_key(card.get("number", "")) == _number_key(set_number):
+        score = 0.9
     else:
-        return f"Error: {response.status_code}"
+        return 0.0
+    # name:"Pikachu" also matches "Pikachu V" and "Flying Pikachu"
+    if _name_key(card.get("name", "")) != _name_key(card_name):
+        score *= 0.7
+    return score
+
+
+def best_match(cards, card_name, set_number):
+    """Return the highest scoring card as a PokemonMatch, or None if no card matches the number."""
+    scored = [(_score(card, card_name, set_number), card) for card in cards]
+    scored = [(score, card) for score, card in scored if score > 0]
+    if not scored:
+        return None
+    top = max(score for score, _ in scored)
+    # Cards come newest set first, so the first of equally good candidates is the current printing
+    best = next(card for score, card in scored if score == top)
+    ties = sum(1 for score, _ in scored if score == top)
+    confidence = top if ties == 1 else top * 0.75
+    return PokemonMatch(card=best, confidence=round(confidence, 3), source="api")
+
+
+def _number_params(card_name, set_number):
+    return {'q': f'name:"{card_name}" number:"{set_number}"', 'orderBy': ORDER_BY, 'pageSize': PAGE_SIZE}
+
+
+def _name_params(card_name, page):
+    return {'q': f'name:"{card_name}"', 'orderBy': ORDER_BY, 'pageSize': PAGE_SIZE, 'page': page}
+
+
+def _cards_from_response(response):
+    """Return (cards, totalCount) from a /cards response."""
+    if response.status_code != 200:
+        raise PokemonAPIError(f"Error: {response.status_code}")
+    data = response.json()
+    return data.get('data', []), data.get('totalCount', 0)
+
+
+def _remaining_pages(total):
+    return range(2, (total + PAGE_SIZE - 1) // PAGE_SIZE + 1)
+
+
+def _catalog_match(card_name, set_number, use_catalog):
+    """Correct the name and try the local catalog. Returns (card_name, match, done)."""
+    # Match name to most similar card name in the database
+    corrected = card_name_index.correct(card_name)
+    logger.debug("Corrected card name %r to %r", card_name, corrected)
+    card_name = corrected
+
+    from ..catalog import find_pokemon_card, use_live_api
+    if use_catalog:
+        card = find_pokemon_card(card_name, set_number)
+        if card is not None:
+            return card_name, PokemonMatch(card=card, confidence=1.0, source="catalog"), True
+    return card_name, None, not use_live_api()
+
+
+def _search(card_name, set_number):
+    try:
+        cards, _ = _cards_from_response(
+            http_client.get(f"{POKEMON_API_URL}/cards", params=_number_params(card_name, set_number))
+        )
+        match = best_match(cards, card_name, set_number)
+        if match is not None:
+            return match
+
+        cards, total = _cards_from_response(
+            http_client.get(f"{POKEMON_API_URL}/cards", params=_name_params(card_name, 1))
+        )
+        pages = _remaining_pages(total)
+        if pages:
+            def fetch(page):
+                response = http_client.get(f"{POKEMON_API_URL}/cards", params=_name_params(card_name, page))
+                return _cards_from_response(response)[0]
+
+            with ThreadPoolExecutor(max_workers=min(PAGE_CONCURRENCY, len(pages))) as pool:
+                for page_cards in pool.map(fetch, pages):
+                    cards += page_cards
+    except requests.RequestException as e:
+        raise PokemonAPIError(str(e)) from e
+    return best_match(cards, card_name, set_number)
+
+
+async def _asearch(card_name, set_number):
+    try:
+        cards, _ = _cards_from_response(
+            await async_http.get(f"{POKEMON_API_URL}/cards", params=_number_params(card_name, set_number))
+        )
+        match = best_match(cards, card_name, set_number)
+        if match is not None:
+            return match
+
+        cards, total = _cards_from_response(
+            await async_http.get(f"{POKEMON_API_URL}/cards", params=_name_params(card_name, 1))
+        )
+        pages = _remaining_pages(total)
+        slots = asyncio.Semaphore(PAGE_CONCURRENCY)
+
+        async def fetch(page):
+            async with slots:
+                response = await async_http.get(f"{POKEMON_API_URL}/cards", params=_name_params(card_name, page))
+            return _cards_from_response(response)[0]
+
+        for page_cards in await asyncio.gather(*(fetch(page) for page in pages)):
+            cards += page_cards
+    except async_http.ERRORS as e:
+        raise PokemonAPIError(str(e)) from e
+    return best_match(cards, card_name, set_number)
+
+
+def lookup_pokemon_card(card_name, set_number, use_catalog=True):
+    """
+    Return the best PokemonMatch for a name and set number, or None if nothing matches.
+    Raises PokemonAPIError if the API lookup fails.
+    """
+    card_name, match, done = _catalog_match(card_name, set_number, use_catalog)
+    if match is not None or done:
+        return match
+    match = _search(card_name, set_number)
+    if match is None:
+        logger.info("No cards found for %r with set number %s", card_name, set_number)
+    return match
+
+
+async def alookup_pokemon_card(card_name, set_number, use_catalog=True):
+    """Async lookup_pokemon_card: the catalog query runs in a thread, the API calls on the loop."""
+    from asgiref.sync import sync_to_async
+    card_name, match, done = await sync_to_async(_catalog_match)(card_name, set_number, use_catalog)
+    if match is not None or done:
+        return match
+    match = await _asearch(card_name, set_number)
+    if match is None:
+        logger.info("No cards found for %r with set number %s", card_name, set_number)
+    return match
+
+
+def fetch_pokemon_price(card_name, set_number):
+    """Return the Cardmarket average sell price for a card, or None if it can't be found. Raises PokemonAPIError."""
+    # Prices always come from the live API; the catalog mirror's prices can be weeks old
+    match = lookup_pokemon_card(card_name, set_number, use_catalog=False)
+    return match.price if match is not None else None
+
+
+async def afetch_pokemon_price(card_name, set_number):
+    """Async fetch_pokemon_price."""
+    match = await alookup_pokemon_card(card_name, set_number, use_catalog=False)
+    return match.price if match is not None else None
+
+
+MODEL = "llama-3.3-70b-specdec"
+
+POKEMON_SYSTEM_PROMPT = (
+    "You are a productivity assistant that uses extracted trading card text to determine what the card is.\n"
+    f"The JSON object must use the schema: {json.dumps(PokemonCard.model_json_schema(), indent=2)}. Let set_number be the number of the card in the set, which is always in the form 'set_number/printed_total'. For example, if the set number and total is 065/105, set_number should be 65. If there are letters right before the set number, they should be included. Example, 'SWSH157' should return 'SWSH157', and 'XY52' should return 'XY52'. Hyphenate GX/EX cards, use all spaces for VMAX and BREAK cards. For example, 'Mega Charizard GX' should be 'Mega Charizard-GX', but 'Lugia BREAK' should remain 'Lugia Break'. Include symbols, like &. For example, 'Mewtwo & Mew GX' should be 'Mewtwo & Mew-GX'."
+)
+POKEMON_USER_PROMPT = "Using the extracted text. What is this pokemon card? : '{card_text}'"
+register_prompt("pokemon", POKEMON_SYSTEM_PROMPT, POKEMON_USER_PROMPT)
+
 
 def ai_name_set_number_pokemon(card_text: str):
-    print("HERE 2")
+    log_payload(logger, "Card text: %s", card_text)
+    return memoized("pokemon", MODEL, card_text, PokemonCard, lambda: _ask_pokemon(card_text))
+
+
+def ai_name_set_number_pokemon_many(card_texts):
+    """ai_name_set_number_pokemon for several texts, asked in grouped prompts. Failed texts get their exception."""
+    return memoized_many("pokemon", MODEL, card_texts, PokemonCard, lambda texts: ask_many(texts, _ask_pokemon_group, _ask_pokemon))
+
+
+def _ask_pokemon_group(card_texts):
+    return ask_group(groq, MODEL, POKEMON_SYSTEM_PROMPT, POKEMON_USER_PROMPT, card_texts, PokemonCard)
+
+
+def _ask_pokemon(card_text: str):
     chat_completion = groq.chat.completions.create(
         messages=[
             {
                 "role": "system",
-                "content": "You are a productivity assistant that uses extracted trading card text to determine what the card is.\n"
-                f"The JSON object must use the schema: {json.dumps(PokemonCard.model_json_schema(), indent=2)}. Let set_number be the number of the card in the set, which is always in the form 'set_number/printed_total'. For example, if the set number and total is 065/105, set_number should be 65. If there are letters right before the set number, they should be included. Example, 'SWSH157' should return 'SWSH157', and 'XY52' should return 'XY52'. Hyphenate GX/EX cards, use all spaces for VMAX and BREAK cards. For example, 'Mega Charizard GX' should be 'Mega Charizard-GX', but 'Lugia BREAK' should remain 'Lugia Break'. Include symbols, like &. For example, 'Mewtwo & Mew GX' should be 'Mewtwo & Mew-GX'.",
+                "content": POKEMON_SYSTEM_PROMPT,
             },
             {
                 "role": "user",
-                "content": f"Using the extracted text. What is this pokemon card? : '{card_text}'",
+                "content": POKEMON_USER_PROMPT.format(card_text=card_text),
             },
         ],
-        model="llama-3.3-70b-specdec",
+        model=MODEL,
         temperature=0.5,
         stream=False,
         response_format={"type": "json_object"},
     )
-    return PokemonCard.model_validate_json(chat_completion.choices[0].message.content)
\ No newline at end of file
+    return PokemonCard.model_validate_json(chat_completion.choices[0].message.content)
@@ -1,61 +1,240 @@
+"""
+Sold prices from eBay, fetched through ScraperAPI.
+
+The results page is tokenized incrementally with the standard library's HTMLParser, from
+the start of the results list rather than the top of the page, and parsing stops as soon
+as EBAY_SOLD_SAMPLE listings have been read; no document tree is built. The prices are
+summarized in a PriceSummary (median, trimmed mean, range), with eBay's placeholder
+listing, listings in other currencies and prices far from the median left out.
+"""
+import asyncio
+import logging
+import re
+import statistics
+from collections import Counter
+from html.parser import HTMLParser
+
 import requests, os
 from dotenv import load_dotenv
+from pydantic import BaseModel
+from . import async_http, http_client
+from ..log import log_payload
 
 load_dotenv()
+
+logger = logging.getLogger(__name__)
+
 # Replace with your ScraperAPI key
 SCRAPER_API_KEY = os.environ.get("SCRAPER_API")
-
-def get_ebay_prices(search_query):
+SCRAPER_API_URL = os.environ.get("SCRAPER_API_URL", "https://api.scraperapi.com/")
+
+# Most recent sold listings read per search; parsing stops once this many have prices
+EBAY_SOLD_SAMPLE = int(os.environ.get("EBAY_SOLD_SAMPLE", 20))
+# Fewer usable prices than this and the search has no price
+MIN_SOLD_PRICES = 3
+# Prices more than this many times above or below the median are left out (lots, wrong cards)
+OUTLIER_FACTOR = 3.0
+# Fraction of the lowest and of the highest prices dropped from the trimmed mean
+TRIM_FRACTION = 0.2
+
+# Characters fed to the parser at a time, so it can stop partway through the page
+CHUNK_SIZE = 16 * 1024
+
+# Longest prefixes first, so "C $" isn't read as US dollars
+CURRENCY_PREFIXES = (
+    ("AU $", "AUD"), ("C $", "CAD"), ("US $", "USD"), ("$", "USD"),
+    ("GBP", "GBP"), ("£", "GBP"), ("EUR", "EUR"), ("€", "EUR"),
+)
+_AMOUNT = re.compile(r"\d[\d,]*(?:\.\d+)?")
+# eBay's first result is a hidden "Shop on eBay" card with a made-up price
+PLACEHOLDER_TITLES = {"shop on ebay"}
+_VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+
+
+class PriceSummary(BaseModel):
+    """Sold prices for one search, after dropping outliers."""
+    median: float
+    trimmed_mean: float
+    count: int
+    low: float
+    high: float
+    currency: str
+    # Listings left out for being too far from the median
+    outliers: int = 0
+
+    @property
+    def price(self):
+        return self.median
+
+
+class EbayScrapeError(Exception):
+    """Raised when ScraperAPI or eBay can't be reached or answers with an error."""
+
+
+def _proxy_url(search_query):
     # Format search query for eBay
     search_query = search_query.replace(" ", "+").replace("/", "%2F")
     ebay_url = f"https://www.ebay.com/sch/i.html?_nkw={search_query}&LH_Complete=1&LH_Sold=1"
 
     # ScraperAPI URL
-    proxy_url = f"https://api.scraperapi.com/?api_key={SCRAPER_API_KEY}&url={ebay_url}"
-
-    # Make request through ScraperAPI
-    response = requests.get(proxy_url)
+    return f"{SCRAPER_API_URL}?api_key={SCRAPER_API_KEY}&url={ebay_url}"
 
-    if response.status_code != 200:
-        return f"Error: {response.status_code}, possibly blocked by eBay"
-
-    # Parse response HTML
-    from bs4 import BeautifulSoup
-    soup = BeautifulSoup(response.text, "html.parser")
 
-    # Extract sold prices
-    prices = []
-    price_elements = soup.find_all("span", class_="s-item__price")
+def get_ebay_price_summary(search_query):
+    """Return a PriceSummary of the search's recent sold prices, or None if there are too few."""
+    # Make request through ScraperAPI
+    try:
+        response = http_client.get(_proxy_url(search_query))
+    except requests.RequestException as e:
+        raise EbayScrapeError(e) from e
 
-    for price in price_elements[:7]:  # Get top 5 sold prices
-        print(price)
-        prices.append(price.text.strip())
+    return _summary_from_response(response)
 
-    average = get_average_price(prices)
 
-    return average if prices else "No sold items found"
+async def aget_ebay_price_summary(search_query):
+    """Async get_ebay_price_summary; the HTML is parsed in a thread to keep the event loop free."""
+    try:
+        response = await async_http.get(_proxy_url(search_query))
+    except async_http.ERRORS as e:
+        raise EbayScrapeError(e) from e
 
-def clean_price(price):
-    """Extracts numeric values from a price string and returns their average if a range is given."""
-    price = price.replace("$", "").replace(",", "")  # Remove $ signs and commas
+    return await asyncio.to_thread(_summary_from_response, response)
 
-    # If the price contains "to", it's a range (e.g., "0.99 to 2.99")
-    if "to" in price:
-        low, high = map(float, price.split(" to "))
-        return (low + high) / 2  # Return the average of the range
 
-    return float(price)  # Convert single price to float
+def fetch_ebay_price(search_query):
+    """Return the median recent sold price for a search, or None if there are too few sales. Raises EbayScrapeError."""
+    summary = get_ebay_price_summary(search_query)
+    return summary.price if summary is not None else None
 
-def get_average_price(prices):
-    """Takes a list of prices and returns the average of the last three values."""
-    if len(prices) < 3:
-        return "Not enough prices to compute an average."
 
-    # Extract the last three prices and clean them
-    last_three_prices = [clean_price(p) for p in prices[-3:]]
+async def afetch_ebay_price(search_query):
+    """Async fetch_ebay_price."""
+    summary = await aget_ebay_price_summary(search_query)
+    return summary.price if summary is not None else None
 
-    # Compute the average
-    return sum(last_three_prices) / len(last_three_prices)
 
-# Example Usage
-#print(get_ebay_prices("Bryce Harper 89ASB-40"))
+def _summary_from_response(response):
+    if response.status_code != 200:
+        raise EbayScrapeError(f"{response.status_code}, possibly blocked by eBay")
+
+    prices = sold_prices(response.text)
+    log_payload(logger, "Sold prices on the page: %s", prices)
+    return summarize_prices(prices)
+
+
+class _SoldListingParser(HTMLParser):
+    """Collects the title and price text of each s-item listing, as the page is fed in."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.listings = []
+        self._title = []
+        self._price = []
+        self._field = None
+        self._depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if self._field is not None:
+            if tag not in _VOID_TAGS:
+                self._depth += 1
+            return
+        for name, value in attrs:
+            if name != "class" or not value:
+                continue
+            classes = value.split()
+            if tag == "li" and "s-item" in classes:
+                self._end_listing()
+            elif "s-item__title" in classes:
+                self._field = self._title
+            elif "s-item__price" in classes:
+                self._field = self._price
+            break
+
+    def handle_endtag(self, tag):
+        if self._field is None:
+            return
+        if self._depth:
+            self._depth -= 1
+        else:
+            self._field = None
+
+    def handle_data(self, data):
+        if self._field is not None:
+            self._field.append(data)
+
+    def _end_listing(self):
+        title = " ".join(" ".join(self._title).split())
+        if self._price and title.lower() not in PLACEHOLDER_TITLES:
+            self.listings.append((title, " ".join(" ".join(self._price).split())))
+        self._title, self._price = [], []
+
+    def close(self):
+        super().close()
+        self._end_listing()
+
+
+def sold_listings(html, limit=None):
+    """(title, price text) of the first limit listings on a sold results page, skipping eBay's placeholder."""
+    limit = EBAY_SOLD_SAMPLE if limit is None else limit
+    # Everything before the results list (head, scripts, filters) is skipped untokenized
+    start = html.find("srp-results")
+    start = max(html.rfind("<", 0, start), 0) if start != -1 else 0
+
+    parser = _SoldListingParser()
+    for offset in range(start, len(html), CHUNK_SIZE):
+        parser.feed(html[offset:offset + CHUNK_SIZE])
+        # A listing is only added once the next one starts, so these are all complete
+        if len(parser.listings) >= limit:
+            break
+    else:
+        parser.close()
+    return parser.listings[:limit]
+
+
+def parse_price(text):
+    """(amount, currency) of a listing price like "$1,234.50" or "£0.99 to £2.99"; ranges give their midpoint."""
+    for prefix, currency in CURRENCY_PREFIXES:
+        if text.startswith(prefix):
+            break
+    else:
+        return None
+    amounts = [float(amount.replace(",", "")) for amount in _AMOUNT.findall(text)]
+    if not amounts:
+        return None
+    return sum(amounts) / len(amounts), currency
+
+
+def sold_prices(html, limit=None):
+    """[(amount, currency)] of the sold listings on a results page, unreadable prices left out."""
+    prices = []
+    for _, text in sold_listings(html, limit):
+        price = parse_price(text)
+        if price is not None and price[0] > 0:
+            prices.append(price)
+    return prices
+
+
+def summarize_prices(prices):
+    """PriceSummary of [(amount, currency)] in the most common currency, or None if there are too few."""
+    if not prices:
+        return None
+    currency = Counter(currency for _, currency in prices).most_common(1)[0][0]
+    amounts = sorted(amount for amount, c in prices if c == currency)
+    if len(amounts) < MIN_SOLD_PRICES:
+        return None
+
+    median = statistics.median(amounts)
+    kept = [a for a in amounts if median / OUTLIER_FACTOR <= a <= median * OUTLIER_FACTOR]
+    if len(kept) < MIN_SOLD_PRICES:
+        return None
+    trim = int(len(kept) * TRIM_FRACTION)
+    trimmed = kept[trim:len(kept) - trim]
+    return PriceSummary(
+        median=round(statistics.median(kept), 2),
+        trimmed_mean=round(statistics.fmean(trimmed), 2),
+        count=len(kept),
+        low=round(kept[0], 2),
+        high=round(kept[-1], 2),
+        currency=currency,
+        outliers=len(amounts) - len(kept),
+    )
@@ -0,0 +1,237 @@
+"""
+Local card catalog.
+
+sync_pokemon() and sync_magic() mirror the PokémonTCG catalog and Scryfall's bulk data into
+PokemonCatalogCard and MagicCatalogCard. Identification then resolves (name, number) and
+(name, year) with one indexed query and only falls back to the live APIs for cards the
+mirror doesn't have yet.
+
+Syncs are incremental: Pokémon sets are only re-fetched when their updatedAt changes, and
+the Scryfall bulk file is only downloaded when Scryfall publishes a new one.
+"""
+import json
+import os
+from datetime import date
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import CatalogSyncState, MagicCatalogCard, PokemonCatalogCard
+from .card_types import http_client
+from .card_types.magic import SCRYFALL_API_URL
+from .card_types.pokemon import CARD_NAMES_PATH, POKEMON_API_URL
+
+
+SCRYFALL_BULK_URL = f"{SCRYFALL_API_URL}/bulk-data/default-cards"
+PAGE_SIZE = 250  # Maximum cards per page
+UPSERT_BATCH_SIZE = 1000
+
+
+def name_key(name):
+    return " ".join(name.split()).lower()
+
+
+def _parse_date(value):
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value.replace("/", "-"))
+    except ValueError:
+        return None
+
+
+# Lookups
+
+def find_pokemon_card(card_name, set_number):
+    """Return the mirrored card in the pokemontcg.io response shape, or None."""
+    card = PokemonCatalogCard.objects.filter(name_key=name_key(card_name), number=set_number).order_by('-release_date').first()
+    if card is None:
+        return None
+    return {
+        'id': card.id,
+        'name': card.name,
+        'number': card.number,
+        'set': {'id': card.set_id, 'name': card.set_name, 'printedTotal': card.printed_total},
+        'cardmarket': {'prices': card.prices or {}},
+    }
+
+
+def find_magic_cards(card_name, year):
+    """Return the mirrored printings in the Scryfall search response shape, or None."""
+    try:
+        year = int(year)
+    except (TypeError, ValueError):
+        return None
+    cards = MagicCatalogCard.objects.filter(name_key=name_key(card_name), year=year).order_by('released_at')
+    results = [
+        {
+            'id': str(card.id),
+            'name': card.name,
+            'set': card.set_code,
+            'set_name': card.set_name,
+            'collector_number': card.collector_number,
+            'released_at': card.released_at.isoformat() if card.released_at else None,
+            'prices': card.prices or {},
+        }
+        for card in cards
+    ]
+    return results or None
+
+
+def use_live_api():
+    """Whether lookups that miss the mirror should still call the upstream API."""
+    return getattr(settings, 'CATALOG_FALLBACK_TO_API', True)
+
+
+# Pokémon sync
+
+def _pokemon_headers():
+    api_key = os.environ.get("POKEMONTCG_API_KEY")
+    return {"X-Api-Key": api_key} if api_key else {}
+
+
+def _pokemon_pages(path, params, log):
+    page = 1
+    while True:
+        response = http_client.get(
+            f"{POKEMON_API_URL}/{path}",
+            params={**params, "page": page, "pageSize": PAGE_SIZE},
+            headers=_pokemon_headers(),
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"Error: {response.status_code} - {response.text}")
+        data = response.json().get("data", [])
+        yield data
+        log(f"Fetched {path} page {page}")
+        if len(data) < PAGE_SIZE:
+            return
+        page += 1
+
+
+def sync_pokemon(full=False, log=print):
+    """Mirror every Pokémon set whose updatedAt changed since the last sync. Returns cards written."""
+    sync_state, _ = CatalogSyncState.objects.get_or_create(source="pokemon")
+    known_sets = {} if full else dict(sync_state.state.get("sets", {}))
+
+    sets = [s for page in _pokemon_pages("sets", {}, log) for s in page]
+    stale = [s for s in sets if known_sets.get(s["id"]) != s.get("updatedAt")]
+    log(f"{len(stale)} of {len(sets)} sets need syncing")
+
+    written = 0
+    for card_set in stale:
+        now = timezone.now()
+        rows = []
+        for page in _pokemon_pages("cards", {"q": f"set.id:{card_set['id']}"}, log):
+            for card in page:
+                rows.append(PokemonCatalogCard(
+                    id=card["id"],
+                    name=card["name"],
+                    name_key=name_key(card["name"]),
+                    number=card["number"],
+                    set_id=card_set["id"],
+                    set_name=card_set["name"],
+                    printed_total=card_set.get("printedTotal"),
+                    release_date=_parse_date(card_set.get("releaseDate")),
+                    prices=card.get("cardmarket", {}).get("prices"),
+                    synced_at=now,
+                ))
+        PokemonCatalogCard.objects.bulk_create(
+            rows,
+            batch_size=UPSERT_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=["id"],
+            update_fields=["name", "name_key", "number", "set_id", "set_name", "printed_total", "release_date", "prices", "synced_at"],
+        )
+        written += len(rows)
+        known_sets[card_set["id"]] = card_set.get("updatedAt")
+        # Save after every set so an interrupted sync resumes where it stopped
+        sync_state.state = {**sync_state.state, "sets": known_sets}
+        sync_state.synced_at = now
+        sync_state.save()
+
+    if stale or not os.path.exists(CARD_NAMES_PATH):
+        write_card_names()
+    return written
+
+
+def write_card_names(filename=CARD_NAMES_PATH):
+    """Regenerate card_names.txt (the SymSpell dictionary) from the mirrored Pokémon names."""
+    names = PokemonCatalogCard.objects.values_list("name", flat=True).distinct().order_by("name")
+    tmp_path = f"{filename}.tmp"
+    count = 0
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for name in names:
+            f.write(f"{name} 1\n")  # Assign frequency 1 for SymSpell
+            count += 1
+    os.replace(tmp_path, filename)
+    return count
+
+
+# Magic sync
+
+def _iter_bulk_cards(response):
+    """
+    Stream cards out of a Scryfall bulk file without loading it whole.
+
+    Scryfall writes one card object per line, so each line (minus the trailing comma)
+    is a complete JSON document.
+    """
+    for line in response.iter_lines(decode_unicode=True):
+        line = line.strip().rstrip(",")
+        if not line or line in ("[", "]"):
+            continue
+        yield json.loads(line)
+
+
+def sync_magic(full=False, log=print):
+    """Mirror Scryfall's default-cards bulk file if a newer one was published. Returns cards written."""
+    sync_state, _ = CatalogSyncState.objects.get_or_create(source="magic")
+    response = http_client.get(SCRYFALL_BULK_URL)
+    response.raise_for_status()
+    bulk = response.json()
+
+    if not full and sync_state.state.get("updated_at") == bulk["updated_at"]:
+        log("Scryfall bulk data unchanged")
+        return 0
+
+    now = timezone.now()
+    written = 0
+    rows = []
+
+    def flush():
+        MagicCatalogCard.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=["id"],
+            update_fields=["name", "name_key", "set_code", "set_name", "collector_number", "released_at", "year", "prices", "synced_at"],
+        )
+
+    with http_client.get(bulk["download_uri"], stream=True, timeout=(5, 300)) as download:
+        download.raise_for_status()
+        for card in _iter_bulk_cards(download):
+            released_at = _parse_date(card.get("released_at"))
+            rows.append(MagicCatalogCard(
+                id=card["id"],
+                name=card["name"],
+                name_key=name_key(card["name"]),
+                set_code=card.get("set", ""),
+                set_name=card.get("set_name", ""),
+                collector_number=card.get("collector_number", ""),
+                released_at=released_at,
+                year=released_at.year if released_at else None,
+                prices=card.get("prices"),
+                synced_at=now,
+            ))
+            if len(rows) >= UPSERT_BATCH_SIZE:
+                flush()
+                written += len(rows)
+                rows = []
+                log(f"Synced {written} Magic cards")
+    if rows:
+        flush()
+        written += len(rows)
+
+    sync_state.state = {"updated_at": bulk["updated_at"]}
+    sync_state.synced_at = now
+    sync_state.save()
+    return written
@@ -0,0 +1,213 @@
+"""
+Collection value, kept as running totals instead of pricing every card per request.
+
+CollectionValue holds each user's card count, priced card count and value per
+(card_company, set). The totals are adjusted in place as things change:
+
+- a card is created, deleted or edited into another set or price key (the signal receivers
+  below; insert_cards calls add_cards itself, since bulk_create sends no signals)
+- a price key's cached price changes (price_cache.store_price calls price_changed), which
+  moves every owner's total by the change times their copies, and records the change as a
+  CollectionMover
+
+So reading a collection's value (collection_value) costs the same for 10 cards as for
+10,000: one indexed read of the user's rows per set plus the top movers. rebuild recomputes
+the totals from the cards, in case they ever drift.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import CachedPrice, Card, CollectionMover, CollectionValue
+
+logger = logging.getLogger(__name__)
+
+
+def _adjust(owner_id, card_company, set, cards=0, priced_cards=0, value=0.0):
+    """Add to one group's totals, creating its row the first time."""
+    changes = {'cards': F('cards') + cards, 'priced_cards': F('priced_cards') + priced_cards, 'value': F('value') + value}
+    group = CollectionValue.objects.filter(owner_id=owner_id, card_company=card_company, set=set)
+    if group.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            CollectionValue.objects.create(
+                owner_id=owner_id, card_company=card_company, set=set,
+                cards=cards, priced_cards=priced_cards, value=value,
+            )
+    except IntegrityError:
+        # Created by a concurrent request in the meantime
+        group.update(**changes)
+
+
+def _count(cards, sign):
+    groups = defaultdict(lambda: [0, 0, 0.0])
+    prices = dict(CachedPrice.objects.filter(key__in={card.price_key for card in cards}).values_list('key', 'price'))
+    for card in cards:
+        totals = groups[(card.owner_id, card.card_company, card.set)]
+        price = prices.get(card.price_key)
+        totals[0] += sign
+        if price is not None:
+            totals[1] += sign
+            totals[2] += sign * price
+    for (owner_id, card_company, set), (count, priced, value) in groups.items():
+        _adjust(owner_id, card_company, set, count, priced, value)
+
+
+def add_cards(cards):
+    """Count new cards (saved, with price_key set) in their owners' totals."""
+    if cards:
+        _count(cards, 1)
+
+
+def remove_cards(cards):
+    """Take deleted cards out of their owners' totals, and drop movers they no longer own."""
+    if not cards:
+        return
+    _count(cards, -1)
+    for card in cards:
+        if not Card.objects.filter(owner_id=card.owner_id, price_key=card.price_key).exists():
+            CollectionMover.objects.filter(owner_id=card.owner_id, price_key=card.price_key).delete()
+
+
+def price_changed(key, previous, price, changed_at=None):
+    """Move every owner's totals from key's previous cached price (None if it had none) to price."""
+    if previous == price:
+        return
+    changed_at = changed_at or timezone.now()
+    groups = (
+        Card.objects.filter(price_key=key).values('owner_id', 'card_company', 'set')
+        .annotate(copies=Count('id'), card_name=Max('name'), card_number=Max('number')).order_by()
+    )
+    movers = {}
+    for group in groups:
+        copies = group['copies']
+        if previous is None:
+            _adjust(group['owner_id'], group['card_company'], group['set'], priced_cards=copies, value=price * copies)
+            continue
+        _adjust(group['owner_id'], group['card_company'], group['set'], value=(price - previous) * copies)
+
+        mover = movers.get(group['owner_id'])
+        if mover is None:
+            movers[group['owner_id']] = CollectionMover(
+                owner_id=group['owner_id'], price_key=key, name=group['card_name'], set=group['set'],
+                number=group['card_number'], card_company=group['card_company'], copies=copies,
+                previous_price=previous, price=price, changed_at=changed_at,
+            )
+        else:
+            mover.copies += copies
+
+    for mover in movers.values():
+        mover.change = (mover.price - mover.previous_price) * mover.copies
+        mover.abs_change = abs(mover.change)
+    if movers:
+        CollectionMover.objects.bulk_create(
+            list(movers.values()),
+            update_conflicts=True,
+            unique_fields=['owner', 'price_key'],
+            update_fields=['name', 'set', 'number', 'card_company', 'copies', 'previous_price', 'price',
+                           'change', 'abs_change', 'changed_at'],
+        )
+
+
+def collection_value(user):
+    """The user's collection value: totals, per company and per set breakdowns, and the top movers."""
+    groups = list(CollectionValue.objects.filter(owner=user, cards__gt=0).values(
+        'card_company', 'set', 'cards', 'priced_cards', 'value'))
+    for group in groups:
+        group['value'] = round(group['value'], 2)
+
+    companies = defaultdict(lambda: {'cards': 0, 'priced_cards': 0, 'value': 0.0})
+    for group in groups:
+        company = companies[group['card_company']]
+        for field in ('cards', 'priced_cards', 'value'):
+            company[field] += group[field]
+
+    days = getattr(settings, 'COLLECTION_MOVERS_DAYS', 7)
+    movers = (
+        CollectionMover.objects.filter(owner=user, changed_at__gte=timezone.now() - timedelta(days=days))
+        .order_by('-abs_change')
+        .values('name', 'set', 'number', 'card_company', 'copies', 'previous_price', 'price', 'change', 'changed_at')
+        [:getattr(settings, 'COLLECTION_MOVERS_LIMIT', 10)]
+    )
+    return {
+        'value': round(sum(group['value'] for group in groups), 2),
+        'cards': sum(group['cards'] for group in groups),
+        'priced_cards': sum(group['priced_cards'] for group in groups),
+        'by_company': sorted(
+            ({'card_company': name, **totals, 'value': round(totals['value'], 2)} for name, totals in companies.items()),
+            key=lambda company: company['value'], reverse=True,
+        ),
+        'by_set': sorted(groups, key=lambda group: group['value'], reverse=True),
+        'top_movers': list(movers),
+    }
+
+
+def rebuild(owner=None):
+    """Recompute the totals from the cards themselves, for one user or everyone. Returns the groups written."""
+    cards = Card.objects.all() if owner is None else Card.objects.filter(owner=owner)
+    prices = CachedPrice.objects.filter(key__in=cards.values('price_key')).values('key', 'price')
+    price_of = {row['key']: row['price'] for row in prices}
+
+    groups = defaultdict(lambda: [0, 0, 0.0])
+    keys = cards.values('owner_id', 'card_company', 'set', 'price_key').annotate(copies=Count('id')).order_by()
+    for row in keys:
+        totals = groups[(row['owner_id'], row['card_company'], row['set'])]
+        totals[0] += row['copies']
+        if row['price_key'] in price_of:
+            totals[1] += row['copies']
+            totals[2] += price_of[row['price_key']] * row['copies']
+
+    with transaction.atomic():
+        existing = CollectionValue.objects.all() if owner is None else CollectionValue.objects.filter(owner=owner)
+        existing.delete()
+        CollectionValue.objects.bulk_create([
+            CollectionValue(owner_id=owner_id, card_company=card_company, set=set,
+                            cards=count, priced_cards=priced, value=value)
+            for (owner_id, card_company, set), (count, priced, value) in groups.items()
+        ])
+    return len(groups)
+
+
+# Card changes
+
+_COUNTED_FIELDS = ('owner_id', 'card_company', 'set', 'price_key')
+
+
+@receiver(pre_save, sender=Card)
+def _remember_counted_fields(sender, instance, raw=False, **kwargs):
+    # What an edited card was counted as, so post_save can move it if that changed
+    if not raw and not instance._state.adding and instance.pk is not None:
+        instance._counted_as = Card.objects.filter(pk=instance.pk).values_list(*_COUNTED_FIELDS).first()
+
+
+@receiver(post_save, sender=Card)
+def _count_saved_card(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        add_cards([instance])
+        return
+    counted_as = getattr(instance, '_counted_as', None)
+    instance._counted_as = None
+    if counted_as is None or counted_as == tuple(getattr(instance, field) for field in _COUNTED_FIELDS):
+        return
+    previous = Card(pk=instance.pk, **dict(zip(_COUNTED_FIELDS, counted_as)))
+    remove_cards([previous])
+    add_cards([instance])
+
+
+@receiver(post_delete, sender=Card)
+def _uncount_deleted_card(sender, instance, origin=None, **kwargs):
+    # Deleting the user deletes their totals along with their cards
+    if getattr(origin, 'model', type(origin)) is User:
+        return
+    remove_cards([instance])
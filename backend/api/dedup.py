@@ -0,0 +1,111 @@
+"""
+Scan deduplication.
+
+Each upload's front image gets an exact SHA-256 and a 64-bit difference hash. Before a
+scan runs OCR and the LLM, we look for an earlier, already processed image of the same
+owner with the same digest or a dHash within settings.SCAN_DEDUP_MAX_DISTANCE bits, and
+reuse its results. Other users' scans are never searched, so nobody gets back someone
+else's image or OCR text. A near match is only taken when every earlier scan that close agrees on the
+text, since two different cards can photograph a few bits apart.
+
+Near matches are found through the four 16-bit bands of the dHash, each indexed on
+CardImage: two hashes at most 3 bits apart always share a band, so a distance of up to 3
+is found with four indexed lookups instead of a table scan.
+"""
+import threading
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Card, CardImage, ScanJob
+from .ai_card.image_hash import fingerprint, hamming, hash_bands
+
+
+_stats_lock = threading.Lock()
+_stats = {'exact_hits': 0, 'near_hits': 0, 'misses': 0}
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def dedup_stats():
+    """Hit and miss counts since the process started, with the overall hit rate."""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['exact_hits'] + stats['near_hits'] + stats['misses']
+    stats['hit_rate'] = (stats['exact_hits'] + stats['near_hits']) / lookups if lookups else 0.0
+    return stats
+
+
+def fingerprint_card_image(card_image, content=None, hashes=None):
+    """
+    Compute and store the front image's SHA-256 and dHash.
+
+    hashes is an already computed (sha256, dhash) pair; otherwise they are computed from
+    content, or from the stored front image.
+    """
+    if hashes is None:
+        if content is None:
+            card_image.card_front_image.open('rb')
+            try:
+                content = card_image.card_front_image.read()
+            finally:
+                card_image.card_front_image.close()
+        hashes = fingerprint(content)
+
+    card_image.sha256, value = hashes
+    if value is not None:
+        card_image.dhash = f"{value:016x}"
+        (card_image.dhash_band0, card_image.dhash_band1,
+         card_image.dhash_band2, card_image.dhash_band3) = hash_bands(value)
+    card_image.save(update_fields=['sha256', 'dhash', 'dhash_band0', 'dhash_band1', 'dhash_band2', 'dhash_band3'])
+
+
+def owned_images(owner):
+    """The CardImages owner uploaded: those of their cards and of their scan jobs."""
+    return CardImage.objects.filter(
+        Q(id__in=Card.objects.filter(owner=owner).values('card_image'))
+        | Q(id__in=ScanJob.objects.filter(owner=owner).values('card_image'))
+    )
+
+
+def find_previous_scan(card_image, owner):
+    """Return an earlier processed CardImage of owner's showing the same card, or None."""
+    if not getattr(settings, 'SCAN_DEDUP_ENABLED', True) or not card_image.sha256:
+        return None
+
+    processed = owned_images(owner).exclude(id=card_image.id).filter(extracted_text__isnull=False)
+
+    exact = processed.filter(sha256=card_image.sha256).order_by('-id').first()
+    if exact is not None:
+        _count('exact_hits')
+        return exact
+
+    max_distance = getattr(settings, 'SCAN_DEDUP_MAX_DISTANCE', 3)
+    if card_image.dhash is None or max_distance <= 0:
+        _count('misses')
+        return None
+
+    target = int(card_image.dhash, 16)
+    candidates = processed.filter(
+        Q(dhash_band0=card_image.dhash_band0) | Q(dhash_band1=card_image.dhash_band1) |
+        Q(dhash_band2=card_image.dhash_band2) | Q(dhash_band3=card_image.dhash_band3)
+    ).order_by('-id').only('id', 'sha256', 'dhash', 'extracted_text')[:getattr(settings, 'SCAN_DEDUP_MAX_CANDIDATES', 200)]
+
+    best, best_distance = None, max_distance + 1
+    texts = set()
+    for candidate in candidates:
+        distance = hamming(target, int(candidate.dhash, 16))
+        if distance > max_distance:
+            continue
+        texts.add(candidate.extracted_text)
+        if distance < best_distance:
+            best, best_distance = candidate, distance
+
+    if len(texts) > 1:
+        # Near scans that read as different cards; can't tell which one this is
+        best = None
+    _count('near_hits' if best is not None else 'misses')
+    return best
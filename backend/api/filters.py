@@ -0,0 +1,127 @@
+"""
+Search, filtering and sorting for a user's card collection.
+
+Query parameters understood by CardListCreateView:
+
+    q                 words matched as prefixes against name, set and number
+    card_company      exact company; several can be given comma separated
+    is_graded         true / false
+    autograph         true / false
+    grade_company     exact grading company
+    grade_min         lowest grade to include
+    grade_max         highest grade to include
+    ordering          name, created_at or price, prefixed with - for descending
+
+On SQLite, q is answered from the api_card_fts FTS5 table (see migration 0008). On
+PostgreSQL it uses icontains backed by trigram indexes, and elsewhere a plain icontains.
+"""
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection
+from django.db.models import FloatField, OuterRef, Q, Subquery, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
+
+from .models import CachedPrice
+
+
+FTS_TABLE = 'api_card_fts'
+_fts_available = None
+
+
+def fts_available():
+    """Whether the FTS5 index exists (SQLite built without FTS5 skips it in the migration)."""
+    global _fts_available
+    if _fts_available is None:
+        _fts_available = connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names()
+    return _fts_available
+
+
+def _fts_query(text):
+    # Quote each word so FTS5 syntax in user input is taken literally, then prefix-match it
+    words = re.findall(r'\w+', text)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _parse_bool(value, name):
+    value = value.lower()
+    if value in ('1', 'true', 'yes'):
+        return True
+    if value in ('0', 'false', 'no'):
+        return False
+    raise ValidationError({name: 'Must be true or false.'})
+
+
+def _parse_decimal(value, name):
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise ValidationError({name: 'Must be a number.'})
+
+
+class CardSearchFilter(BaseFilterBackend):
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+
+        text = params.get('q', '').strip()
+        if text:
+            queryset = self.search(queryset, text)
+
+        if params.get('card_company'):
+            queryset = queryset.filter(card_company__in=[c.strip() for c in params['card_company'].split(',')])
+        if params.get('grade_company'):
+            queryset = queryset.filter(grade_company=params['grade_company'])
+        if params.get('is_graded'):
+            queryset = queryset.filter(is_graded=_parse_bool(params['is_graded'], 'is_graded'))
+        if params.get('autograph'):
+            queryset = queryset.filter(autograph=_parse_bool(params['autograph'], 'autograph'))
+        if params.get('grade_min'):
+            queryset = queryset.filter(grade__gte=_parse_decimal(params['grade_min'], 'grade_min'))
+        if params.get('grade_max'):
+            queryset = queryset.filter(grade__lte=_parse_decimal(params['grade_max'], 'grade_max'))
+        return queryset
+
+    def search(self, queryset, text):
+        if fts_available():
+            match = _fts_query(text)
+            if not match:
+                return queryset
+            return queryset.filter(id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match]))
+
+        for word in text.split():
+            queryset = queryset.filter(Q(name__icontains=word) | Q(set__icontains=word) | Q(number__icontains=word))
+        return queryset
+
+
+class CardOrderingFilter(OrderingFilter):
+    """Sort by name, date or cached price; ties fall back to newest first."""
+    ordering_fields = ['name', 'created_at', 'price']
+    ordering = ['-created_at', '-id']
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        # 'price' sorts on the annotated cached price; cards without one sort as 0
+        ordering = [field.replace('price', 'sort_price') for field in ordering]
+        if not any(field.lstrip('-') == 'id' for field in ordering):
+            ordering.append('-id')
+        return ordering
+
+    def get_default_ordering(self, view):
+        return list(self.ordering)
+
+    def remove_invalid_fields(self, queryset, fields, view, request):
+        return [term for term in fields if term.lstrip('-') in self.ordering_fields]
+
+    def filter_queryset(self, request, queryset, view):
+        ordering = self.get_ordering(request, queryset, view)
+        if any(field.lstrip('-') == 'sort_price' for field in ordering):
+            queryset = annotate_price(queryset)
+        return queryset.order_by(*ordering)
+
+
+def annotate_price(queryset):
+    price = CachedPrice.objects.filter(key=OuterRef('price_key')).values('price')[:1]
+    return queryset.annotate(sort_price=Coalesce(Subquery(price), Value(0.0), output_field=FloatField()))
@@ -0,0 +1,124 @@
+"""
+Geohash index for finding card shops near a point.
+
+A geohash interleaves longitude and latitude bits into a base32 string, so places in the
+same grid cell share a prefix and every row in a cell is one range scan of the indexed
+geohash column (geohash >= prefix and < prefix + '~'). within_radius searches the cell
+around the point plus its 8 neighbours, at the finest precision whose cells are wider than
+the radius (so the circle can't reach past them), then keeps the rows whose haversine
+distance fits. nearest widens the radius until it has k rows.
+"""
+import math
+
+from django.db.models import Q
+
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+# Length of stored geohashes (cells of about 5 m)
+PRECISION = 9
+EARTH_RADIUS_KM = 6371.0088
+# Half the Earth's circumference; every point is within this of every other
+MAX_DISTANCE_KM = math.pi * EARTH_RADIUS_KM
+# nearest() starts at this radius and multiplies it by 4 until it has enough rows
+NEAREST_START_KM = 2.0
+
+
+def encode(lat, lng, precision=PRECISION):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits = bit_count = 0
+    even = True
+    while len(chars) < precision:
+        interval, value = (lng_range, lng) if even else (lat_range, lat)
+        mid = (interval[0] + interval[1]) / 2
+        if value >= mid:
+            bits = bits * 2 + 1
+            interval[0] = mid
+        else:
+            bits = bits * 2
+            interval[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = bit_count = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(latitude degrees, longitude degrees) spanned by one cell at this precision."""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """Great-circle (haversine) distance."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _reach(lat, radius_km):
+    """How many degrees of latitude and of longitude a point within radius_km of lat can be away."""
+    angle = radius_km / EARTH_RADIUS_KM
+    dlat = math.degrees(angle)
+    cos_lat = math.cos(math.radians(lat))
+    if abs(lat) + dlat >= 90 or math.sin(angle) >= cos_lat:
+        # The circle takes in a pole, so every longitude
+        return dlat, 360.0
+    return dlat, math.degrees(math.asin(math.sin(angle) / cos_lat))
+
+
+def precision_for(lat, radius_km):
+    """Finest precision whose cells are wider and taller than the radius at lat; 0 if none are."""
+    dlat, dlng = _reach(lat, radius_km)
+    for precision in range(PRECISION, 0, -1):
+        lat_deg, lng_deg = cell_size(precision)
+        if lat_deg >= dlat and lng_deg >= dlng:
+            return precision
+    return 0
+
+
+def neighbourhood(lat, lng, precision):
+    """Geohashes of the cell containing the point and of its 8 neighbours."""
+    lat_deg, lng_deg = cell_size(precision)
+    cells = set()
+    for dlat in (-1, 0, 1):
+        y = lat + dlat * lat_deg
+        if not -90 <= y <= 90:
+            continue
+        for dlng in (-1, 0, 1):
+            x = (lng + dlng * lng_deg + 180) % 360 - 180
+            cells.add(encode(y, x, precision))
+    return cells
+
+
+def within_radius(queryset, lat, lng, radius_km):
+    """[(distance_km, id)] of the queryset's located rows within radius_km of the point, nearest first."""
+    located = queryset.exclude(geohash='')
+    precision = precision_for(lat, radius_km)
+    if precision:
+        cells = Q()
+        for prefix in neighbourhood(lat, lng, precision):
+            cells |= Q(geohash__gte=prefix, geohash__lt=prefix + '~')
+        located = located.filter(cells)
+
+    hits = []
+    for id, y, x in located.values_list('id', 'latitude', 'longitude'):
+        distance = distance_km(lat, lng, y, x)
+        if distance <= radius_km:
+            hits.append((distance, id))
+    hits.sort()
+    return hits
+
+
+def nearest(queryset, lat, lng, k):
+    """[(distance_km, id)] of the k located rows nearest the point, nearest first."""
+    radius = NEAREST_START_KM
+    while True:
+        hits = within_radius(queryset, lat, lng, radius)
+        if len(hits) >= k or radius >= MAX_DISTANCE_KM:
+            return hits[:k]
+        radius = min(radius * 4, MAX_DISTANCE_KM)
@@ -0,0 +1,110 @@
+"""
+Card shop geocoding, with a pluggable backend (settings.GEOCODER_BACKEND).
+
+NominatimGeocoder asks a Nominatim-style /search API: OpenStreetMap's by default, or a
+self-hosted one or the stand-in in benchmarks/upstreams.py through GEOCODER_URL.
+OfflineGeocoder never calls out, so shops only get coordinates the client sends. A
+backend is any class with geocode(address) returning (latitude, longitude) or None.
+"""
+import logging
+import threading
+
+import requests
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .card_types import http_client
+
+logger = logging.getLogger(__name__)
+
+
+ADDRESS_FIELDS = ('address', 'city', 'state', 'postal_code', 'country')
+DEFAULT_GEOCODER_URL = 'https://nominatim.openstreetmap.org/search'
+
+
+class GeocodingError(Exception):
+    """Raised when the geocoding service can't be reached or answers with an error."""
+
+
+class NominatimGeocoder:
+    def __init__(self, url=None):
+        self.url = url or getattr(settings, 'GEOCODER_URL', None) or DEFAULT_GEOCODER_URL
+
+    def geocode(self, address):
+        try:
+            response = http_client.get(
+                self.url,
+                params={'q': address, 'format': 'jsonv2', 'limit': 1},
+                # Nominatim's usage policy asks for an identifying User-Agent
+                headers={'User-Agent': 'cruzin-cards/1.0'},
+            )
+        except requests.RequestException as e:
+            raise GeocodingError(e) from e
+        if response.status_code != 200:
+            raise GeocodingError(f"{response.status_code} from {self.url}")
+        try:
+            results = response.json()
+            if not results:
+                return None
+            return float(results[0]['lat']), float(results[0]['lon'])
+        except (ValueError, KeyError, TypeError) as e:
+            raise GeocodingError(f"Unexpected answer from {self.url}: {e}") from e
+
+
+class OfflineGeocoder:
+    def geocode(self, address):
+        return None
+
+
+_geocoder = None
+_geocoder_lock = threading.Lock()
+
+
+def get_geocoder():
+    """Return the process-wide geocoder named by settings.GEOCODER_BACKEND."""
+    global _geocoder
+    if _geocoder is None:
+        with _geocoder_lock:
+            if _geocoder is None:
+                backend_path = getattr(settings, 'GEOCODER_BACKEND', 'api.geocoding.NominatimGeocoder')
+                _geocoder = import_string(backend_path)()
+    return _geocoder
+
+
+def set_geocoder(geocoder):
+    """Swap the geocoder, e.g. for a local fake in tests. Pass None to reload from settings."""
+    global _geocoder
+    with _geocoder_lock:
+        _geocoder = geocoder
+
+
+def full_address(fields):
+    return ', '.join(str(fields[name]) for name in ADDRESS_FIELDS if fields.get(name))
+
+
+def geocode(address):
+    """(latitude, longitude) of an address, or None if it can't be found or the geocoder fails."""
+    if not address:
+        return None
+    try:
+        return get_geocoder().geocode(address)
+    except GeocodingError as e:
+        logger.warning("Geocoding failed for %r: %s", address, e)
+        return None
+
+
+def locate(validated_data, instance=None):
+    """
+    validated_data for a CardShop, with latitude and longitude looked up from the address
+    when the client didn't send them and the shop is new or its address changed.
+    """
+    if validated_data.get('latitude') is not None:
+        return validated_data
+    current = {name: getattr(instance, name, None) for name in ADDRESS_FIELDS}
+    fields = {**current, **{name: validated_data[name] for name in ADDRESS_FIELDS if name in validated_data}}
+    if instance is not None and instance.latitude is not None and fields == current:
+        return validated_data
+
+    point = geocode(full_address(fields))
+    latitude, longitude = point if point is not None else (None, None)
+    return {**validated_data, 'latitude': latitude, 'longitude': longitude}
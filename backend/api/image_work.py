@@ -0,0 +1,146 @@
+"""
+Executor for CPU-bound image work (decoding, resizing, hashing, encoding).
+
+settings.IMAGE_WORK_MODE picks where it runs:
+
+    inline   on the calling thread, as before
+    thread   on a shared thread pool (OpenCV releases the GIL while it works); the default
+    process  on a shared process pool, one worker per core by default. Opt in for
+             deployments: every worker is a spawned process that imports Django again
+
+In every mode at most IMAGE_WORK_MAX_PENDING tasks are running or waiting at once. A
+request that can't get a slot within IMAGE_WORK_QUEUE_TIMEOUT seconds fails with
+ImageWorkBusy, which DRF turns into a 503 with a Retry-After header, instead of piling
+more uploads onto a saturated server. Work that has to finish passes block=True and waits
+instead. Work the server queued for itself (thumbnails) also passes background=True: at
+most IMAGE_WORK_MAX_BACKGROUND such tasks hold or wait for slots at once, so a backlog of
+it can't leave uploads with nothing but 503s.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+INLINE = 'inline'
+THREAD = 'thread'
+PROCESS = 'process'
+MODES = (INLINE, THREAD, PROCESS)
+
+
+class ImageWorkBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'The server is busy processing images. Please retry shortly.'
+    default_code = 'image_work_busy'
+
+    def __init__(self, retry_after):
+        super().__init__()
+        # DRF's exception handler sends this as the Retry-After header
+        self.wait = retry_after
+
+
+class ImageWorkPool:
+    def __init__(self, mode, workers, max_pending, queue_timeout, retry_after, max_background=None):
+        if mode not in MODES:
+            raise ValueError(f"IMAGE_WORK_MODE must be one of {', '.join(MODES)}, not {mode!r}")
+        self.mode = mode
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.slots = threading.BoundedSemaphore(max_pending)
+        # Always below max_pending (unless that's 1), so requests keep slots of their own
+        max_background = max_background or max_pending // 2
+        self.background_slots = threading.BoundedSemaphore(max(1, min(max_background, max_pending - 1)))
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        if self._executor is None and self.mode != INLINE:
+            with self._lock:
+                if self._executor is None:
+                    if self.mode == THREAD:
+                        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='image-work')
+                    else:
+                        # Spawned workers don't inherit the server's threads, locks or database connections
+                        self._executor = ProcessPoolExecutor(
+                            max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+                        )
+        return self._executor
+
+    def run(self, fn, *args, block=False, background=False):
+        """Run fn(*args) in this pool and return its result."""
+        if background:
+            with self.background_slots:
+                return self.run(fn, *args, block=True)
+        if not self.slots.acquire(timeout=None if block else self.queue_timeout):
+            raise ImageWorkBusy(self.retry_after)
+        try:
+            if self.mode == INLINE:
+                return fn(*args)
+            return self.executor.submit(fn, *args).result()
+        finally:
+            self.slots.release()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+_pool = None
+_pool_lock = threading.RLock()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def configure_image_work(mode=None, workers=None, max_pending=None, queue_timeout=None, retry_after=None,
+                         max_background=None):
+    """(Re)create the process-wide pool, overriding the settings with any arguments given."""
+    global _pool
+    workers = workers or _setting('IMAGE_WORKERS', None) or os.cpu_count() or 1
+    pool = ImageWorkPool(
+        mode=mode or _setting('IMAGE_WORK_MODE', THREAD),
+        workers=workers,
+        max_pending=max_pending or _setting('IMAGE_WORK_MAX_PENDING', None) or workers * 2,
+        queue_timeout=_setting('IMAGE_WORK_QUEUE_TIMEOUT', 1.0) if queue_timeout is None else queue_timeout,
+        retry_after=retry_after or _setting('IMAGE_WORK_RETRY_AFTER', 2),
+        max_background=max_background or _setting('IMAGE_WORK_MAX_BACKGROUND', None),
+    )
+    with _pool_lock:
+        previous, _pool = _pool, pool
+    if previous is not None:
+        previous.shutdown()
+    return pool
+
+
+def get_image_pool():
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                configure_image_work()
+    return _pool
+
+
+def run_image_task(fn, *args, block=False, background=False):
+    """
+    Run a function from api.ai_card.image_tasks (or another picklable top-level function)
+    on the image pool. Raises ImageWorkBusy when block is False and the pool is saturated.
+    background=True waits for one of the slots background work may use.
+    """
+    return get_image_pool().run(fn, *args, block=block, background=background)
+
+
+def scan_image_limits():
+    """(max_height, max_width, jpeg_quality) for combined scan images, passed to workers explicitly."""
+    return (
+        _setting('SCAN_IMAGE_MAX_HEIGHT', 1600),
+        _setting('SCAN_IMAGE_MAX_WIDTH', 2400),
+        _setting('SCAN_JPEG_QUALITY', 90),
+    )
@@ -0,0 +1,232 @@
+"""
+Background worker pool for scan jobs.
+
+ScanJob rows are the queue: the upload view stores the images, inserts a queued job
+and returns straight away. A bounded pool of threads per process claims queued jobs
+with a conditional UPDATE, so several gunicorn workers (or the run_scan_worker
+command) can share the same table without handing one job out twice.
+
+Workers start when a job is queued, and on a process's first request (recover_jobs),
+which also requeues jobs a dead process left running, so nothing queued before a restart
+is left waiting.
+"""
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import close_old_connections, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import ScanJob
+
+logger = logging.getLogger(__name__)
+
+
+_lock = threading.Lock()
+_executor = None
+_active_workers = 0
+# Set by wake_workers, so a worker that just found the queue empty looks again instead of exiting
+_wake_pending = False
+_recovered = False
+
+
+def _max_workers():
+    return getattr(settings, 'SCAN_WORKERS', 4)
+
+
+def _ocr_batch_size():
+    return getattr(settings, 'SCAN_OCR_BATCH_SIZE', 1)
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=_max_workers(), thread_name_prefix='scan-worker')
+    return _executor
+
+
+def enqueue_scan(card_image, owner):
+    """Queue a scan of card_image and make sure a worker will pick it up."""
+    job = ScanJob.objects.create(owner=owner, card_image=card_image)
+    transaction.on_commit(wake_workers)
+    return job
+
+
+def wake_workers():
+    """Start another worker thread if the pool is not already at its limit."""
+    global _active_workers, _wake_pending
+    with _lock:
+        _wake_pending = True
+        if _active_workers >= _max_workers():
+            return
+        _active_workers += 1
+    _get_executor().submit(_worker_loop)
+
+
+def _worker_loop():
+    global _active_workers, _wake_pending
+    try:
+        while True:
+            with _lock:
+                _wake_pending = False
+            # Claimed outside the lock, so workers don't wait on each other's queries
+            jobs = claim_jobs(_ocr_batch_size())
+            if not jobs:
+                with _lock:
+                    if _wake_pending:
+                        continue
+                    _active_workers -= 1
+                    return
+            if len(jobs) == 1:
+                run_job(jobs[0])
+            else:
+                run_jobs(jobs)
+    except Exception:
+        with _lock:
+            _active_workers -= 1
+        raise
+    finally:
+        close_old_connections()
+
+
+def claim_next_job():
+    """Atomically move the oldest queued job to running and return it, or None."""
+    jobs = claim_jobs(1)
+    return jobs[0] if jobs else None
+
+
+def claim_jobs(limit):
+    """Atomically move up to limit of the oldest queued jobs to running and return them."""
+    queued = ScanJob.objects.filter(status=ScanJob.QUEUED)
+    while True:
+        candidates = list(queued.order_by('created_at').values_list('id', flat=True)[:limit])
+        if not candidates:
+            return []
+        # One conditional UPDATE: jobs another worker claimed since are no longer queued and stay theirs
+        token = uuid.uuid4().hex
+        if queued.filter(id__in=candidates).update(status=ScanJob.RUNNING, claim=token, updated_at=timezone.now()):
+            return list(ScanJob.objects.select_related('card_image', 'owner').filter(claim=token).order_by('created_at'))
+
+
+def _set_stage(job, stage):
+    ScanJob.objects.filter(id=job.id).update(stage=stage, updated_at=timezone.now())
+
+
+def _fail(job, error):
+    logger.error("Scan job %s failed", job.id, exc_info=error)
+    ScanJob.objects.filter(id=job.id).update(
+        status=ScanJob.FAILED, error=str(error), updated_at=timezone.now()
+    )
+
+
+def run_job(job):
+    """Run the scan pipeline for a claimed job and store its outcome."""
+    from .pipeline import scan_card_image
+
+    try:
+        payload, http_status = scan_card_image(job.card_image, job.owner, progress=lambda stage: _set_stage(job, stage))
+    except Exception as e:
+        _fail(job, e)
+        return
+
+    _finish(job, payload, http_status)
+
+
+def run_jobs(jobs):
+    """
+    Run several claimed jobs through the batch pipeline: one OCR call, grouped LLM
+    prompts and one bulk insert per owner. A job that fails doesn't fail the others.
+    """
+    from .pipeline import scan_card_images
+
+    by_owner = {}
+    for job in jobs:
+        by_owner.setdefault(job.owner_id, []).append(job)
+
+    for owner_jobs in by_owner.values():
+        try:
+            outcomes = scan_card_images(
+                [job.card_image for job in owner_jobs],
+                owner_jobs[0].owner,
+                progress=lambda stage: _set_stages(owner_jobs, stage),
+            )
+        except Exception as e:
+            for job in owner_jobs:
+                _fail(job, e)
+            continue
+
+        for job, outcome in zip(owner_jobs, outcomes):
+            if isinstance(outcome, Exception):
+                _fail(job, outcome)
+            else:
+                _finish(job, *outcome)
+
+
+def _set_stages(jobs, stage):
+    ScanJob.objects.filter(id__in=[job.id for job in jobs]).update(stage=stage, updated_at=timezone.now())
+
+
+def _finish(job, payload, http_status):
+    ScanJob.objects.filter(id=job.id).update(
+        status=ScanJob.DONE,
+        stage='',
+        result=payload,
+        result_status=http_status,
+        updated_at=timezone.now(),
+    )
+
+
+def requeue_stale_jobs(older_than=timedelta(minutes=10)):
+    """Put jobs left running by a worker that died back on the queue."""
+    cutoff = timezone.now() - older_than
+    return ScanJob.objects.filter(status=ScanJob.RUNNING, updated_at__lt=cutoff).update(
+        status=ScanJob.QUEUED, stage='', updated_at=timezone.now()
+    )
+
+
+def recover_jobs():
+    """
+    Requeue jobs left running by a process that died and start workers for the queue.
+
+    Checks again after SCAN_JOB_STALE_MINUTES while jobs are running, in case their process
+    has died too.
+    """
+    stale_after = timedelta(minutes=getattr(settings, 'SCAN_JOB_STALE_MINUTES', 10))
+    requeued = requeue_stale_jobs(stale_after)
+    if requeued:
+        logger.warning("Requeued %s stale scan job(s)", requeued)
+    if ScanJob.objects.filter(status=ScanJob.QUEUED).exists():
+        wake_workers()
+    if ScanJob.objects.filter(status=ScanJob.RUNNING).exists():
+        timer = threading.Timer(stale_after.total_seconds(), _recover_in_background)
+        timer.daemon = True
+        timer.start()
+
+
+def _recover_in_background():
+    try:
+        recover_jobs()
+    except Exception:
+        logger.exception("Scan job recovery failed")
+    finally:
+        close_old_connections()
+
+
+@receiver(request_started)
+def _recover_on_first_request(sender, **kwargs):
+    # Not in AppConfig.ready: migrate and other commands start without a jobs table to query
+    global _recovered
+    with _lock:
+        if _recovered:
+            return
+        _recovered = True
+    request_started.disconnect(_recover_on_first_request)
+    try:
+        recover_jobs()
+    except Exception:
+        logger.exception("Scan job recovery failed")
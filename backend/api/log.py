@@ -0,0 +1,128 @@
+"""
+Logging for the api app, configured by settings.LOGGING.
+
+Modules log through logging.getLogger(__name__) with %-style arguments, so messages
+are only formatted for records that get written. QueueLogHandler hands records to a
+background thread, which formats and writes them. The request thread only pays for
+an enqueue (and for rendering the message when an argument could change before the
+listener gets to it) and never blocks on stdout.
+
+Verbose payloads (request data, OCR text, upstream responses, LLM answers) go through
+log_payload(). It writes to the 'payload.<module>' logger, which is off unless
+LOG_PAYLOADS is set and then keeps LOG_PAYLOAD_SAMPLE_RATE of the records.
+"""
+import copy
+import json
+import logging
+import queue
+import random
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+
+class QueueLogHandler(QueueHandler):
+    """
+    Queue records for a listener thread that formats them and writes them to stream.
+
+    Records are formatted on the listener thread. Ones whose arguments are all immutable
+    go as they are; the others have their message rendered first, like QueueHandler.prepare
+    does, so the line shows the arguments as they were at the call. If the queue is full,
+    records are dropped and counted rather than blocking the caller.
+    """
+
+    def __init__(self, stream=None, max_size=10000):
+        super().__init__(queue.Queue(max_size))
+        self.target = logging.StreamHandler(stream or sys.stderr)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+        self.listener = QueueListener(self.queue, self.target, respect_handler_level=False)
+        self.listener.start()
+
+    def setFormatter(self, fmt):
+        # dictConfig sets the formatter on this handler; the writing handler is the one that uses it
+        super().setFormatter(fmt)
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # The listener is a thread in this process, so the record can go as is unless the
+        # caller could still change one of its arguments (request.data, a dict, a model...)
+        if record.args and not _immutable_args(record.args):
+            record = copy.copy(record)
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def close(self):
+        # logging.shutdown() closes handlers at exit; stopping the listener writes out what's still queued
+        if self.listener._thread is not None:
+            self.listener.stop()
+        super().close()
+
+
+_IMMUTABLE_TYPES = (str, bytes, int, float, bool, type(None))
+
+
+def _immutable_args(args):
+    return isinstance(args, tuple) and all(isinstance(arg, _IMMUTABLE_TYPES) for arg in args)
+
+
+# LogRecord attributes that aren't passed through extra={...}
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, any extra={...} fields and the traceback."""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SampleFilter(logging.Filter):
+    """Let through a random fraction rate (0-1) of the records from logger name and its children; others all pass."""
+
+    def __init__(self, name='', rate=1.0):
+        super().__init__(name)
+        self.rate = rate
+
+    def filter(self, record):
+        if not super().filter(record):
+            return True
+        return self.rate >= 1 or random.random() < self.rate
+
+
+# logger name -> its payload logger; logging.getLogger takes a lock on every call
+_payload_loggers = {}
+
+
+def payload_logger(logger):
+    """The logger for logger's verbose payloads."""
+    payloads = _payload_loggers.get(logger.name)
+    if payloads is None:
+        payloads = _payload_loggers[logger.name] = logging.getLogger(f'payload.{logger.name}')
+    return payloads
+
+
+def log_payload(logger, message, *args):
+    """Log a verbose payload for logger at DEBUG, if payload logging is enabled."""
+    payloads = payload_logger(logger)
+    if payloads.isEnabledFor(logging.DEBUG):
+        payloads.debug(message, *args)
@@ -0,0 +1,69 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from api.models import CardImage
+from api.ai_card.image_tasks import render_variants
+from api.thumbnails import read_front_image, store_variants, thumbnail_formats, thumbnail_sizes
+
+
+class Command(BaseCommand):
+    help = "Generate thumbnail variants for existing card images, rendering on every core."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Regenerate images that already have variants.")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Rendering processes (default: one per core).")
+
+    def handle(self, *args, **options):
+        images = CardImage.objects.exclude(card_front_image='').order_by('id')
+        if not options['all']:
+            images = images.filter(variants={})
+        ids = list(images.values_list('id', flat=True))
+        self.stdout.write(f"Generating thumbnails for {len(ids)} image(s)")
+        if not ids:
+            return
+
+        sizes, formats = thumbnail_sizes(), thumbnail_formats()
+        quality = getattr(settings, 'THUMBNAIL_QUALITY', 80)
+        workers = max(1, options['workers'])
+        # Forked workers must not share the parent's database connection
+        connections.close_all()
+
+        done = failed = reported = 0
+        pending = {}
+        remaining = iter(ids)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            while True:
+                # Keep a couple of images per worker in flight so file bytes don't pile up in memory
+                while len(pending) < workers * 2:
+                    card_image_id = next(remaining, None)
+                    if card_image_id is None:
+                        break
+                    card_image = CardImage.objects.get(id=card_image_id)
+                    try:
+                        content = read_front_image(card_image)
+                    except OSError as e:
+                        failed += 1
+                        self.stderr.write(f"CardImage {card_image_id}: {e}")
+                        continue
+                    pending[pool.submit(render_variants, content, sizes, formats, quality)] = card_image
+                if not pending:
+                    break
+
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    card_image = pending.pop(future)
+                    try:
+                        store_variants(card_image, future.result())
+                        done += 1
+                    except Exception as e:
+                        failed += 1
+                        self.stderr.write(f"{card_image}: {e}")
+                if (done + failed) // 100 > reported:
+                    reported = (done + failed) // 100
+                    self.stdout.write(f"{done + failed}/{len(ids)}")
+
+        self.stdout.write(f"Generated thumbnails for {done} image(s), {failed} failed")
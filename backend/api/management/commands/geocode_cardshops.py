@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from api.geocoding import ADDRESS_FIELDS, full_address, geocode
+from api.models import CardShop
+
+
+class Command(BaseCommand):
+    help = "Geocode the addresses of card shops that don't have coordinates yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Geocode every shop again, not just those without coordinates.")
+
+    def handle(self, *args, **options):
+        shops = CardShop.objects.all() if options['all'] else CardShop.objects.filter(latitude__isnull=True)
+        located = failed = 0
+        for shop in shops.only('id', 'latitude', 'longitude', *ADDRESS_FIELDS).iterator():
+            point = geocode(full_address({name: getattr(shop, name) for name in ADDRESS_FIELDS}))
+            if point is None:
+                failed += 1
+                continue
+            shop.latitude, shop.longitude = point
+            shop.save(update_fields=['latitude', 'longitude'])
+            located += 1
+        self.stdout.write(f"Located {located} shop(s); {failed} could not be geocoded.")
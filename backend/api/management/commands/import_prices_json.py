@@ -0,0 +1,49 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.models import Card, CachedPrice
+
+
+class Command(BaseCommand):
+    help = "One-time import of the legacy prices.json file into the CachedPrice table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=os.path.join(settings.BASE_DIR, 'prices.json'))
+        parser.add_argument('--overwrite', action='store_true', help="Replace prices that are already cached.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f"{path} does not exist.")
+
+        with open(path, "r") as f:
+            card_prices = json.load(f)
+
+        # prices.json didn't record the company, so borrow it from a matching card if there is one
+        companies = {}
+        for name, set, number, company in Card.objects.values_list('name', 'set', 'number', 'card_company'):
+            companies.setdefault(f"{name} {set} {number}", company)
+
+        now = timezone.now()
+        rows = [
+            CachedPrice(key=key, card_company=companies.get(key, ''), price=price, fetched_at=now)
+            for key, price in card_prices.items()
+            if isinstance(price, (int, float)) and not isinstance(price, bool)
+        ]
+        skipped = len(card_prices) - len(rows)
+
+        if options['overwrite']:
+            CachedPrice.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['key'],
+                update_fields=['card_company', 'price', 'fetched_at'],
+            )
+        else:
+            CachedPrice.objects.bulk_create(rows, ignore_conflicts=True)
+
+        self.stdout.write(f"Imported {len(rows)} price(s) from {path}, skipped {skipped} non-numeric entries.")
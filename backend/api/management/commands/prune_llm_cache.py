@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+# Importing the card modules registers their current prompt versions
+from api.ai_card import text_to_card  # noqa: F401
+from api.card_types import magic, pokemon  # noqa: F401
+from api.ai_card.llm_cache import prune
+
+
+class Command(BaseCommand):
+    help = "Evict outdated, old and overflow entries from the LLM identification memo."
+
+    def handle(self, *args, **options):
+        deleted = prune()
+        self.stdout.write(f"Deleted {deleted} cached LLM result(s).")
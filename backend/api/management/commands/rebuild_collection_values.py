@@ -0,0 +1,20 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from api.collection_value import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recompute the running collection value totals from the cards and cached prices."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Only rebuild this username's totals.")
+
+    def handle(self, *args, **options):
+        owner = None
+        if options['user']:
+            owner = User.objects.filter(username=options['user']).first()
+            if owner is None:
+                raise CommandError(f"No user named {options['user']!r}.")
+        groups = rebuild(owner)
+        self.stdout.write(f"Rebuilt {groups} collection value group(s).")
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.price_refresh import due_prices, rate_limiters, refresh_budgets, refresh_prices
+
+
+class Command(BaseCommand):
+    help = "Refresh the prices of owned cards before they expire, most valuable and stalest first."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Keep running, starting a new run every --interval seconds.")
+        parser.add_argument('--interval', type=float, default=15 * 60, help="Seconds between the starts of runs with --loop.")
+        parser.add_argument('--dry-run', action='store_true', help="List the due prices without fetching them.")
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            for row in due_prices():
+                fetched = row['fetched_at'].isoformat() if row['fetched_at'] else 'never'
+                self.stdout.write(f"{row['priority']:8.2f}  {row['price_key']}  (x{row['copies']}, fetched {fetched})")
+            return
+
+        budgets = refresh_budgets()
+        limiters = rate_limiters(budgets)
+        while True:
+            started = time.monotonic()
+            counts = refresh_prices(budgets=budgets, limiters=limiters)
+            for upstream, count in counts.items():
+                self.stdout.write(
+                    f"{upstream}: {count['refreshed']} refreshed, {count['failed']} failed, "
+                    f"{count['deferred']} deferred to the next run"
+                )
+            if not options['loop']:
+                return
+            time.sleep(max(0.0, options['interval'] - (time.monotonic() - started)))
@@ -0,0 +1,39 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.jobs import claim_jobs, requeue_stale_jobs, run_job, run_jobs
+
+
+class Command(BaseCommand):
+    help = "Process queued scan jobs outside the web workers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit when the queue is empty.")
+        parser.add_argument('--poll', type=float, default=1.0, help="Seconds to wait between polls of an empty queue.")
+        parser.add_argument(
+            '--stale-minutes', type=int, default=getattr(settings, 'SCAN_JOB_STALE_MINUTES', 10),
+            help="Requeue jobs stuck in running for this long.",
+        )
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_jobs(timedelta(minutes=options['stale_minutes']))
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} stale job(s).")
+
+        batch_size = getattr(settings, 'SCAN_OCR_BATCH_SIZE', 1)
+        while True:
+            jobs = claim_jobs(batch_size)
+            if not jobs:
+                if options['once']:
+                    return
+                time.sleep(options['poll'])
+                continue
+            for job in jobs:
+                self.stdout.write(f"Running {job}")
+            if len(jobs) == 1:
+                run_job(jobs[0])
+            else:
+                run_jobs(jobs)
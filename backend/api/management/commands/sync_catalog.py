@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from api.catalog import sync_magic, sync_pokemon, write_card_names
+
+
+class Command(BaseCommand):
+    help = "Mirror the PokémonTCG and Scryfall catalogs into local tables for offline lookups."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pokemon', action='store_true', help="Only sync Pokémon.")
+        parser.add_argument('--magic', action='store_true', help="Only sync Magic the Gathering.")
+        parser.add_argument('--full', action='store_true', help="Re-fetch everything instead of only what changed.")
+        parser.add_argument('--names-only', action='store_true', help="Just rewrite card_names.txt from the mirror.")
+
+    def handle(self, *args, **options):
+        if options['names_only']:
+            count = write_card_names()
+            self.stdout.write(f"Wrote {count} Pokémon names to card_names.txt")
+            return
+
+        both = not options['pokemon'] and not options['magic']
+        if options['pokemon'] or both:
+            written = sync_pokemon(full=options['full'], log=self.stdout.write)
+            self.stdout.write(f"Synced {written} Pokémon cards")
+        if options['magic'] or both:
+            written = sync_magic(full=options['full'], log=self.stdout.write)
+            self.stdout.write(f"Synced {written} Magic cards")
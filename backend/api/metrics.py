@@ -0,0 +1,271 @@
+"""
+Request and pipeline stage metrics, exported in the Prometheus text format at /metrics.
+
+Code wraps each pipeline stage in `with stage('ocr'):`. The time goes into the
+cruzin_stage_seconds histogram, and into the breakdown of the request being served, if
+there is one. MetricsMiddleware times every request. With SLOW_REQUEST_SECONDS set, it
+logs the stage breakdown of any request slower than that.
+
+Upstream request counts come from http_client's per-host stats and dedup hits from
+dedup_stats(), read when /metrics is scraped. Metrics are kept per process, so each
+gunicorn or uvicorn worker reports its own.
+"""
+import contextvars
+import hmac
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+logger = logging.getLogger(__name__)
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        lines += [f'{self.name}{_labels(self.labelnames, key)} {_number(value)}' for key, value in values]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=STAGE_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        # labels -> [bucket counts..., sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        with self._lock:
+            values = sorted((key, list(series)) for key, series in self._values.items())
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for key, series in values:
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, [("le", _number(bound))])} {count}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, key)} {_number(series[-2])}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, key)} {series[-1]}')
+        return lines
+
+
+_registry = []
+
+REQUEST_SECONDS = Histogram(
+    'cruzin_request_seconds', 'Time to serve a request, by route, method and status.',
+    ['route', 'method', 'status'],
+)
+STAGE_SECONDS = Histogram('cruzin_stage_seconds', 'Time spent in each pipeline stage.', ['stage'])
+STAGE_ERRORS = Counter('cruzin_stage_errors_total', 'Pipeline stages that raised.', ['stage'])
+CACHE_LOOKUPS = Counter('cruzin_cache_lookups_total', 'Cache lookups by cache and result (hit or miss).', ['cache', 'result'])
+MANUAL_FALLBACKS = Counter(
+    'cruzin_manual_fallbacks_total', 'Scans handed back to the user to identify, by card company.', ['card_company'],
+)
+
+
+def count_cache(cache, hit, count=1):
+    if count:
+        CACHE_LOOKUPS.inc(count, cache=cache, result='hit' if hit else 'miss')
+
+
+# Request stage breakdown
+
+# The [(stage, seconds)] list of the request being served in this context, if any
+_request_stages = contextvars.ContextVar('request_stages', default=None)
+
+
+def record_stage(name, seconds):
+    STAGE_SECONDS.observe(seconds, stage=name)
+    stages = _request_stages.get()
+    if stages is not None:
+        stages.append((name, seconds))
+
+
+@contextmanager
+def stage(name):
+    """Time the block as pipeline stage name."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def record_stages(timings):
+    """Record {stage: seconds} measured elsewhere, e.g. by a task on the image pool."""
+    for name, seconds in (timings or {}).items():
+        record_stage(name, seconds)
+
+
+def stage_breakdown(stages):
+    """Sum the time of repeated stages, in the order they first ran."""
+    totals = {}
+    for name, seconds in stages:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return totals
+
+
+class MetricsMiddleware:
+    """Time every request, collect its stage breakdown and log the slow ones."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stages = []
+        token = _request_stages.set(stages)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_stages.reset(token)
+        self._finish(request, response, time.perf_counter() - start, stages)
+        return response
+
+    async def __acall__(self, request):
+        stages = []
+        token = _request_stages.set(stages)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_stages.reset(token)
+        self._finish(request, response, time.perf_counter() - start, stages)
+        return response
+
+    def _finish(self, request, response, elapsed, stages):
+        match = getattr(request, 'resolver_match', None)
+        route = match.route if match is not None else 'unmatched'
+        REQUEST_SECONDS.observe(elapsed, route=route, method=request.method, status=response.status_code)
+
+        threshold = getattr(settings, 'SLOW_REQUEST_SECONDS', None)
+        if threshold is not None and elapsed >= threshold:
+            breakdown = stage_breakdown(stages)
+            logger.warning(
+                "Slow request: %s %s %s in %.3fs (%s)", request.method, request.path, response.status_code, elapsed,
+                ', '.join(f"{name} {seconds:.3f}s" for name, seconds in breakdown.items()) or 'no stages recorded',
+                extra={'duration': elapsed, 'stages': breakdown},
+            )
+
+
+# Exposition
+
+def _upstream_lines():
+    from .card_types.http_client import metrics as upstream_metrics
+
+    hosts = sorted(upstream_metrics().items())
+    lines = [
+        '# HELP cruzin_upstream_requests_total Requests to each upstream host.',
+        '# TYPE cruzin_upstream_requests_total counter',
+    ]
+    lines += [f'cruzin_upstream_requests_total{_labels(["host"], [host])} {stats["requests"]}' for host, stats in hosts]
+    lines += [
+        '# HELP cruzin_upstream_errors_total Upstream requests that failed (connection errors, 429 and 5xx).',
+        '# TYPE cruzin_upstream_errors_total counter',
+    ]
+    lines += [f'cruzin_upstream_errors_total{_labels(["host"], [host])} {stats["failures"]}' for host, stats in hosts]
+    lines += [
+        '# HELP cruzin_upstream_responses_total Upstream responses by host and status code.',
+        '# TYPE cruzin_upstream_responses_total counter',
+    ]
+    for host, stats in hosts:
+        for code, count in sorted(stats['status_counts'].items(), key=lambda item: str(item[0])):
+            lines.append(f'cruzin_upstream_responses_total{_labels(["host", "status"], [host, code])} {count}')
+    return lines
+
+
+def _dedup_lines():
+    from .dedup import dedup_stats
+
+    stats = dedup_stats()
+    lines = [
+        '# HELP cruzin_scan_dedup_total Scan deduplication lookups by result.',
+        '# TYPE cruzin_scan_dedup_total counter',
+    ]
+    for result in ('exact_hits', 'near_hits', 'misses'):
+        lines.append(f'cruzin_scan_dedup_total{_labels(["result"], [result])} {stats[result]}')
+    return lines
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines += metric.render()
+    lines += _upstream_lines()
+    lines += _dedup_lines()
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """GET /metrics, for scrapers sending settings.METRICS_TOKEN as a bearer token. Without a token set it's a 404."""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if not token:
+        raise Http404
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=401)
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
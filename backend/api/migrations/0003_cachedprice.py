@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_scanjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CachedPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True)),
+                ('card_company', models.CharField(blank=True, default='', max_length=50)),
+                ('price', models.FloatField()),
+                ('fetched_at', models.DateTimeField()),
+            ],
+        ),
+    ]
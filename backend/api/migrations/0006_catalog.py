@@ -0,0 +1,57 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_llmresult'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogSyncState',
+            fields=[
+                ('source', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('state', models.JSONField(default=dict)),
+                ('synced_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MagicCatalogCard',
+            fields=[
+                ('id', models.UUIDField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=200)),
+                ('name_key', models.CharField(max_length=200)),
+                ('set_code', models.CharField(max_length=10)),
+                ('set_name', models.CharField(max_length=100)),
+                ('collector_number', models.CharField(max_length=20)),
+                ('released_at', models.DateField(blank=True, null=True)),
+                ('year', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('prices', models.JSONField(blank=True, null=True)),
+                ('synced_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['name_key', 'year'], name='api_magicca_name_ke_b3443c_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PokemonCatalogCard',
+            fields=[
+                ('id', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=100)),
+                ('name_key', models.CharField(max_length=100)),
+                ('number', models.CharField(max_length=20)),
+                ('set_id', models.CharField(max_length=50)),
+                ('set_name', models.CharField(max_length=100)),
+                ('printed_total', models.PositiveIntegerField(blank=True, null=True)),
+                ('release_date', models.DateField(blank=True, null=True)),
+                ('prices', models.JSONField(blank=True, null=True)),
+                ('synced_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['name_key', 'number'], name='api_pokemon_name_ke_079799_idx')],
+            },
+        ),
+    ]
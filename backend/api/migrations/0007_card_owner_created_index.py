@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_catalog'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['owner', 'created_at', 'id'], name='api_card_owner_i_e15bcb_idx'),
+        ),
+    ]
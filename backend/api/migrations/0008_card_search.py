@@ -0,0 +1,111 @@
+# Generated by Django 5.1.7 on 2026-10-18 13:00
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.utils import OperationalError
+
+
+SQLITE_FTS = [
+    """CREATE VIRTUAL TABLE api_card_fts USING fts5(
+        name, "set", number,
+        content='api_card', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER api_card_fts_ai AFTER INSERT ON api_card BEGIN
+        INSERT INTO api_card_fts(rowid, name, "set", number) VALUES (new.id, new.name, new."set", new.number);
+    END""",
+    """CREATE TRIGGER api_card_fts_ad AFTER DELETE ON api_card BEGIN
+        INSERT INTO api_card_fts(api_card_fts, rowid, name, "set", number) VALUES ('delete', old.id, old.name, old."set", old.number);
+    END""",
+    """CREATE TRIGGER api_card_fts_au AFTER UPDATE OF name, "set", number ON api_card BEGIN
+        INSERT INTO api_card_fts(api_card_fts, rowid, name, "set", number) VALUES ('delete', old.id, old.name, old."set", old.number);
+        INSERT INTO api_card_fts(rowid, name, "set", number) VALUES (new.id, new.name, new."set", new.number);
+    END""",
+    "INSERT INTO api_card_fts(api_card_fts) VALUES ('rebuild')",
+]
+
+SQLITE_FTS_REVERSE = [
+    "DROP TRIGGER IF EXISTS api_card_fts_ai",
+    "DROP TRIGGER IF EXISTS api_card_fts_ad",
+    "DROP TRIGGER IF EXISTS api_card_fts_au",
+    "DROP TABLE IF EXISTS api_card_fts",
+]
+
+# icontains on PostgreSQL compiles to UPPER(col) LIKE UPPER(%s), which these can serve
+POSTGRES_TRGM = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS api_card_name_trgm ON api_card USING gin (UPPER(name) gin_trgm_ops)",
+    'CREATE INDEX IF NOT EXISTS api_card_set_trgm ON api_card USING gin (UPPER("set") gin_trgm_ops)',
+    "CREATE INDEX IF NOT EXISTS api_card_number_trgm ON api_card USING gin (UPPER(number) gin_trgm_ops)",
+]
+
+POSTGRES_TRGM_REVERSE = [
+    "DROP INDEX IF EXISTS api_card_name_trgm",
+    "DROP INDEX IF EXISTS api_card_set_trgm",
+    "DROP INDEX IF EXISTS api_card_number_trgm",
+]
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        try:
+            schema_editor.execute(SQLITE_FTS[0])
+        except OperationalError:
+            # SQLite built without FTS5: search falls back to icontains
+            return
+        for statement in SQLITE_FTS[1:]:
+            schema_editor.execute(statement)
+    elif vendor == 'postgresql':
+        for statement in POSTGRES_TRGM:
+            schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        statements = SQLITE_FTS_REVERSE
+    elif vendor == 'postgresql':
+        statements = POSTGRES_TRGM_REVERSE
+    else:
+        return
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def fill_price_keys(apps, schema_editor):
+    Card = apps.get_model('api', 'Card')
+    cards = list(Card.objects.only('id', 'name', 'set', 'number', 'card_company'))
+    for card in cards:
+        number = card.number.split("/")[0] if card.card_company == "Pokémon" else card.number
+        card.price_key = f"{card.name} {card.set} {number}"
+    Card.objects.bulk_update(cards, ['price_key'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_card_owner_created_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='price_key',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['owner', 'name'], name='api_card_owner_i_773b02_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['owner', 'card_company'], name='api_card_owner_i_d7898e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['owner', 'is_graded', 'grade'], name='api_card_owner_i_d94154_idx'),
+        ),
+        migrations.RunPython(fill_price_keys, migrations.RunPython.noop),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
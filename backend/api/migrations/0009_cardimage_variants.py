@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_card_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cardimage',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.7 on 2026-10-18 09:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_scanbatch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255)),
+                ('card_company', models.CharField(blank=True, default='', max_length=50)),
+                ('price', models.FloatField()),
+                ('fetched_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['key', 'fetched_at'], name='api_pricesn_key_a7c98b_idx')],
+            },
+        ),
+    ]
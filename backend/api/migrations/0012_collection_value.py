@@ -0,0 +1,53 @@
+# Generated by Django 5.1.7 on 2026-10-18 09:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_pricesnapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollectionMover',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price_key', models.CharField(max_length=255)),
+                ('name', models.CharField(max_length=20)),
+                ('set', models.CharField(max_length=20)),
+                ('number', models.CharField(max_length=20)),
+                ('card_company', models.CharField(max_length=20)),
+                ('copies', models.PositiveIntegerField()),
+                ('previous_price', models.FloatField()),
+                ('price', models.FloatField()),
+                ('change', models.FloatField()),
+                ('abs_change', models.FloatField()),
+                ('changed_at', models.DateTimeField()),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='collection_movers', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', '-abs_change'], name='api_collect_owner_i_d0d49c_idx')],
+                'constraints': [models.UniqueConstraint(fields=('owner', 'price_key'), name='unique_collection_mover')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CollectionValue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('card_company', models.CharField(max_length=20)),
+                ('set', models.CharField(max_length=20)),
+                ('cards', models.IntegerField(default=0)),
+                ('priced_cards', models.IntegerField(default=0)),
+                ('value', models.FloatField(default=0.0)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='collection_values', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('owner', 'card_company', 'set'), name='unique_collection_value_group')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-18 09:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_collection_value'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cardshop',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=12),
+        ),
+        migrations.AddField(
+            model_name='cardshop',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='cardshop',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.7 on 2026-10-18 09:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_cardshop_location'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cardimage',
+            name='reuse_match',
+            field=models.CharField(blank=True, choices=[('exact', 'Exact'), ('near', 'Near')], default='', max_length=5),
+        ),
+        migrations.AddField(
+            model_name='cardimage',
+            name='reused_from',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.cardimage'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 09:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_cardimage_reuse'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scanjob',
+            name='claim',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=32),
+        ),
+    ]
@@ -1,5 +1,7 @@
+import uuid
 from django.db import models
 from django.contrib.auth.models import User
+from .geo import encode
 
 # Create your models here.
 class CardImage(models.Model):
@@ -7,10 +9,31 @@ class CardImage(models.Model):
     card_back_image = models.ImageField(upload_to='images/')
     combined_image = models.ImageField(upload_to='combined_images/', null=True, blank=True)
     extracted_text = models.TextField(blank=True, null=True)
+    # Fingerprints of the front image, used to reuse the results of earlier scans
+    sha256 = models.CharField(max_length=64, null=True, blank=True, db_index=True)
+    dhash = models.CharField(max_length=16, null=True, blank=True)
+    dhash_band0 = models.PositiveIntegerField(null=True, blank=True, db_index=True)
+    dhash_band1 = models.PositiveIntegerField(null=True, blank=True, db_index=True)
+    dhash_band2 = models.PositiveIntegerField(null=True, blank=True, db_index=True)
+    dhash_band3 = models.PositiveIntegerField(null=True, blank=True, db_index=True)
+    # Resized copies of the front image, '<width>.<format>' -> storage name (see api/thumbnails.py)
+    variants = models.JSONField(default=dict, blank=True)
+    # The earlier scan whose results this one reused (see api/dedup.py), and whether the
+    # upload was byte-identical ('exact', which also reuses its combined image) or 'near'
+    reused_from = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    reuse_match = models.CharField(
+        max_length=5, blank=True, default='', choices=[('exact', 'Exact'), ('near', 'Near')],
+    )
 
     def __str__(self):
         return f"CardImage {self.id}"
 
+def price_key(company, name, set, number):
+    """Price cache key for a card. Pokémon numbers drop the printed total ("65/105" -> "65")."""
+    if company == "Pokémon":
+        number = number.split("/")[0]
+    return f"{name} {set} {number}"
+
 class Card(models.Model):
     id = models.BigAutoField(primary_key=True)
     name = models.CharField(max_length=20)
@@ -29,9 +52,27 @@ class Card(models.Model):
     )
     card_image = models.OneToOneField(CardImage, on_delete=models.CASCADE)
     owner = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Denormalized CachedPrice key, kept in sync by save() (bulk_create callers must set it)
+    price_key = models.CharField(max_length=255, blank=True, default='', db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Serves the owner's collection list in cursor order
+            models.Index(fields=['owner', 'created_at', 'id']),
+            models.Index(fields=['owner', 'name']),
+            models.Index(fields=['owner', 'card_company']),
+            models.Index(fields=['owner', 'is_graded', 'grade']),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.price_key = price_key(self.card_company, self.name, self.set, self.number)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'name', 'set', 'number', 'card_company'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'price_key'}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.name} {self.set} {self.number}"
 
@@ -47,5 +88,202 @@ class CardShop(models.Model):
     country = models.CharField(max_length=100)
     phone = models.CharField(max_length=20, null=True, blank=True)
     website = models.URLField(null=True, blank=True)
+    # Geocoded from the address unless the client sends them (api/geocoding.py)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    # Geohash of the coordinates, kept in sync by save(); '' when they're unknown (api/geo.py)
+    geohash = models.CharField(max_length=12, blank=True, default='', db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def save(self, *args, **kwargs):
+        located = self.latitude is not None and self.longitude is not None
+        self.geohash = encode(self.latitude, self.longitude) if located else ''
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+        super().save(*args, **kwargs)
+
+class ScanBatch(models.Model):
+    """A bulk upload queued as one ScanJob per front/back pair."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='scan_batches')
+    total = models.PositiveIntegerField(default=0)
+    # Pairs that were rejected before queueing: [{'index', 'name', 'errors'}]
+    rejected = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"ScanBatch {self.id} ({self.total} cards)"
+
+class ScanJob(models.Model):
+    """A queued scan of an uploaded CardImage, processed by the background worker pool."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='scan_jobs')
+    card_image = models.ForeignKey(CardImage, on_delete=models.CASCADE, related_name='scan_jobs')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    stage = models.CharField(max_length=20, blank=True, default='')
+    result = models.JSONField(null=True, blank=True)
+    result_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+    # Set for jobs queued by a bulk upload: the batch, and the pair's position and name in it
+    batch = models.ForeignKey(ScanBatch, on_delete=models.CASCADE, null=True, blank=True, related_name='jobs')
+    batch_index = models.PositiveIntegerField(null=True, blank=True)
+    batch_name = models.CharField(max_length=255, blank=True, default='')
+    # Token of the claim_jobs call that moved the job to running
+    claim = models.CharField(max_length=32, blank=True, default='', db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"ScanJob {self.id} ({self.status})"
+
+class CachedPrice(models.Model):
+    """Last fetched market price for a card, keyed the same way prices.json was ("name set number")."""
+    key = models.CharField(max_length=255, unique=True)
+    card_company = models.CharField(max_length=50, blank=True, default='')
+    price = models.FloatField()
+    fetched_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.key}: {self.price}"
+
+class PriceSnapshot(models.Model):
+    """A price fetched for a CachedPrice key, kept as the key's price history."""
+    key = models.CharField(max_length=255)
+    card_company = models.CharField(max_length=50, blank=True, default='')
+    price = models.FloatField()
+    fetched_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['key', 'fetched_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.key}: {self.price} at {self.fetched_at}"
+
+class CollectionValue(models.Model):
+    """Running totals of one user's cards in one (card_company, set), kept up to date by api/collection_value.py."""
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='collection_values')
+    card_company = models.CharField(max_length=20)
+    set = models.CharField(max_length=20)
+    cards = models.IntegerField(default=0)
+    # Cards with a cached price, and the sum of those prices
+    priced_cards = models.IntegerField(default=0)
+    value = models.FloatField(default=0.0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'card_company', 'set'], name='unique_collection_value_group'),
+        ]
+
+    def __str__(self):
+        return f"{self.owner_id} {self.card_company} {self.set}: {self.value}"
+
+class CollectionMover(models.Model):
+    """The last price change of a card in a user's collection, and what it did to the collection's value."""
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='collection_movers')
+    price_key = models.CharField(max_length=255)
+    name = models.CharField(max_length=20)
+    set = models.CharField(max_length=20)
+    number = models.CharField(max_length=20)
+    card_company = models.CharField(max_length=20)
+    copies = models.PositiveIntegerField()
+    previous_price = models.FloatField()
+    price = models.FloatField()
+    # (price - previous_price) * copies, and its absolute value to rank movers by
+    change = models.FloatField()
+    abs_change = models.FloatField()
+    changed_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'price_key'], name='unique_collection_mover'),
+        ]
+        indexes = [
+            models.Index(fields=['owner', '-abs_change']),
+        ]
+
+    def __str__(self):
+        return f"{self.owner_id} {self.price_key}: {self.change:+}"
+
+class LLMResult(models.Model):
+    """Validated LLM identification for a piece of OCR text, keyed on the text, prompt version and model."""
+    key = models.CharField(max_length=64, unique=True)
+    kind = models.CharField(max_length=20)
+    prompt_version = models.CharField(max_length=16)
+    model = models.CharField(max_length=100)
+    result = models.JSONField()
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.kind} {self.key[:12]}"
+
+class PokemonCatalogCard(models.Model):
+    """Local mirror of a pokemontcg.io card, filled by the sync_catalog command."""
+    id = models.CharField(max_length=50, primary_key=True)
+    name = models.CharField(max_length=100)
+    name_key = models.CharField(max_length=100)
+    number = models.CharField(max_length=20)
+    set_id = models.CharField(max_length=50)
+    set_name = models.CharField(max_length=100)
+    printed_total = models.PositiveIntegerField(null=True, blank=True)
+    release_date = models.DateField(null=True, blank=True)
+    prices = models.JSONField(null=True, blank=True)
+    synced_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['name_key', 'number']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} {self.set_name} {self.number}"
+
+
+class MagicCatalogCard(models.Model):
+    """Local mirror of a Scryfall printing, filled from Scryfall's bulk data by sync_catalog."""
+    id = models.UUIDField(primary_key=True)
+    name = models.CharField(max_length=200)
+    name_key = models.CharField(max_length=200)
+    set_code = models.CharField(max_length=10)
+    set_name = models.CharField(max_length=100)
+    collector_number = models.CharField(max_length=20)
+    released_at = models.DateField(null=True, blank=True)
+    year = models.PositiveSmallIntegerField(null=True, blank=True)
+    prices = models.JSONField(null=True, blank=True)
+    synced_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['name_key', 'year']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} {self.set_name} {self.collector_number}"
+
+
+class CatalogSyncState(models.Model):
+    """Bookkeeping for incremental catalog syncs (per-set timestamps, bulk file version)."""
+    source = models.CharField(max_length=20, primary_key=True)
+    state = models.JSONField(default=dict)
+    synced_at = models.DateTimeField(null=True, blank=True)
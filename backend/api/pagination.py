@@ -0,0 +1,16 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class CardCursorPagination(CursorPagination):
+    """Newest cards first. Cursors stay stable while cards are added, unlike page numbers."""
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class NearbyPagination(PageNumberPagination):
+    """Pages of a distance-sorted list of shops."""
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -0,0 +1,482 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from rest_framework import status
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from .models import Card, CardImage, price_key
+from .collection_value import add_cards
+from .dedup import find_previous_scan, fingerprint_card_image
+from .serializers import CardSerializer
+from .image_work import run_image_task, scan_image_limits
+from .log import log_payload
+from .metrics import MANUAL_FALLBACKS, stage
+from .ai_card.card_to_text import extract_text_from_bytes, extract_text_from_images
+from .ai_card.image_tasks import combine_task
+from .ai_card.text_to_card import create_card, create_cards
+from .card_types.magic import ai_name_year_magic, ai_name_year_magic_many, magic_name_and_year
+from .price_cache import is_price, store_price
+from .card_types.pokemon import (
+    PokemonAPIError, ai_name_set_number_pokemon, ai_name_set_number_pokemon_many, lookup_pokemon_card,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# Card fields that come from identifying the scan, as opposed to who owns it
+IDENTIFICATION_FIELDS = [
+    'name', 'number', 'set', 'card_company', 'numeration',
+    'autograph', 'is_graded', 'grade', 'grade_company',
+]
+
+
+# CardImage fields the scan writes; saving only these leaves fingerprints and thumbnails
+# written concurrently by other code alone
+SCAN_FIELDS = ['extracted_text', 'combined_image', 'reused_from', 'reuse_match']
+
+
+def _no_progress(stage):
+    pass
+
+
+def scan_card_image(card_image, owner, progress=_no_progress, images=None, combined=None):
+    """
+    Run the scan pipeline for an uploaded CardImage.
+
+    Combines the front and back images, extracts the text with Google Vision and
+    identifies the card. Returns a (payload, http_status) tuple where payload is either
+    the serialized Card or the 'manual' fallback the app uses to ask the user.
+    progress is called with the name of each stage as it starts. images is an optional
+    (front, back) pair of the uploaded bytes, to avoid reading them back from storage, and
+    combined the already combined JPEG.
+    """
+    progress('dedup')
+    reused = reuse_previous_scan(card_image, owner, images, combined)
+    if reused is not None:
+        return reused
+
+    progress('combine')
+    combined_bytes = prepare_card_image(card_image, images, combined)
+
+    # Extract text using Google Cloud Vision, straight from the encoded bytes
+    progress('ocr')
+    with stage('ocr'):
+        extracted_text = extract_text_from_bytes(combined_bytes)
+
+    progress('identify')
+    return finish_scan(card_image, owner, extracted_text)
+
+
+def reuse_previous_scan(card_image, owner, images=None, combined=None):
+    """
+    Skip OCR (and the LLM, when the card was identified) for an image owner has already scanned.
+
+    Returns the pipeline result, or None if no earlier scan matches.
+    """
+    previous = copy_previous_scan(card_image, owner)
+    if previous is None:
+        return None
+    if not card_image.combined_image:
+        prepare_card_image(card_image, images, combined)
+    card_image.save(update_fields=SCAN_FIELDS)
+
+    previous_card = Card.objects.filter(card_image=previous).first()
+    if previous_card is None:
+        return identify_card(card_image.extracted_text, card_image, owner)
+
+    with stage('db_write'):
+        card = Card.objects.create(**copied_card_fields(previous_card, owner, card_image))
+    return CardSerializer(card).data, status.HTTP_201_CREATED
+
+
+def copy_previous_scan(card_image, owner):
+    """
+    Copy owner's earlier scan of the same card onto card_image (unsaved), recording the reuse.
+
+    The OCR text is always copied. The combined image is only shared when the upload is
+    byte-identical; otherwise card_image still needs its own. Returns the earlier CardImage,
+    or None.
+    """
+    previous = find_previous_scan(card_image, owner)
+    if previous is None:
+        return None
+
+    exact = previous.sha256 == card_image.sha256
+    logger.info("Reusing %s scan of %s for %s", 'exact' if exact else 'near', previous, card_image)
+    card_image.extracted_text = previous.extracted_text
+    card_image.reused_from = previous
+    card_image.reuse_match = 'exact' if exact else 'near'
+    if exact and previous.combined_image:
+        card_image.combined_image = previous.combined_image.name
+    return previous
+
+
+def copied_card_fields(previous_card, owner, card_image):
+    return {
+        'owner': owner,
+        'card_image': card_image,
+        **{field: getattr(previous_card, field) for field in IDENTIFICATION_FIELDS},
+    }
+
+
+def read_file(field_file):
+    """Read a stored image field's bytes through its storage backend."""
+    field_file.open('rb')
+    try:
+        return field_file.read()
+    finally:
+        field_file.close()
+
+
+def prepare_card_image(card_image, images=None, combined_bytes=None):
+    """Combine the front and back images (on the image pool), store the result and return its JPEG bytes."""
+    if combined_bytes is None:
+        if images is None:
+            images = (read_file(card_image.card_front_image), read_file(card_image.card_back_image))
+        with stage('combine'):
+            combined_bytes = run_image_task(combine_task, *images, *scan_image_limits(), block=True)
+
+    # Save the combined image
+    combined_image_content = ContentFile(combined_bytes, name=f'combined_{card_image.id}.jpg')
+    with stage('image_save'):
+        card_image.combined_image.save(combined_image_content.name, combined_image_content, save=False)
+    return combined_bytes
+
+
+def finish_scan(card_image, owner, extracted_text):
+    """Store the OCR text on the image and identify the card from it."""
+    store_extracted_text(card_image, extracted_text)
+    return identify_card(extracted_text, card_image, owner)
+
+
+def store_extracted_text(card_image, extracted_text):
+    card_image.extracted_text = extracted_text
+    with stage('db_write'):
+        card_image.save(update_fields=SCAN_FIELDS)
+
+    log_payload(logger, "OCR text of %s: %s", card_image, extracted_text)
+
+
+def identify_card(extracted_text, card_image, owner):
+    """Identify the card from its OCR text and create it, or return the manual fallback."""
+    if "MAGIC" in extracted_text:
+        magic_card = ai_name_year_magic(extracted_text)
+        with stage('lookup'):
+            magic_info = magic_name_and_year(magic_card.name, magic_card.year)
+        if not magic_info:
+            return manual_payload(magic_card.name, magic_card.year, 'Magic the Gathering', card_image)
+        card = create_magic_card(owner, card_image, magic_info)
+    elif "Pokémon" in extracted_text:
+        pokemon_card = ai_name_set_number_pokemon(extracted_text)
+        pokemon_card.set_number = clean_pokemon_number(pokemon_card.set_number)
+
+        try:
+            with stage('lookup'):
+                match = lookup_pokemon_card(pokemon_card.name, pokemon_card.set_number)
+        except PokemonAPIError as e:
+            logger.warning("PokémonTCG lookup failed: %s", e)
+            match = None
+        if not confident_match(match):
+            return manual_payload(pokemon_card.name, pokemon_card.set_number, 'Pokémon', card_image)
+        card = create_pokemon_card(owner, card_image, match.card, pokemon_card.set_number)
+        cache_match_price(card, match)
+    else:
+        card_data = create_card(extracted_text)
+        card = create_generic_card(owner, card_image, card_data)
+
+    return CardSerializer(card).data, status.HTTP_201_CREATED
+
+
+def scan_card_images(card_images, owner, images=None, combined=None, progress=_no_progress):
+    """
+    Run the scan pipeline for several CardImages at once.
+
+    Works like scan_card_image, but the OCR goes to the backend as one batch call, the LLM
+    identifies the texts in grouped prompts, lookups run concurrently and the new cards
+    are inserted with one bulk_create. images and combined are optional lists matching
+    card_images. Returns one (payload, http_status) per image, or the exception that failed
+    it, so one bad image doesn't fail the others.
+    """
+    count = len(card_images)
+    images = images or [None] * count
+    combined = combined or [None] * count
+    outcomes = [None] * count
+    texts = [None] * count
+    cards = {}
+
+    progress('dedup')
+    for index, card_image in enumerate(card_images):
+        try:
+            if not card_image.sha256:
+                fingerprint_card_image(card_image, content=images[index][0] if images[index] else None)
+            previous = copy_previous_scan(card_image, owner)
+            if previous is None:
+                continue
+            texts[index] = card_image.extracted_text
+            previous_card = Card.objects.filter(card_image=previous).first()
+            if previous_card is not None:
+                cards[index] = Card(**copied_card_fields(previous_card, owner, card_image))
+        except Exception as e:
+            outcomes[index] = e
+
+    progress('combine')
+    to_ocr = []
+    for index, card_image in enumerate(card_images):
+        if outcomes[index] is not None or (texts[index] is not None and card_image.combined_image):
+            continue
+        try:
+            content = prepare_card_image(card_image, images[index], combined[index])
+        except Exception as e:
+            outcomes[index] = e
+            continue
+        # Reused scans only needed their own combined image, not OCR
+        if texts[index] is None:
+            to_ocr.append((index, content))
+
+    progress('ocr')
+    for (index, _), text in zip(to_ocr, extract_texts([content for _, content in to_ocr])):
+        if isinstance(text, Exception):
+            outcomes[index] = text
+        else:
+            card_images[index].extracted_text = text
+            texts[index] = text
+    with stage('db_write'):
+        CardImage.objects.bulk_update([card_images[i] for i in range(count) if texts[i] is not None], SCAN_FIELDS)
+
+    progress('identify')
+    pending = [i for i in range(count) if texts[i] is not None and outcomes[i] is None and i not in cards]
+    identified, found = identify_cards([texts[i] for i in pending], [card_images[i] for i in pending], owner)
+    matches = {pending[position]: match for position, match in found.items()}
+    for index, outcome in zip(pending, identified):
+        if isinstance(outcome, Card):
+            cards[index] = outcome
+        else:
+            outcomes[index] = outcome
+
+    with stage('db_write'):
+        inserted = insert_cards(cards)
+    for index, card in inserted.items():
+        if isinstance(card, Exception):
+            outcomes[index] = card
+            continue
+        if index in matches:
+            cache_match_price(card, matches[index])
+        outcomes[index] = (CardSerializer(card).data, status.HTTP_201_CREATED)
+    return outcomes
+
+
+def extract_texts(contents):
+    """OCR several images in one batch call. If the batch fails, each image is retried on its own."""
+    if not contents:
+        return []
+    try:
+        with stage('ocr'):
+            return extract_text_from_images(contents)
+    except Exception:
+        texts = []
+        for content in contents:
+            try:
+                with stage('ocr'):
+                    texts.append(extract_text_from_bytes(content))
+            except Exception as e:
+                texts.append(e)
+        return texts
+
+
+def identify_cards(texts, card_images, owner):
+    """
+    identify_card for several texts. Returns (outcomes, matches): per text an unsaved Card,
+    the manual fallback or an exception, and {position: PokemonMatch} for the Pokémon cards.
+    """
+    outcomes = [None] * len(texts)
+    matches = {}
+    magic = [i for i, text in enumerate(texts) if "MAGIC" in text]
+    pokemon = [i for i, text in enumerate(texts) if "MAGIC" not in text and "Pokémon" in text]
+    generic = [i for i, text in enumerate(texts) if "MAGIC" not in text and "Pokémon" not in text]
+
+    max_workers = getattr(settings, 'SCAN_LOOKUP_CONCURRENCY', 8)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        if magic:
+            answers = ai_name_year_magic_many([texts[i] for i in magic])
+            infos = pool.map(_in_worker(_magic_lookup), answers)
+            for i, answer, info in zip(magic, answers, infos):
+                if isinstance(info, Exception):
+                    outcomes[i] = info
+                elif not info:
+                    outcomes[i] = manual_payload(answer.name, answer.year, 'Magic the Gathering', card_images[i])
+                else:
+                    outcomes[i] = build_magic_card(owner, card_images[i], info)
+
+        if pokemon:
+            answers = ai_name_set_number_pokemon_many([texts[i] for i in pokemon])
+            results = pool.map(_in_worker(_pokemon_lookup), answers)
+            for i, answer, result in zip(pokemon, answers, results):
+                if isinstance(result, Exception):
+                    outcomes[i] = result
+                    continue
+                set_number, match = result
+                if not confident_match(match):
+                    outcomes[i] = manual_payload(answer.name, set_number, 'Pokémon', card_images[i])
+                else:
+                    outcomes[i] = build_pokemon_card(owner, card_images[i], match.card, set_number)
+                    matches[i] = match
+
+    if generic:
+        answers = create_cards([texts[i] for i in generic])
+        for i, answer in zip(generic, answers):
+            outcomes[i] = answer if isinstance(answer, Exception) else build_generic_card(owner, card_images[i], answer)
+    return outcomes, matches
+
+
+def _in_worker(lookup):
+    """Run a lookup on the pool: pass exceptions through as results and close the thread's DB connection."""
+    def run(answer):
+        if isinstance(answer, Exception):
+            return answer
+        try:
+            with stage('lookup'):
+                return lookup(answer)
+        except Exception as e:
+            return e
+        finally:
+            connection.close()
+    return run
+
+
+def _magic_lookup(answer):
+    return magic_name_and_year(answer.name, answer.year)
+
+
+def _pokemon_lookup(answer):
+    set_number = clean_pokemon_number(answer.set_number)
+    try:
+        match = lookup_pokemon_card(answer.name, set_number)
+    except PokemonAPIError as e:
+        logger.warning("PokémonTCG lookup failed: %s", e)
+        match = None
+    return set_number, match
+
+
+def insert_cards(cards):
+    """
+    Insert {index: unsaved Card} with one bulk_create. If that fails, the cards are saved one
+    by one. Returns {index: saved Card or the exception that failed it}.
+    """
+    for card in cards.values():
+        # bulk_create doesn't call save(), which normally fills it in
+        card.price_key = price_key(card.card_company, card.name, card.set, card.number)
+    try:
+        with transaction.atomic():
+            Card.objects.bulk_create(list(cards.values()))
+            # bulk_create sends no post_save, so the collection totals are updated here
+            add_cards(list(cards.values()))
+        return dict(cards)
+    except Exception:
+        inserted = {}
+        for index, card in cards.items():
+            card.pk = None
+            try:
+                card.save()
+                inserted[index] = card
+            except Exception as e:
+                inserted[index] = e
+        return inserted
+
+
+def manual_payload(name, number, card_company, card_image):
+    """The response asking the app to confirm an identification we couldn't look up."""
+    MANUAL_FALLBACKS.inc(card_company=card_company)
+    return {
+        'status': 'manual',
+        'extracted_name': name,
+        'extracted_number': number,
+        'card_company': card_company,
+        'image_id': card_image.id
+    }, status.HTTP_200_OK
+
+
+def clean_pokemon_number(set_number):
+    """Keep the last word of the LLM's set number and drop a leading zero ("065" -> "65")."""
+    pokemon_number = set_number.split(' ')
+    poke_number = pokemon_number[len(pokemon_number) -1 ].strip(' ')
+    if poke_number[0] == "0":
+        poke_number = poke_number[1:]
+    return poke_number
+
+
+def confident_match(match):
+    """Whether a Pokémon lookup is good enough to create the card without asking the user."""
+    if match is None:
+        return False
+    logger.info("Matched %s %s with confidence %s", match.card['name'], match.card['number'], match.confidence)
+    return match.confidence >= getattr(settings, 'POKEMON_MATCH_MIN_CONFIDENCE', 0.5)
+
+
+def cache_match_price(card, match):
+    """Cache the price that came with a live lookup, so the card's first price request doesn't repeat it."""
+    if match.source == "api" and is_price(match.price):
+        store_price(card.price_key, card.card_company, match.price)
+
+
+# The build_* functions return the unsaved Card, so bulk scans can insert them together
+
+def build_magic_card(owner, card_image, magic_info):
+    return Card(
+        owner=owner,
+        name=magic_info[0]['name'],
+        set=magic_info[0]['set_name'],
+        number=magic_info[0]['collector_number'],
+        card_company="Magic the Gathering",
+        autograph=False,
+        card_image=card_image,
+        is_graded=False
+    )
+
+
+def build_pokemon_card(owner, card_image, pokemon_info, set_number):
+    return Card(
+        owner=owner,
+        name=pokemon_info['name'],
+        set=pokemon_info['set']['name'],
+        number=f'{set_number}/{pokemon_info["set"]["printedTotal"]}',
+        card_company="Pokémon",
+        numeration="None",
+        autograph=False,
+        card_image=card_image,
+        is_graded=False
+    )
+
+
+def build_generic_card(owner, card_image, card_data):
+    return Card(
+        owner=owner,
+        name=card_data.name,
+        set=card_data.set,
+        number=card_data.number,
+        card_company=card_data.card_company,
+        numeration=card_data.numeration,
+        autograph=card_data.autograph,
+        card_image=card_image,
+        is_graded=card_data.is_graded,
+        grade=card_data.grade,
+        grade_company=card_data.grade_company
+    )
+
+
+def create_magic_card(owner, card_image, magic_info):
+    return _saved(build_magic_card(owner, card_image, magic_info))
+
+
+def create_pokemon_card(owner, card_image, pokemon_info, set_number):
+    return _saved(build_pokemon_card(owner, card_image, pokemon_info, set_number))
+
+
+def create_generic_card(owner, card_image, card_data):
+    return _saved(build_generic_card(owner, card_image, card_data))
+
+
+def _saved(card):
+    with stage('db_write'):
+        card.save()
+    return card
@@ -0,0 +1,324 @@
+"""
+Card price cache.
+
+Prices live in the CachedPrice table with the time they were fetched, and expire after
+a TTL configured per card company (settings.PRICE_CACHE_TTL). A small in-process LRU sits
+in front of the table so repeat lookups in the same worker skip the database entirely.
+Writes are single-row upserts, so concurrent gunicorn workers can't lose each other's updates,
+and each one also adds a PriceSnapshot to the key's history. The refresh_prices command
+(api/price_refresh.py) keeps owned cards' prices fresh in the background.
+"""
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from .collection_value import price_changed
+from .metrics import count_cache, stage
+from .models import CachedPrice, PriceSnapshot, price_key
+from .card_types.pokemon import PokemonAPIError, afetch_pokemon_price, fetch_pokemon_price
+from .card_types.price_scraper import EbayScrapeError, afetch_ebay_price, fetch_ebay_price
+
+logger = logging.getLogger(__name__)
+
+
+# What fetch_price raises when a price source can't be reached or answers with an error
+PRICE_FETCH_ERRORS = (EbayScrapeError, PokemonAPIError)
+
+
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+
+
+def price_ttl(company):
+    ttls = getattr(settings, 'PRICE_CACHE_TTL', {})
+    return timedelta(seconds=ttls.get(company, ttls.get('default', DEFAULT_TTL_SECONDS)))
+
+
+class LRUCache:
+    """Thread-safe LRU of key -> (price, fetched_at, company)."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_lru = LRUCache(getattr(settings, 'PRICE_CACHE_LRU_SIZE', 2048))
+
+
+def _is_fresh(fetched_at, company):
+    return timezone.now() - fetched_at < price_ttl(company)
+
+
+def get_cached_price(key):
+    """Return the cached price for key, or None if it is missing or expired."""
+    entry = _lru.get(key)
+    if entry is None:
+        row = CachedPrice.objects.filter(key=key).values_list('price', 'fetched_at', 'card_company').first()
+        if row is None:
+            count_cache('price', hit=False)
+            return None
+        entry = row
+        _lru.set(key, entry)
+
+    price, fetched_at, company = entry
+    if not _is_fresh(fetched_at, company):
+        _lru.discard(key)
+        count_cache('price', hit=False)
+        return None
+    count_cache('price', hit=True)
+    return price
+
+
+def get_cached_prices(keys):
+    """Bulk version of get_cached_price: returns {key: price} for the fresh entries only."""
+    prices = {}
+    missing = []
+    for key in keys:
+        entry = _lru.get(key)
+        if entry is None:
+            missing.append(key)
+        elif _is_fresh(entry[1], entry[2]):
+            prices[key] = entry[0]
+
+    if missing:
+        rows = CachedPrice.objects.filter(key__in=missing).values_list('key', 'price', 'fetched_at', 'card_company')
+        for key, price, fetched_at, company in rows:
+            _lru.set(key, (price, fetched_at, company))
+            if _is_fresh(fetched_at, company):
+                prices[key] = price
+    count_cache('price', hit=True, count=len(prices))
+    count_cache('price', hit=False, count=len(keys) - len(prices))
+    return prices
+
+
+def _locked_price(key):
+    """key's cached price with its row locked until the transaction ends, or None if it has none."""
+    return CachedPrice.objects.select_for_update().filter(key=key).values_list('price', flat=True).first()
+
+
+def store_price(key, company, price, fetched_at=None):
+    """
+    Insert or update the cached price for key, and add it to the key's history. Collection
+    totals of the cards with this key move by the change.
+
+    The key's row is locked while the change is applied, so concurrent stores for one key
+    (batch pricing, the refresh command, prefetches) move the totals one after another, each
+    from the price the previous one left.
+    """
+    fetched_at = fetched_at or timezone.now()
+    fields = {'card_company': company, 'price': price, 'fetched_at': fetched_at}
+    with transaction.atomic():
+        previous = _locked_price(key)
+        if previous is None:
+            try:
+                with transaction.atomic():
+                    CachedPrice.objects.create(key=key, **fields)
+            except IntegrityError:
+                # Inserted by a concurrent store in the meantime: wait for it and change its price
+                previous = _locked_price(key)
+        if previous is not None:
+            CachedPrice.objects.filter(key=key).update(**fields)
+        PriceSnapshot.objects.create(key=key, card_company=company, price=price, fetched_at=fetched_at)
+        price_changed(key, previous, price, fetched_at)
+    _lru.set(key, (price, fetched_at, company))
+
+
+def price_history(key, since, limit=None):
+    """[{'price', 'fetched_at'}] of key's snapshots since then, oldest first (the latest limit of them)."""
+    if limit is None:
+        limit = getattr(settings, 'PRICE_HISTORY_MAX_POINTS', 500)
+    snapshots = PriceSnapshot.objects.filter(key=key, fetched_at__gte=since).order_by('-fetched_at')
+    return list(reversed(snapshots.values('price', 'fetched_at')[:limit]))
+
+
+def with_cached_price(queryset):
+    """Annotate cards with their cached price and its fetched_at (cached_price, price_fetched_at) in the same query."""
+    cached = CachedPrice.objects.filter(key=OuterRef('price_key'))
+    return queryset.annotate(
+        cached_price=Subquery(cached.values('price')[:1]),
+        price_fetched_at=Subquery(cached.values('fetched_at')[:1]),
+    )
+
+
+def _fresh_annotated_price(card):
+    if card.cached_price is not None and _is_fresh(card.price_fetched_at, card.card_company):
+        count_cache('price', hit=True)
+        return card.cached_price
+    count_cache('price', hit=False)
+    return None
+
+
+def fetch_price(company, name, number, set):
+    """
+    Fetch a fresh price from the upstream for this card company: the price, or None if it has
+    none. Raises one of PRICE_FETCH_ERRORS when the upstream fails.
+    """
+    with stage('price_fetch'):
+        if company == "Pokémon":
+            return fetch_pokemon_price(name, number.split("/")[0])
+        return fetch_ebay_price(f"{name} {set} {number}")
+
+
+def get_card_price(company, name, number, set):
+    """Return the card's price from the cache, fetching and storing it on a miss. Fetch errors are raised."""
+    key = price_key(company, name, set, number)
+    price = get_cached_price(key)
+    if price is not None:
+        logger.debug("Price of %s found in cache: %s", key, price)
+        return price
+
+    return _fetch_and_store(key, company, name, number, set)
+
+
+def card_price(card):
+    """get_card_price for a card from with_cached_price(), without reading the cache again."""
+    price = _fresh_annotated_price(card)
+    if price is not None:
+        return price
+    return _fetch_and_store(card.price_key, card.card_company, card.name, card.number, card.set)
+
+
+def _fetch_and_store(key, company, name, number, set):
+    logger.debug("Fetching price for %s", key)
+    try:
+        price = fetch_price(company, name, number, set)
+    except PRICE_FETCH_ERRORS as e:
+        logger.warning("Failed to fetch price for %s: %s", key, e)
+        raise
+
+    if price is not None:
+        store_price(key, company, price)
+    else:
+        logger.info("No price found for %s", key)
+    return price
+
+
+async def afetch_price(company, name, number, set):
+    """Async fetch_price."""
+    with stage('price_fetch'):
+        if company == "Pokémon":
+            return await afetch_pokemon_price(name, number.split("/")[0])
+        return await afetch_ebay_price(f"{name} {set} {number}")
+
+
+async def aget_card_price(company, name, number, set):
+    """Async get_card_price: cache reads and writes run in a thread, the upstream call on the loop."""
+    key = price_key(company, name, set, number)
+    price = await sync_to_async(get_cached_price)(key)
+    if price is not None:
+        logger.debug("Price of %s found in cache: %s", key, price)
+        return price
+
+    return await _afetch_and_store(key, company, name, number, set)
+
+
+async def acard_price(card):
+    """Async card_price."""
+    price = _fresh_annotated_price(card)
+    if price is not None:
+        return price
+    return await _afetch_and_store(card.price_key, card.card_company, card.name, card.number, card.set)
+
+
+async def _afetch_and_store(key, company, name, number, set):
+    logger.debug("Fetching price for %s", key)
+    try:
+        price = await afetch_price(company, name, number, set)
+    except PRICE_FETCH_ERRORS as e:
+        logger.warning("Failed to fetch price for %s: %s", key, e)
+        raise
+
+    if price is not None:
+        await sync_to_async(store_price)(key, company, price)
+    else:
+        logger.info("No price found for %s", key)
+    return price
+
+
+def is_price(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def get_card_prices(cards, max_workers=None):
+    """
+    Price many cards at once.
+
+    Cards sharing a (name, set, number) key are looked up once. Cache hits are answered
+    from one query, and the misses are fetched concurrently with at most max_workers
+    upstream requests in flight. Returns {card.id: {'status', 'price', 'cached'}}, where
+    status is 'ok' or 'unavailable' (the upstream had no usable price; 'detail' says why
+    when its request failed).
+    """
+    if max_workers is None:
+        max_workers = getattr(settings, 'PRICE_FETCH_CONCURRENCY', 8)
+
+    groups = defaultdict(list)
+    for card in cards:
+        groups[price_key(card.card_company, card.name, card.set, card.number)].append(card)
+
+    results = {}
+
+    def resolve(key, price, cached, error=None):
+        if price is not None:
+            entry = {'status': 'ok', 'price': price, 'cached': cached}
+        else:
+            entry = {'status': 'unavailable', 'price': None, 'cached': cached}
+            if error is not None:
+                entry['detail'] = str(error)
+        for card in groups[key]:
+            results[card.id] = entry
+
+    cached = get_cached_prices(list(groups))
+    for key, price in cached.items():
+        resolve(key, price, True)
+
+    misses = [key for key in groups if key not in cached]
+    if misses:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(misses)))) as pool:
+            futures = {}
+            for key in misses:
+                card = groups[key][0]
+                futures[pool.submit(fetch_price, card.card_company, card.name, card.number, card.set)] = key
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    price = future.result()
+                except Exception as e:
+                    logger.warning("Failed to fetch price for %s: %s", key, e)
+                    resolve(key, None, False, e)
+                    continue
+                if price is not None:
+                    store_price(key, groups[key][0].card_company, price)
+                resolve(key, price, False)
+
+    return results
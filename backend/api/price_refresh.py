@@ -0,0 +1,161 @@
+"""
+Background refresh of the prices of owned cards (manage.py refresh_prices).
+
+Every owned card's price key is refreshed once it is PRICE_REFRESH_AFTER of the way through
+its TTL, so price requests find it fresh instead of waiting on the upstream. Cards sharing a
+key, across all users, are fetched once. Due keys go in priority order: the most overdue
+relative to their TTL first, weighted by what the copies owned are worth. Never-priced keys
+count as just due. Each upstream has its own budget (settings.PRICE_REFRESH_BUDGETS): a cap
+on requests per run, and requests spaced out to stay under a per-minute rate.
+"""
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.utils import timezone
+
+from .models import CachedPrice, Card
+from .price_cache import PRICE_FETCH_ERRORS, fetch_price, price_ttl, store_price
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_BUDGETS = {
+    'pokemontcg': {'per_run': 500, 'per_minute': 60},
+    'ebay': {'per_run': 100, 'per_minute': 10},
+}
+
+
+def upstream_for(company):
+    """The price source fetch_price uses for a card company."""
+    return 'pokemontcg' if company == "Pokémon" else 'ebay'
+
+
+class RateLimiter:
+    """Spaces acquire() calls at least 60 / per_minute seconds apart, across threads."""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def refresh_budgets():
+    budgets = getattr(settings, 'PRICE_REFRESH_BUDGETS', DEFAULT_BUDGETS)
+    return {upstream: {**DEFAULT_BUDGETS.get(upstream, {}), **budget} for upstream, budget in budgets.items()}
+
+
+def rate_limiters(budgets=None):
+    """One RateLimiter per upstream; keep them across runs so the per-minute rate holds between them."""
+    budgets = budgets or refresh_budgets()
+    return {upstream: RateLimiter(budget['per_minute']) for upstream, budget in budgets.items()}
+
+
+def due_prices(now=None):
+    """
+    Owned price keys due for a refresh, most urgent first.
+
+    Returns dicts with the key, the company/name/set/number to fetch it with, how many cards
+    share it, the cached price and fetched_at (None if never priced) and the priority.
+    """
+    now = now or timezone.now()
+    after = getattr(settings, 'PRICE_REFRESH_AFTER', 0.75)
+    cached = CachedPrice.objects.filter(key=OuterRef('price_key'))
+    rows = (
+        Card.objects.values('price_key')
+        .annotate(
+            company=Max('card_company'), card_name=Max('name'), card_set=Max('set'), card_number=Max('number'),
+            copies=Count('id'),
+            price=Subquery(cached.values('price')[:1]),
+            fetched_at=Subquery(cached.values('fetched_at')[:1]),
+        )
+        .order_by()
+    )
+
+    due = []
+    for row in rows:
+        if row['fetched_at'] is None:
+            staleness, value = 1.0, 0.0
+        else:
+            staleness = (now - row['fetched_at']) / price_ttl(row['company'])
+            value = row['price'] * row['copies']
+        if staleness < after:
+            continue
+        row['priority'] = staleness * (1 + math.log1p(max(value, 0.0)))
+        due.append(row)
+    due.sort(key=lambda row: row['priority'], reverse=True)
+    return due
+
+
+def refresh_prices(due=None, budgets=None, limiters=None, max_workers=None):
+    """
+    Fetch and store the due prices, within each upstream's budget.
+
+    Returns {upstream: {'refreshed', 'failed', 'deferred'}}, where deferred keys were due
+    but over the run's budget.
+    """
+    due = due_prices() if due is None else due
+    budgets = budgets or refresh_budgets()
+    limiters = limiters or rate_limiters(budgets)
+    if max_workers is None:
+        max_workers = getattr(settings, 'PRICE_FETCH_CONCURRENCY', 8)
+
+    counts = {upstream: {'refreshed': 0, 'failed': 0, 'deferred': 0} for upstream in budgets}
+    batches = {upstream: [] for upstream in budgets}
+    for row in due:
+        upstream = upstream_for(row['company'])
+        if upstream not in budgets:
+            continue
+        if len(batches[upstream]) < budgets[upstream]['per_run']:
+            batches[upstream].append(row)
+        else:
+            counts[upstream]['deferred'] += 1
+    lock = threading.Lock()
+
+    def refresh(row, upstream):
+        try:
+            limiters[upstream].acquire()
+            price = fetch_price(row['company'], row['card_name'], row['card_number'], row['card_set'])
+            if price is not None:
+                store_price(row['price_key'], row['company'], price)
+                result = 'refreshed'
+            else:
+                logger.warning("No price found refreshing %s", row['price_key'])
+                result = 'failed'
+        except PRICE_FETCH_ERRORS as e:
+            logger.warning("Failed to refresh price for %s: %s", row['price_key'], e)
+            result = 'failed'
+        except Exception:
+            logger.exception("Failed to refresh price for %s", row['price_key'])
+            result = 'failed'
+        finally:
+            connection.close()
+        with lock:
+            counts[upstream][result] += 1
+
+    # A pool per upstream, so requests waiting on one upstream's rate don't hold up the others
+    pools = {
+        upstream: ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(rows))))
+        for upstream, rows in batches.items() if rows
+    }
+    try:
+        for upstream, pool in pools.items():
+            for row in batches[upstream]:
+                pool.submit(refresh, row, upstream)
+    finally:
+        for pool in pools.values():
+            pool.shutdown(wait=True)
+    return counts
@@ -1,11 +1,26 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from .models import Card, CardImage, CardShop
+from django.core.files.storage import default_storage
+from .thumbnails import schedule_variants, variant_urls
+from .geocoding import locate
+
+# Variant the card lists show; falls back to the full front image until it is generated
+LIST_THUMBNAIL_VARIANT = '512.webp'
 
 class CardImageSerializer(serializers.ModelSerializer):
+    thumbnails = serializers.SerializerMethodField()
+
     class Meta:
         model = CardImage
-        fields = ['id', 'card_front_image', 'card_back_image', 'combined_image', 'extracted_text']
+        fields = [
+            'id', 'card_front_image', 'card_back_image', 'combined_image', 'extracted_text', 'thumbnails',
+            'reused_from', 'reuse_match',
+        ]
+        read_only_fields = ['reused_from', 'reuse_match']
+
+    def get_thumbnails(self, obj):
+        return variant_urls(obj, self.context.get('request'))
 
 
 class CardSerializer(serializers.ModelSerializer):
@@ -13,7 +28,8 @@ class CardSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Card
-        fields = '__all__'
+        # price_key is derived in Card.save()
+        exclude = ['price_key']
 
     def create(self, validated_data):
         card_image_data = validated_data.pop('card_image')
@@ -28,6 +44,8 @@ class CardSerializer(serializers.ModelSerializer):
             card_image.card_front_image = card_image_data.get('card_front_image', card_image.card_front_image)
             card_image.card_back_image = card_image_data.get('card_back_image', card_image.card_back_image)
             card_image.save()
+            if 'card_front_image' in card_image_data:
+                schedule_variants(card_image)
 
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
@@ -35,6 +53,32 @@ class CardSerializer(serializers.ModelSerializer):
         instance.save()
         return instance
 
+class CardListSerializer(serializers.ModelSerializer):
+    """Compact card for collection lists: the front image URL only, no OCR text or other images."""
+    thumbnail = serializers.SerializerMethodField()
+    thumbnails = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Card
+        fields = [
+            'id', 'name', 'number', 'set', 'card_company', 'numeration', 'autograph',
+            'is_graded', 'grade_company', 'grade', 'thumbnail', 'thumbnails', 'created_at', 'updated_at'
+        ]
+
+    def get_thumbnail(self, obj):
+        request = self.context.get('request')
+        variant = (obj.card_image.variants or {}).get(LIST_THUMBNAIL_VARIANT)
+        if variant:
+            url = default_storage.url(variant)
+        elif obj.card_image.card_front_image:
+            url = obj.card_image.card_front_image.url
+        else:
+            return None
+        return request.build_absolute_uri(url) if request else url
+
+    def get_thumbnails(self, obj):
+        return variant_urls(obj.card_image, self.context.get('request'))
+
 class CardShopSerializer(serializers.ModelSerializer):
     owner = serializers.StringRelatedField(read_only=True)  # Display owner's username
 
@@ -52,22 +96,59 @@ class CardShopSerializer(serializers.ModelSerializer):
             'country',
             'phone',
             'website',
+            'latitude',
+            'longitude',
             'created_at',
             'updated_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
+        extra_kwargs = {
+            'latitude': {'min_value': -90, 'max_value': 90},
+            'longitude': {'min_value': -180, 'max_value': 180},
+        }
+
+    def validate(self, attrs):
+        if ('latitude' in attrs) != ('longitude' in attrs):
+            raise serializers.ValidationError("Send both latitude and longitude, or neither.")
+        return attrs
 
     def create(self, validated_data):
         user = self.context['request'].user
         validated_data['owner'] = user
-        return super().create(validated_data)
+        # Without coordinates from the client, they're geocoded from the address
+        return super().create(locate(validated_data))
 
     def update(self, instance, validated_data):
-        for attr, value in validated_data.items():
+        for attr, value in locate(validated_data, instance).items():
             setattr(instance, attr, value)
         instance.save()
         return instance
 
+class NearbyCardShopSerializer(serializers.ModelSerializer):
+    """A card shop as /api/cardshops/nearby/ lists it, with its distance from the searched point."""
+    distance_km = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CardShop
+        fields = [
+            'id',
+            'name',
+            'description',
+            'address',
+            'city',
+            'state',
+            'postal_code',
+            'country',
+            'phone',
+            'website',
+            'latitude',
+            'longitude',
+            'distance_km',
+        ]
+
+    def get_distance_km(self, obj):
+        return round(obj.distance_km, 3)
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -1,3 +1,473 @@
-from django.test import TestCase
+import io
+import logging
+import threading
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from . import authentication, image_work, price_cache
+from .ai_card import llm_cache
+from .ai_card.image_hash import hash_bands
+from .async_pipeline import aidentify_card, in_db_thread
+from .collection_value import collection_value, rebuild
+from .card_types import async_http, magic, price_scraper
+from .card_types.http_client import CappedRetry
+from .dedup import find_previous_scan
+from . import jobs
+from .log import QueueLogHandler
+from .models import Card, CardImage, ScanJob
+from .pipeline import copy_previous_scan, identify_card
+from .price_cache import store_price
+
+
+class FakeResponse:
+    def __init__(self, status_code, data=None, headers=None):
+        self.status_code = status_code
+        self._data = data
+        self.headers = headers or {}
+
+    def json(self):
+        return self._data
+
+
+def make_image(sha256=None, dhash=None, extracted_text=None, combined_image=None):
+    image = CardImage(
+        card_front_image='images/front.jpg', card_back_image='images/back.jpg',
+        sha256=sha256, extracted_text=extracted_text, combined_image=combined_image,
+    )
+    if dhash is not None:
+        image.dhash = f"{dhash:016x}"
+        image.dhash_band0, image.dhash_band1, image.dhash_band2, image.dhash_band3 = hash_bands(dhash)
+    image.save()
+    return image
+
+
+def bearer(user):
+    return {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(user)}'}
+
+
+def jpeg_upload(name):
+    data = io.BytesIO()
+    Image.new('RGB', (64, 96), 'white').save(data, format='JPEG')
+    data.name = name
+    data.seek(0)
+    return data
+
+
+def make_card(owner, card_image=None, name='Mike Trout', set='2011 Topps', number='US175', card_company='Topps'):
+    return Card.objects.create(
+        owner=owner, card_image=card_image or make_image(), name=name, set=set, number=number,
+        card_company=card_company, autograph=False, is_graded=False,
+    )
+
+
+class ScanDedupTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'alice-password')
+        self.bob = User.objects.create_user('bob', 'bob@example.com', 'bob-password')
+        self.scanned = make_image('a' * 64, 0x0123456789abcdef, 'TROUT 2011 TOPPS', 'combined_images/combined_1.jpg')
+        make_card(self.alice, self.scanned)
+
+    def test_other_users_scans_are_not_reused(self):
+        upload = make_image('a' * 64, 0x0123456789abcdef)
+        self.assertIsNone(find_previous_scan(upload, self.bob))
+        self.assertIsNone(copy_previous_scan(upload, self.bob))
+        self.assertIsNone(upload.extracted_text)
+        self.assertFalse(upload.combined_image)
+
+    def test_exact_match_reuses_text_and_combined_image(self):
+        upload = make_image('a' * 64, 0x0123456789abcdef)
+        self.assertEqual(copy_previous_scan(upload, self.alice), self.scanned)
+        self.assertEqual(upload.extracted_text, 'TROUT 2011 TOPPS')
+        self.assertEqual(upload.combined_image.name, 'combined_images/combined_1.jpg')
+        self.assertEqual((upload.reused_from, upload.reuse_match), (self.scanned, 'exact'))
+
+    def test_near_match_reuses_text_but_not_combined_image(self):
+        upload = make_image('b' * 64, 0x0123456789abcdee)
+        self.assertEqual(copy_previous_scan(upload, self.alice), self.scanned)
+        self.assertEqual(upload.extracted_text, 'TROUT 2011 TOPPS')
+        self.assertFalse(upload.combined_image)
+        self.assertEqual(upload.reuse_match, 'near')
+
+    def test_near_matches_that_disagree_are_not_reused(self):
+        make_card(self.alice, make_image('c' * 64, 0x0123456789abcdec, 'HARPER 2012 BOWMAN'), name='Bryce Harper')
+        upload = make_image('b' * 64, 0x0123456789abcdee)
+        self.assertIsNone(find_previous_scan(upload, self.alice))
+
+
+@override_settings(CATALOG_FALLBACK_TO_API=True)
+class MagicLookupTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('mage', 'mage@example.com', 'mage-password')
+        self.card_image = make_image(extracted_text='MAGIC Black Lotus')
+        self.answer = magic.MagicCard(name='Black Lotus', year='1993')
+
+    def lookups(self, response):
+        return mock.patch.object(magic.http_client, 'get', return_value=response)
+
+    def test_no_results_and_errors_are_none(self):
+        for response in (FakeResponse(200, {'total_cards': 0, 'data': []}), FakeResponse(404, {}), FakeResponse(500)):
+            with self.lookups(response):
+                self.assertIsNone(magic.magic_name_and_year('Black Lotus', '1993'))
+
+    def test_scan_without_results_asks_for_manual_entry(self):
+        with self.lookups(FakeResponse(404, {})), mock.patch('api.pipeline.ai_name_year_magic', return_value=self.answer):
+            payload, status = identify_card('MAGIC Black Lotus', self.card_image, self.owner)
+        self.assertEqual((payload['status'], payload['extracted_name'], status), ('manual', 'Black Lotus', 200))
+        self.assertFalse(Card.objects.exists())
+
+    def test_async_scan_without_results_asks_for_manual_entry(self):
+        async def no_cards(card_name, year):
+            return None
+
+        with mock.patch('api.async_pipeline.amagic_name_and_year', no_cards), \
+                mock.patch('api.async_pipeline.ai_name_year_magic', return_value=self.answer):
+            payload, status = async_to_sync(aidentify_card)('MAGIC Black Lotus', self.card_image, self.owner)
+        self.assertEqual((payload['status'], status), ('manual', 200))
+
+    def test_scan_with_results_creates_the_card(self):
+        found = FakeResponse(200, {'total_cards': 1, 'data': [
+            {'name': 'Black Lotus', 'set_name': 'Limited Edition Alpha', 'collector_number': '232'},
+        ]})
+        with self.lookups(found), mock.patch('api.pipeline.ai_name_year_magic', return_value=self.answer):
+            payload, status = identify_card('MAGIC Black Lotus', self.card_image, self.owner)
+        self.assertEqual((payload['name'], payload['number'], status), ('Black Lotus', '232', 201))
+
+
+class InDbThreadTests(TestCase):
+    def test_worker_thread_connection_is_closed_after_the_call(self):
+        with mock.patch('api.async_pipeline.close_old_connections') as close:
+            self.assertEqual(async_to_sync(in_db_thread(lambda text: text.upper()))('magic'), 'MAGIC')
+            self.assertEqual(close.call_count, 2)
+            with self.assertRaises(ValueError):
+                async_to_sync(in_db_thread(int))('not a number')
+            self.assertEqual(close.call_count, 4)
+
+
+class RetryAfterTests(TestCase):
+    def test_sync_retry_waits_at_most_max_retry_wait(self):
+        retry = CappedRetry(total=2, status_forcelist=[429], max_retry_wait=10)
+        self.assertEqual(retry.get_retry_after(FakeResponse(429, headers={'Retry-After': '3600'})), 10)
+        self.assertEqual(retry.get_retry_after(FakeResponse(429, headers={'Retry-After': '2'})), 2)
+        # urllib3 copies the Retry for every attempt
+        self.assertEqual(retry.increment('GET', '/').get_retry_after(FakeResponse(429, headers={'Retry-After': '3600'})), 10)
+
+    def test_async_retry_waits_at_most_max_retry_wait(self):
+        self.assertEqual(async_http._retry_delay(FakeResponse(429, headers={'Retry-After': '3600'}), 0, 0.5, 10), 10)
+        self.assertEqual(async_http._retry_delay(FakeResponse(429, headers={'Retry-After': '2'}), 0, 0.5, 10), 2)
+        self.assertEqual(async_http._retry_delay(FakeResponse(503), 5, 0.5, 10), 10)
+
+
+class EbayPriceTests(TestCase):
+    def test_too_few_sales_left_after_outliers_is_no_price(self):
+        prices = [(amount, 'USD') for amount in (10.0, 11.0, 100.0, 120.0, 0.5)]
+        self.assertIsNone(price_scraper.summarize_prices(prices))
+
+    def test_summary_drops_outliers(self):
+        prices = [(amount, 'USD') for amount in (10.0, 11.0, 12.0, 500.0)]
+        summary = price_scraper.summarize_prices(prices)
+        self.assertEqual((summary.count, summary.outliers, summary.median), (3, 1, 11.0))
+
+    def test_upstream_errors_are_raised(self):
+        with mock.patch.object(price_scraper.http_client, 'get', return_value=FakeResponse(403)):
+            with self.assertRaises(price_scraper.EbayScrapeError):
+                price_scraper.fetch_ebay_price('2011 Topps Mike Trout US175')
+
+
+class ScanJobQueueTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('queue', 'queue@example.com', 'queue-password')
+
+    def queue(self, count):
+        return [ScanJob.objects.create(owner=self.owner, card_image=make_image()) for _ in range(count)]
+
+    def test_claims_oldest_queued_jobs_once(self):
+        queued = self.queue(3)
+        first = jobs.claim_jobs(2)
+        self.assertEqual([job.id for job in first], [job.id for job in queued[:2]])
+        self.assertTrue(all(job.status == ScanJob.RUNNING for job in first))
+        self.assertEqual([job.id for job in jobs.claim_jobs(2)], [queued[2].id])
+        self.assertEqual(jobs.claim_jobs(2), [])
+
+    def test_recovery_requeues_stale_jobs_and_wakes_workers(self):
+        stale, fresh = self.queue(2)
+        ScanJob.objects.filter(id=stale.id).update(status=ScanJob.RUNNING, updated_at=timezone.now() - timedelta(hours=1))
+        ScanJob.objects.filter(id=fresh.id).update(status=ScanJob.RUNNING)
+        with mock.patch.object(jobs, 'wake_workers') as wake, mock.patch.object(jobs.threading, 'Timer') as timer:
+            jobs.recover_jobs()
+        self.assertEqual(ScanJob.objects.get(id=stale.id).status, ScanJob.QUEUED)
+        self.assertEqual(ScanJob.objects.get(id=fresh.id).status, ScanJob.RUNNING)
+        wake.assert_called_once_with()
+        # The fresh job is checked on again later
+        timer.return_value.start.assert_called_once_with()
+
+
+@override_settings(LLM_CACHE_ENABLED=True, LLM_CACHE_PRUNE_EVERY=1)
+class LLMCachePruneTests(TestCase):
+    def test_prune_runs_after_commit_off_the_request(self):
+        answer = magic.MagicCard(name='Black Lotus', year='1993')
+        with mock.patch.object(llm_cache, 'prune') as prune, \
+                mock.patch.object(llm_cache.threading, 'Thread') as thread, \
+                self.captureOnCommitCallbacks(execute=True):
+            llm_cache.memoized('magic', 'model', 'MAGIC Black Lotus', magic.MagicCard, lambda: answer)
+            thread.assert_not_called()
+        prune.assert_not_called()
+        thread.assert_called_once_with(target=llm_cache._run_prune, name='llm-cache-prune', daemon=True)
+        thread.return_value.start.assert_called_once_with()
+
+
+class MetricsEndpointTests(TestCase):
+    @override_settings(METRICS_TOKEN=None)
+    def test_off_without_a_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+    @override_settings(METRICS_TOKEN='scrape-me')
+    def test_requires_the_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-me')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'cruzin_request_seconds', response.content)
+
+
+class QueueLogHandlerTests(TestCase):
+    def log(self, message, *args, mutate=None):
+        stream = io.StringIO()
+        handler = QueueLogHandler(stream)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger = logging.getLogger('api.tests.queue_log')
+        logger.addHandler(handler)
+        logger.propagate = False
+        try:
+            logger.warning(message, *args)
+            if mutate:
+                mutate()
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
+        return stream.getvalue().strip()
+
+    def test_mutable_arguments_are_logged_as_they_were_at_the_call(self):
+        data = {'name': 'Pikachu'}
+        self.assertEqual(self.log("Request data: %s", data, mutate=lambda: data.update(name='Raichu')),
+                         "Request data: {'name': 'Pikachu'}")
+
+    def test_immutable_arguments_are_formatted_on_the_listener(self):
+        self.assertEqual(self.log("%s scanned %d cards", 'alice', 3), "alice scanned 3 cards")
+
+
+class CardListTests(TestCase):
+    def setUp(self):
+        authentication._users.clear()
+        self.owner = User.objects.create_user('lister', 'lister@example.com', 'lister-password')
+        self.prices = {}
+        # Equal prices and names leave the id tiebreak to keep the cursor stable
+        for number, (name, price) in enumerate((('Trout', 3.0), ('Judge', 1.0), ('Ohtani', 2.0), ('Betts', None),
+                                                 ('Acuna', 2.0), ('Judge', 5.0))):
+            card = make_card(self.owner, name=name, number=str(number))
+            if price is not None:
+                store_price(card.price_key, card.card_company, price)
+            # Cards without a cached price sort as 0
+            self.prices[card.id] = price or 0.0
+        make_card(User.objects.create_user('other', 'other@example.com', 'other-password'), name='Harper')
+
+    def walk(self, ordering):
+        """Every card id on every page, following the next links."""
+        url, ids = f'/api/cards/?ordering={ordering}&page_size=2', []
+        while url:
+            response = self.client.get(url, **bearer(self.owner))
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            self.assertLessEqual(len(page['results']), 2)
+            ids += [card['id'] for card in page['results']]
+            url = page['next']
+        return ids
+
+    def expected(self, key, reverse=False):
+        cards = sorted(Card.objects.filter(owner=self.owner), key=lambda card: -card.id)
+        return [card.id for card in sorted(cards, key=key, reverse=reverse)]
+
+    def test_cursor_pages_follow_price_ordering(self):
+        self.assertEqual(self.walk('price'), self.expected(lambda card: self.prices[card.id]))
+        self.assertEqual(self.walk('-price'), self.expected(lambda card: -self.prices[card.id]))
+
+    def test_cursor_pages_follow_name_ordering(self):
+        self.assertEqual(self.walk('name'), self.expected(lambda card: card.name))
+        names = sorted({card.name for card in Card.objects.filter(owner=self.owner)}, reverse=True)
+        self.assertEqual(self.walk('-name'), self.expected(lambda card: names.index(card.name)))
+
+
+class BatchCardPriceTests(TestCase):
+    def setUp(self):
+        authentication._users.clear()
+        self.owner = User.objects.create_user('batch', 'batch@example.com', 'batch-password')
+        self.cached = make_card(self.owner, name='Trout', number='1')
+        store_price(self.cached.price_key, self.cached.card_company, 12.5)
+        self.fetched = make_card(self.owner, name='Judge', number='2')
+        self.unpriced = make_card(self.owner, name='Betts', number='3')
+        self.failing = make_card(self.owner, name='Ohtani', number='4')
+        self.not_owned = make_card(User.objects.create_user('thief', 'thief@example.com', 'thief-password'), name='Harper')
+
+    def fetch_price(self, company, name, number, set):
+        if name == 'Ohtani':
+            raise price_scraper.EbayScrapeError('403, possibly blocked by eBay')
+        return {'Judge': 8.0, 'Betts': None}[name]
+
+    def test_each_card_gets_its_own_status(self):
+        ids = [self.cached.id, self.fetched.id, self.unpriced.id, self.failing.id, self.not_owned.id, 999999, self.cached.id]
+        with mock.patch('api.price_cache.fetch_price', side_effect=self.fetch_price) as fetch:
+            response = self.client.post('/api/card_price/batch/', {'ids': ids}, content_type='application/json', **bearer(self.owner))
+        self.assertEqual(response.status_code, 200)
+        results = {entry['id']: entry for entry in response.json()['results']}
+        self.assertEqual(list(results), ids[:-1])
+        self.assertEqual(results[self.cached.id], {'id': self.cached.id, 'status': 'ok', 'price': 12.5, 'cached': True})
+        self.assertEqual(results[self.fetched.id], {'id': self.fetched.id, 'status': 'ok', 'price': 8.0, 'cached': False})
+        self.assertEqual((results[self.unpriced.id]['status'], results[self.unpriced.id]['price']), ('unavailable', None))
+        self.assertEqual(results[self.failing.id]['status'], 'unavailable')
+        self.assertIn('blocked', results[self.failing.id]['detail'])
+        # Someone else's card looks the same as one that doesn't exist
+        self.assertEqual(results[self.not_owned.id], {'id': self.not_owned.id, 'status': 'not_found', 'price': None, 'cached': False})
+        self.assertEqual(results[999999]['status'], 'not_found')
+        self.assertEqual(fetch.call_count, 3)
+
+    def test_rejects_ids_that_are_not_a_list_of_integers(self):
+        for ids in ([], 'all', [1, 'two']):
+            response = self.client.post('/api/card_price/batch/', {'ids': ids}, content_type='application/json', **bearer(self.owner))
+            self.assertEqual(response.status_code, 400)
+
+
+class CollectionValueTests(TestCase):
+    def setUp(self):
+        authentication._users.clear()
+        self.owner = User.objects.create_user('collector', 'collector@example.com', 'collector-password')
+
+    def value(self):
+        response = self.client.get('/api/user/collection_value/', **bearer(self.owner))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_deleting_a_card_takes_it_out_of_the_value(self):
+        trout = make_card(self.owner, name='Trout', number='1')
+        copy = make_card(self.owner, name='Trout', number='1')
+        judge = make_card(self.owner, name='Judge', number='2')
+        store_price(trout.price_key, trout.card_company, 10.0)
+        store_price(judge.price_key, judge.card_company, 4.0)
+        self.assertEqual((self.value()['value'], self.value()['cards']), (24.0, 3))
+
+        self.assertEqual(self.client.delete(f'/api/cards/{copy.id}/', **bearer(self.owner)).status_code, 204)
+        self.assertEqual((self.value()['value'], self.value()['cards'], self.value()['priced_cards']), (14.0, 2, 2))
+
+        judge.delete()
+        trout.delete()
+        value = self.value()
+        self.assertEqual((value['value'], value['cards'], value['by_set']), (0, 0, []))
+
+    def test_interleaved_stores_for_one_key_count_it_once(self):
+        card = make_card(self.owner, name='Trout', number='1')
+        locked_price = price_cache._locked_price
+        interleaved = []
+
+        def read_then_let_another_store_in(key):
+            # The second store runs between the first one's read and its write
+            previous = locked_price(key)
+            if not interleaved:
+                interleaved.append(key)
+                store_price(key, card.card_company, 5.0)
+            return previous
+
+        with mock.patch.object(price_cache, '_locked_price', side_effect=read_then_let_another_store_in):
+            store_price(card.price_key, card.card_company, 3.0)
+
+        value = collection_value(self.owner)
+        self.assertEqual((value['value'], value['priced_cards']), (3.0, 1))
+        rebuild(self.owner)
+        self.assertEqual(collection_value(self.owner), value)
+
+
+class CachedAuthenticationTests(TestCase):
+    def setUp(self):
+        authentication._users.clear()
+        self.user = User.objects.create_user('cached', 'cached@example.com', 'cached-password')
+        self.refresh = RefreshToken.for_user(self.user)
+        self.headers = {'HTTP_AUTHORIZATION': f'Bearer {self.refresh.access_token}'}
+
+    def get_user(self):
+        return self.client.get('/api/user/', **self.headers)
+
+    def test_deactivated_user_is_refused_on_the_next_request(self):
+        self.assertEqual(self.get_user().status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get_user().status_code, 401)
+
+    def test_blacklisting_a_token_drops_the_cached_user(self):
+        self.assertEqual(self.get_user().status_code, 200)
+        # A queryset update sends no signal, so the cached user is still trusted
+        User.objects.filter(id=self.user.id).update(is_active=False)
+        self.assertEqual(self.get_user().status_code, 200)
+        self.refresh.blacklist()
+        self.assertIsNone(authentication._users.get(self.user.id))
+        self.assertEqual(self.get_user().status_code, 401)
+
+
+class ImageWorkBusyTests(TestCase):
+    def setUp(self):
+        authentication._users.clear()
+        self.user = User.objects.create_user('busy', 'busy@example.com', 'busy-password')
+        # One slot, taken for the whole test, and no waiting for it
+        pool = image_work.ImageWorkPool(image_work.INLINE, workers=1, max_pending=1, queue_timeout=0, retry_after=7)
+        pool.slots.acquire()
+        patcher = mock.patch.object(image_work, '_pool', pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upload(self, url):
+        data = {'card_front_image': jpeg_upload('front.jpg'), 'card_back_image': jpeg_upload('back.jpg')}
+        return self.client.post(url, data, **bearer(self.user))
+
+    def assertBusy(self, response):
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '7')
+        self.assertFalse(CardImage.objects.exists())
+
+    def test_upload_is_refused_when_the_pool_is_full(self):
+        self.assertBusy(self.upload('/api/upload/'))
+
+    def test_async_upload_is_refused_when_the_pool_is_full(self):
+        self.assertBusy(self.upload('/api/async/upload/'))
+
+
+class BackgroundImageWorkTests(TestCase):
+    def test_background_work_leaves_slots_for_requests(self):
+        pool = image_work.ImageWorkPool(image_work.INLINE, workers=1, max_pending=4, queue_timeout=0, retry_after=2)
+        release = threading.Event()
+        rendered = []
+
+        def render():
+            rendered.append(threading.current_thread().name)
+            release.wait(5)
+
+        # More thumbnails than slots: two run and the rest wait for a background slot
+        threads = [threading.Thread(target=pool.run, args=(render,), kwargs={'background': True}) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        try:
+            for _ in range(50):
+                if len(rendered) == 2:
+                    break
+                release.wait(0.05)
+            self.assertEqual(len(rendered), 2)
+            # An upload (which doesn't wait) holding a slot can still start another one
+            self.assertEqual(pool.run(pool.run, str, 1), '1')
+            self.assertEqual(len(rendered), 2)
+        finally:
+            release.set()
+            for thread in threads:
+                thread.join(5)
+        self.assertEqual(len(rendered), 4)
@@ -0,0 +1,124 @@
+"""
+Resized variants of uploaded card images for list screens.
+
+After an upload, the front image is rendered at each width in settings.THUMBNAIL_SIZES and
+in each format in settings.THUMBNAIL_FORMATS, on a background thread so the request doesn't
+wait for it. Variants are stored under thumbnails/ with a hash of their own content in the
+name, so a URL never changes meaning and can be cached forever with CACHE_CONTROL. The
+development server sends it (serve_thumbnail); in production the web server or storage
+backend serving MEDIA_URL has to.
+CardImage.variants maps '<width>.<format>' (e.g. '128.webp') to the stored name.
+"""
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.views.static import serve
+
+from .models import CardImage
+from .ai_card.image_tasks import THUMBNAIL_EXTENSIONS, render_variants
+from .image_work import run_image_task
+
+logger = logging.getLogger(__name__)
+
+
+THUMBNAIL_DIR = 'thumbnails'
+# Content-addressed files never change, so clients and proxies may keep them for a year
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+_lock = threading.Lock()
+_executor = None
+
+
+def thumbnail_sizes():
+    return sorted(getattr(settings, 'THUMBNAIL_SIZES', [128, 512]), reverse=True)
+
+
+def thumbnail_formats():
+    return getattr(settings, 'THUMBNAIL_FORMATS', ['webp', 'jpeg'])
+
+
+def store_variants(card_image, rendered):
+    """Save rendered variants under content-hash names and record them on the CardImage."""
+    variants = {}
+    for key, data in rendered.items():
+        size, fmt = key.split('.')
+        extension = THUMBNAIL_EXTENSIONS[fmt]
+        name = f'{THUMBNAIL_DIR}/{hashlib.sha256(data).hexdigest()[:20]}_{size}{extension}'
+        # Identical content gives an identical name, so an existing file is already correct
+        if not default_storage.exists(name):
+            default_storage.save(name, ContentFile(data))
+        variants[key] = name
+
+    card_image.variants = variants
+    CardImage.objects.filter(id=card_image.id).update(variants=variants)
+    return variants
+
+
+def read_front_image(card_image):
+    card_image.card_front_image.open('rb')
+    try:
+        return card_image.card_front_image.read()
+    finally:
+        card_image.card_front_image.close()
+
+
+def generate_variants(card_image, content=None):
+    """Render and store all variants of card_image's front image (content, if already read)."""
+    if content is None:
+        content = read_front_image(card_image)
+    quality = getattr(settings, 'THUMBNAIL_QUALITY', 80)
+    # Thumbnails are the server's own work: they wait, but leave slots free for uploads
+    rendered = run_image_task(
+        render_variants, content, thumbnail_sizes(), thumbnail_formats(), quality, background=True
+    )
+    return store_variants(card_image, rendered)
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'THUMBNAIL_WORKERS', 2), thread_name_prefix='thumbnails'
+            )
+    return _executor
+
+
+def _generate_in_background(card_image_id, content):
+    try:
+        card_image = CardImage.objects.filter(id=card_image_id).first()
+        if card_image is not None:
+            generate_variants(card_image, content)
+    except Exception:
+        logger.exception("Could not generate thumbnails for CardImage %s", card_image_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_variants(card_image, content=None):
+    """Generate variants on a background thread once the upload's transaction commits."""
+    card_image_id = card_image.id
+    transaction.on_commit(lambda: _get_executor().submit(_generate_in_background, card_image_id, content))
+
+
+def variant_urls(card_image, request=None):
+    """{'128': {'webp': url, 'jpeg': url}, ...} for the variants generated so far."""
+    urls = {}
+    for key, name in (card_image.variants or {}).items():
+        size, fmt = key.split('.')
+        url = default_storage.url(name)
+        urls.setdefault(size, {})[fmt] = request.build_absolute_uri(url) if request else url
+    return urls
+
+
+def serve_thumbnail(request, path):
+    """Serve a variant from MEDIA_ROOT with long-lived cache headers. Only routed when DEBUG is on."""
+    response = serve(request, f'{THUMBNAIL_DIR}/{path}', document_root=settings.MEDIA_ROOT)
+    response['Cache-Control'] = CACHE_CONTROL
+    return response
@@ -1,5 +1,6 @@
 from django.urls import path
-from .views import RetrieveCardPrice, CardShopListCreateView, CardShopRetrieveUpdateDestroyView, CardListCreateView, CardRetrieveUpdateDestroyView, CardImageUploadView, NativeLoginView, RegisterView, ManualCardCreateView, UserDetailView
+from .views import RetrieveCardPrice, CardShopListCreateView, CardShopRetrieveUpdateDestroyView, CardListCreateView, CardRetrieveUpdateDestroyView, CardImageUploadView, NativeLoginView, RegisterView, ManualCardCreateView, UserDetailView, ScanJobStatusView, BatchCardPriceView, BulkCardImageUploadView, ScanBatchStatusView, CardPriceHistoryView, CollectionValueView, NearbyCardShopView
+from .async_views import AsyncCardImageUploadView, AsyncCardPriceView
 from rest_framework_simplejwt.views import TokenRefreshView, TokenObtainPairView
 
 
@@ -13,9 +14,19 @@ urlpatterns = [
     path('cards/<int:pk>/', CardRetrieveUpdateDestroyView.as_view(), name='item-detail'),
     path('upload/', CardImageUploadView.as_view(), name='card-image-upload'),
     path('upload/manual/', ManualCardCreateView.as_view(), name='manual-card-create'),
+    path('upload/<uuid:job_id>/', ScanJobStatusView.as_view(), name='scan-job-status'),
+    path('upload/bulk/', BulkCardImageUploadView.as_view(), name='card-image-upload-bulk'),
+    path('upload/bulk/<uuid:batch_id>/', ScanBatchStatusView.as_view(), name='scan-batch-status'),
     path("user/", UserDetailView.as_view(), name="user-detail"),
+    path("user/collection_value/", CollectionValueView.as_view(), name="collection-value"),
     path("cardshops/", CardShopListCreateView.as_view(), name="cardshop-list-create"),
+    path("cardshops/nearby/", NearbyCardShopView.as_view(), name="cardshop-nearby"),
     path("cardshops/<int:pk>/", CardShopRetrieveUpdateDestroyView.as_view(), name="cardshop-detail"),
-    path("card_price/<int:pk>/", RetrieveCardPrice.as_view(), name="card-price")
+    path("card_price/<int:pk>/", RetrieveCardPrice.as_view(), name="card-price"),
+    path("card_price/batch/", BatchCardPriceView.as_view(), name="card-price-batch"),
+    path("card_price/<int:pk>/history/", CardPriceHistoryView.as_view(), name="card-price-history"),
+    # Native async versions of the upload and price endpoints, for the ASGI server
+    path('async/upload/', AsyncCardImageUploadView.as_view(), name='card-image-upload-async'),
+    path("async/card_price/<int:pk>/", AsyncCardPriceView.as_view(), name="card-price-async"),
 ]
 
@@ -1,21 +1,39 @@
+import logging
+from datetime import timedelta
+
 from django.shortcuts import render, get_object_or_404
 from rest_framework import generics, status, permissions
-from .models import Card, CardImage, CardShop
-from .serializers import CardImageSerializer, CardSerializer, UserSerializer, CardShopSerializer
+from .models import Card, CardImage, CardShop, ScanBatch, ScanJob
+from .serializers import CardImageSerializer, CardSerializer, CardListSerializer, UserSerializer, CardShopSerializer, NearbyCardShopSerializer
+from .pagination import CardCursorPagination, NearbyPagination
+from .filters import CardOrderingFilter, CardSearchFilter
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from django.core.files.base import ContentFile
-import cv2, os, json, requests
+from django.conf import settings
 from django.contrib.auth import authenticate
+from django.db.models import Prefetch, prefetch_related_objects
+from django.utils import timezone
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
 from rest_framework.exceptions import ValidationError
-from .ai_card.card_to_text import combine_images, extract_text_from_image  # Ensure these are imported correctly
-from .ai_card.text_to_card import create_card
-from .card_types.magic import ai_name_year_magic, magic_name_and_year
-from .card_types.pokemon import ai_name_set_number_pokemon, pokemon_name_and_set_number
-from .card_types.price_scraper import get_ebay_prices
+from .card_types.magic import magic_name_and_year
+from .card_types.pokemon import PokemonAPIError, lookup_pokemon_card
+from .collection_value import collection_value
+from .geo import nearest, within_radius
+from .price_cache import PRICE_FETCH_ERRORS, card_price, get_card_prices, price_history, with_cached_price
+from .dedup import fingerprint_card_image
+from .jobs import enqueue_scan
+from .bulk_scan import BulkUploadError, batch_status, bulk_items, queue_items, scan_items, use_background_scan
+from .pipeline import cache_match_price, scan_card_image
+from .thumbnails import schedule_variants
+from .image_work import run_image_task, scan_image_limits
+from .metrics import record_stages, stage
+from .log import log_payload
+from .ai_card.image_tasks import upload_task
+
+logger = logging.getLogger(__name__)
 
 
 class RegisterView(APIView):
@@ -75,113 +93,139 @@ class NativeLoginView(APIView):
 class CardListCreateView(generics.ListCreateAPIView):
     serializer_class = CardSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = CardCursorPagination
+    filter_backends = [CardSearchFilter, CardOrderingFilter]
+
+    def get_serializer_class(self):
+        # Lists use the compact representation, creating a card still takes the full one
+        if self.request.method == 'GET':
+            return CardListSerializer
+        return CardSerializer
 
     def get_queryset(self):
-        return Card.objects.filter(owner=self.request.user)
+        return Card.objects.filter(owner=self.request.user).select_related('card_image')
 
 class CardRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [permissions.IsAuthenticated]
-    queryset = Card.objects.all()
+    queryset = Card.objects.select_related('card_image')
     serializer_class = CardSerializer
 
+def read_uploaded_images(files):
+    """The uploaded front and back images, read once and kept in memory for the scan."""
+    images = []
+    for field in ('card_front_image', 'card_back_image'):
+        upload = files[field]
+        upload.seek(0)
+        images.append(upload.read())
+    return tuple(images)
+
+def scan_in_background(value):
+    """Scans run in the background when the client asks for it (?async=1) or the server defaults to it."""
+    if value is None:
+        return getattr(settings, 'SCAN_ASYNC_UPLOADS', False)
+    return str(value).lower() in ('1', 'true', 'yes')
+
+def store_upload(serializer, images, prepared):
+    """Save a validated upload with its fingerprint and queue its thumbnails."""
+    record_stages(prepared.get('timings'))
+    with stage('image_save'):
+        card_image = serializer.save()
+    fingerprint_card_image(card_image, hashes=(prepared['sha256'], prepared['dhash']))
+    schedule_variants(card_image, images[0])
+    return card_image
+
 class CardImageUploadView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request, format=None):
-        print(request.data)
+        log_payload(logger, "Upload request data: %s", request.data)
         serializer = CardImageSerializer(data=request.data)
 
         if serializer.is_valid():
-            card_image = serializer.save()
-
-            # Combine the images
-            combined_img = combine_images(card_image.card_front_image.path, card_image.card_back_image.path)
-
-            # Save the combined image
-            _, buffer = cv2.imencode('.jpg', combined_img)
-            combined_image_content = ContentFile(buffer.tobytes(), name=f'combined_{card_image.id}.jpg')
-            card_image.combined_image.save(combined_image_content.name, combined_image_content)
-
-            # Extract text using Google Cloud Vision
-            extracted_text = extract_text_from_image(card_image.combined_image.path)
-            card_image.extracted_text = extracted_text
-            card_image.save()
-
-            print(extracted_text)
-
-            if "MAGIC" in extracted_text:
-                magic_card = ai_name_year_magic(extracted_text)
-                magic_info = magic_name_and_year(magic_card.name, magic_card.year)
-                if magic_info == None:
-                    return Response({
-                        'status': 'manual',
-                        'extracted_name': magic_card.name,
-                        'extracted_number': magic_card.year,
-                        'card_company': 'Magic the Gathering',
-                        'image_id': card_image.id
-                    }, status=status.HTTP_200_OK)
-                card = Card.objects.create(
-                    owner=self.request.user,
-                    name=magic_info[0]['name'],
-                    set=magic_info[0]['set_name'],
-                    number=magic_info[0]['collector_number'],
-                    card_company="Magic the Gathering",
-                    autograph=False,
-                    card_image=card_image,
-                    is_graded=False
-                )
-            elif "Pokémon" in extracted_text:
-                pokemon_card = ai_name_set_number_pokemon(extracted_text)
-                pokemon_number = pokemon_card.set_number.split(' ')
-                poke_number = pokemon_number[len(pokemon_number) -1 ].strip(' ')
-                if poke_number[0] == "0":
-                    poke_number = poke_number[1:]
-                pokemon_card.set_number = poke_number
-                
-                pokemon_info = pokemon_name_and_set_number(pokemon_card.name, pokemon_card.set_number)
-                if pokemon_info == None:
-                    return Response({
-                        'status': 'manual',
-                        'extracted_name': pokemon_card.name,
-                        'extracted_number': pokemon_card.set_number,
-                        'card_company': 'Pokémon',
-                        'image_id': card_image.id
-                    }, status=status.HTTP_200_OK)
-
-                card = Card.objects.create(
-                    owner=self.request.user,
-                    name=pokemon_info['name'],
-                    set=pokemon_info['set']['name'],
-                    number=f'{pokemon_card.set_number}/{pokemon_info["set"]["printedTotal"]}',
-                    card_company="Pokémon",
-                    numeration="None",
-                    autograph=False,
-                    card_image=card_image,
-                    is_graded=False
-                )
-            else:
-                card_data = create_card(extracted_text)
-                card = Card.objects.create(
-                    owner=self.request.user,
-                    name=card_data.name,
-                    set=card_data.set,
-                    number=card_data.number,
-                    card_company=card_data.card_company,
-                    numeration=card_data.numeration,
-                    autograph=card_data.autograph,
-                    card_image=card_image,
-                    is_graded=card_data.is_graded,
-                    grade=card_data.grade,
-                    grade_company=card_data.grade_company
-                )
+            # Read the uploads once, before storage may move the temporary files away
+            images = read_uploaded_images(request.FILES)
+            run_async = self.use_async(request)
+
+            # Hash (and, for a scan in this request, combine) off the request thread. This
+            # raises ImageWorkBusy (503) before anything is stored if the pool is saturated.
+            prepared = run_image_task(upload_task, *images, not run_async, *scan_image_limits())
 
-            card.save()
+            card_image = store_upload(serializer, images, prepared)
 
-            return Response(CardSerializer(card).data, status=status.HTTP_201_CREATED)
+            if run_async:
+                job = enqueue_scan(card_image, self.request.user)
+                return Response({
+                    'job_id': str(job.id),
+                    'status': job.status,
+                    'image_id': card_image.id
+                }, status=status.HTTP_202_ACCEPTED)
+
+            payload, http_status = scan_card_image(
+                card_image, self.request.user, images=images, combined=prepared['combined']
+            )
+            return Response(payload, status=http_status)
         else:
-            print(serializer.errors)
+            logger.info("Upload rejected: %s", serializer.errors)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    def use_async(self, request):
+        return scan_in_background(request.query_params.get('async', request.data.get('async')))
+
+class ScanJobStatusView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, job_id, format=None):
+        job = get_object_or_404(ScanJob, id=job_id, owner=request.user)
+        data = {
+            'job_id': str(job.id),
+            'status': job.status,
+            'stage': job.stage,
+            'image_id': job.card_image_id,
+        }
+        if job.status == ScanJob.DONE:
+            data['result'] = job.result
+            data['result_status'] = job.result_status
+        elif job.status == ScanJob.FAILED:
+            data['error'] = job.error
+        return Response(data, status=status.HTTP_200_OK)
+
+class BulkCardImageUploadView(APIView):
+    """
+    Scan many cards in one request (see api/bulk_scan.py).
+
+    Small batches return 200 with one result per pair: 'created' with the card, 'manual'
+    with the fallback payload, 'failed' or 'invalid'. Larger ones, or ?async=1, return
+    202 with a batch_id to poll at /api/upload/bulk/<batch_id>/.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, format=None):
+        # Stream every file to a temporary file, however small, rather than keeping it in memory
+        request.upload_handlers = [TemporaryFileUploadHandler(request)]
+        try:
+            items = bulk_items(request.FILES)
+        except BulkUploadError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        requested = scan_in_background(request.query_params.get('async', request.data.get('async')))
+        if use_background_scan(items, requested):
+            batch = queue_items(items, request.user)
+            return Response({
+                'batch_id': str(batch.id),
+                'status': 'queued',
+                'total': batch.total,
+                'rejected': batch.rejected,
+            }, status=status.HTTP_202_ACCEPTED)
+
+        return Response({'results': scan_items(items, request.user)}, status=status.HTTP_200_OK)
+
+class ScanBatchStatusView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, batch_id, format=None):
+        batch = get_object_or_404(ScanBatch, id=batch_id, owner=request.user)
+        return Response(batch_status(batch), status=status.HTTP_200_OK)
+
 class ManualCardCreateView(APIView):
     def post(self, request, format=None):
         name = request.data.get('name')
@@ -199,7 +243,7 @@ class ManualCardCreateView(APIView):
 
         if card_company == "Magic the Gathering":
             magic_info = magic_name_and_year(name, number)
-            if magic_info == None:
+            if not magic_info:
                 return Response({
                     'status': 'manual',
                     'extracted_name': name,
@@ -225,8 +269,13 @@ class ManualCardCreateView(APIView):
             number = number.split(' ')
             number = number[len(number) - 1]
 
-            pokemon_info = pokemon_name_and_set_number(name, number)
-            if pokemon_info == None:
+            # The user confirmed the name and number, so any match is used whatever its confidence
+            try:
+                match = lookup_pokemon_card(name, number)
+            except PokemonAPIError as e:
+                logger.warning("PokémonTCG lookup failed: %s", e)
+                match = None
+            if match == None:
                 return Response({
                     'status': 'manual',
                     'extracted_name': name,
@@ -236,9 +285,9 @@ class ManualCardCreateView(APIView):
                 }, status=status.HTTP_200_OK)
             card = Card.objects.create(
                 owner=self.request.user,
-                name=pokemon_info['name'],
-                set=pokemon_info['set']['name'],
-                number=f'{number}/{pokemon_info["set"]["printedTotal"]}',
+                name=match.card['name'],
+                set=match.card['set']['name'],
+                number=f'{number}/{match.card["set"]["printedTotal"]}',
                 card_company="Pokémon",
                 numeration="None",
                 autograph=False,
@@ -246,6 +295,7 @@ class ManualCardCreateView(APIView):
                 is_graded=False,
                 grade_company="None"
             )
+            cache_match_price(card, match)
 
         return Response(CardSerializer(card).data, status=status.HTTP_201_CREATED)
 
@@ -255,7 +305,22 @@ class UserDetailView(generics.RetrieveAPIView):
     serializer_class = UserSerializer
 
     def get_object(self):
-        return self.request.user
+        # request.user comes from the authentication cache; fetch its shops in one query
+        user = self.request.user
+        prefetch_related_objects([user], Prefetch('card_shop', queryset=CardShop.objects.only('id', 'owner_id')))
+        return user
+
+
+class CollectionValueView(APIView):
+    """
+    The user's collection value: the total, per company and per set breakdowns, and the
+    cards whose last price change moved it most. Read from running totals (api/collection_value.py),
+    so it doesn't price each card.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, format=None):
+        return Response(collection_value(request.user), status=status.HTTP_200_OK)
 
 
 class CardShopListCreateView(generics.ListCreateAPIView):
@@ -285,72 +350,114 @@ class CardShopRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
         """Ensure users can only access their own shops."""
         return CardShop.objects.filter(owner=self.request.user)
 
+class NearbyCardShopView(APIView):
+    """
+    Card shops near a point, nearest first. Open to everyone.
+
+    GET ?lat=&lng=&radius=25 pages through the shops within radius km. GET ?lat=&lng=&k=5
+    returns the k nearest shops instead, however far away they are.
+    """
+    permission_classes = [permissions.AllowAny]
+    pagination_class = NearbyPagination
+
+    def get(self, request, format=None):
+        params = request.query_params
+        max_radius = getattr(settings, 'CARDSHOP_NEARBY_MAX_RADIUS_KM', 500)
+        try:
+            lat, lng = float(params['lat']), float(params['lng'])
+            radius = float(params.get('radius', getattr(settings, 'CARDSHOP_NEARBY_RADIUS_KM', 25)))
+            k = int(params['k']) if 'k' in params else None
+        except KeyError:
+            return Response({'detail': 'lat and lng are required.'}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError:
+            return Response({'detail': 'lat, lng and radius must be numbers, and k an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            return Response({'detail': 'lat must be within [-90, 90] and lng within [-180, 180].'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 < radius <= max_radius:
+            return Response({'detail': f'radius must be above 0 and at most {max_radius} km.'}, status=status.HTTP_400_BAD_REQUEST)
+        if k is not None and not 1 <= k <= NearbyPagination.max_page_size:
+            return Response({'detail': f'k must be between 1 and {NearbyPagination.max_page_size}.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if k is not None:
+            return Response({'results': self.serialize(nearest(CardShop.objects.all(), lat, lng, k))})
+
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(within_radius(CardShop.objects.all(), lat, lng, radius), request, view=self)
+        return paginator.get_paginated_response(self.serialize(page))
+
+    def serialize(self, hits):
+        """Serialize the shops of [(distance_km, id)] in that order, loading only those rows."""
+        shops = CardShop.objects.in_bulk([shop_id for _, shop_id in hits])
+        for distance, shop_id in hits:
+            shops[shop_id].distance_km = distance
+        return NearbyCardShopSerializer([shops[shop_id] for _, shop_id in hits], many=True).data
+
 class RetrieveCardPrice(generics.RetrieveAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = CardSerializer
 
-    def load_card_prices(self):
-        if os.path.exists("prices.json"):
-            with open("prices.json", "r") as f:
-                return json.load(f)
-        return {}
+    def retrieve(self, request, *args, **kwargs):
+        # The card and its cached price come back in one query; only a missing or expired
+        # price is fetched from the upstream
+        card = get_object_or_404(with_cached_price(Card.objects.all()), pk=kwargs.get("pk"))
+        try:
+            price = card_price(card)
+        except PRICE_FETCH_ERRORS as e:
+            return Response({"price": None, "detail": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
+        return Response({"price": price})
 
-    def save_card_prices(self, card_prices):
-        """Save updated card prices to JSON file."""
-        with open("prices.json", "w") as f:
-            json.dump(card_prices, f, indent=4)
 
-    def retrieve(self, request, *args, **kwargs):
-        card_id = kwargs.get("pk")
-        card = get_object_or_404(Card, pk=card_id)
-
-        # Extract required details
-        card_company = card.card_company
-        card_name = card.name
-        card_number = card.number
-        card_set = card.set
-
-        # Fetch price from external API
-        price_data = self.fetch_card_price(card_company, card_name, card_number, card_set)
-
-        return Response({"price": price_data})
-
-    def fetch_card_price(self, company, name, number, set):
-
-        if company == "Pokémon":
-            number = number.split("/")[0]
-            base_url = "https://api.pokemontcg.io/v2/cards"
-            query = f'name:"{name}" number:"{number}"'
-            params = {'q': query}
-            response = requests.get(base_url, params=params)
-            if response.status_code == 200:
-                data = response.json()
-                if data['totalCount'] > 0:
-                    card = data['data']
-                    print(card)
-                else:
-                    print(f"No cards found for '{name}' with set number {number}.")
-            return card[0]["cardmarket"]["prices"]["averageSellPrice"]
+class CardPriceHistoryView(APIView):
+    """
+    Price history of one of the user's cards, oldest first, for charting trends.
 
-        else:
-            card_prices = self.load_card_prices()
+    GET ?days=90 returns the card's price snapshots from that many days back (at most
+    PRICE_HISTORY_MAX_POINTS of them, the most recent).
+    """
+    permission_classes = [permissions.IsAuthenticated]
 
-            card_key = f"{name} {set} {number}"  # Unique key for the card
+    def get(self, request, pk, format=None):
+        card = get_object_or_404(Card.objects.only('id', 'price_key'), pk=pk, owner=request.user)
+        try:
+            days = int(request.query_params.get('days', 90))
+        except ValueError:
+            return Response({'detail': 'days must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= days <= 3650:
+            return Response({'detail': 'days must be between 1 and 3650.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        history = price_history(card.price_key, timezone.now() - timedelta(days=days))
+        return Response({'id': card.id, 'history': history}, status=status.HTTP_200_OK)
 
-            if card_key in card_prices:
-                print(f"Price found in JSON: {card_prices[card_key]}")
-                return card_prices[card_key]
-            else:
-                print(f"Fetching price for {name}...")
 
-                search_query = f"{name} {set} {number}"
-                price = get_ebay_prices(search_query)
+class BatchCardPriceView(APIView):
+    """
+    Price many of the user's cards in one request.
+
+    POST {"ids": [1, 2, 3]} returns one entry per requested id with its own status, so a
+    failed upstream lookup for one card doesn't fail the whole batch.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, format=None):
+        ids = request.data.get('ids')
+        if not isinstance(ids, list) or not ids:
+            return Response({'detail': 'ids must be a non-empty list of card ids.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        max_cards = getattr(settings, 'PRICE_BATCH_MAX_CARDS', 1000)
+        if len(ids) > max_cards:
+            return Response({'detail': f'At most {max_cards} cards can be priced per request.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            ids = [int(card_id) for card_id in ids]
+        except (TypeError, ValueError):
+            return Response({'detail': 'ids must be integers.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        cards = Card.objects.filter(owner=request.user, id__in=ids).only('id', 'name', 'set', 'number', 'card_company')
+        prices = get_card_prices(cards)
 
-                if price:
-                    card_prices[card_key] = price
-                    self.save_card_prices(card_prices)
-                    print(f"Price added to JSON: {price}")
-                else:
-                    print(f"Failed to fetch price for {name}.")
+        results = []
+        for card_id in dict.fromkeys(ids):
+            entry = prices.get(card_id, {'status': 'not_found', 'price': None, 'cached': False})
+            results.append({'id': card_id, **entry})
 
-                return price
\ No newline at end of file
+        return Response({'results': results}, status=status.HTTP_200_OK)
@@ -55,7 +55,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',
     ),
 }
 
@@ -71,11 +71,173 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': True,
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
+# Seconds an authenticated user stays in a process's cache (api/authentication.py); changes
+# made in another process reach this one within this long
+AUTH_USER_CACHE_TTL = int(os.environ.get('AUTH_USER_CACHE_TTL', 60))
+# Most users kept in the authentication cache per process
+AUTH_USER_CACHE_SIZE = 10000
+
+# Scan pipeline
+# Run uploads through the background job queue by default (clients can also pass ?async=1)
+SCAN_ASYNC_UPLOADS = os.environ.get('SCAN_ASYNC_UPLOADS', 'false').lower() in ('1', 'true', 'yes')
+# Background scan worker threads per process
+SCAN_WORKERS = int(os.environ.get('SCAN_WORKERS', 4))
+# Queued scans a worker claims at once so their OCR goes to Vision in one batch request
+SCAN_OCR_BATCH_SIZE = int(os.environ.get('SCAN_OCR_BATCH_SIZE', 4))
+# Minutes a running scan job can go without progress before it's requeued as abandoned
+SCAN_JOB_STALE_MINUTES = 10
+# Dotted path to the OCR backend class (swap in a local fake for tests and benchmarks)
+OCR_BACKEND = os.environ.get('OCR_BACKEND', 'api.ai_card.card_to_text.GoogleVisionOCR')
+# Send Vision requests to this REST endpoint instead of Google's (e.g. benchmarks/upstreams.py)
+VISION_API_ENDPOINT = os.environ.get('VISION_API_ENDPOINT')
+# Reuse the OCR text and identification of an earlier scan of the same card
+SCAN_DEDUP_ENABLED = True
+# Largest dHash distance (in bits, out of 64) still treated as the same image; up to 3 is always found
+SCAN_DEDUP_MAX_DISTANCE = 3
+# Band matches compared per lookup, newest first
+SCAN_DEDUP_MAX_CANDIDATES = 200
+# Size limits of the combined front/back image sent to OCR; larger uploads are decoded at reduced scale
+SCAN_IMAGE_MAX_HEIGHT = int(os.environ.get('SCAN_IMAGE_MAX_HEIGHT', 1600))
+SCAN_IMAGE_MAX_WIDTH = int(os.environ.get('SCAN_IMAGE_MAX_WIDTH', 2400))
+# JPEG quality (0-100) of the stored combined image and the OCR request
+SCAN_JPEG_QUALITY = int(os.environ.get('SCAN_JPEG_QUALITY', 90))
+# Catalog/API lookups run at once when a batch of scans is identified
+SCAN_LOOKUP_CONCURRENCY = 8
+# Cards whose OCR text goes into one grouped LLM prompt in batch scans
+LLM_GROUP_SIZE = int(os.environ.get('LLM_GROUP_SIZE', 8))
+
+# Bulk uploads (/api/upload/bulk/)
+# Most front/back pairs accepted in one request
+BULK_SCAN_MAX_ITEMS = int(os.environ.get('BULK_SCAN_MAX_ITEMS', 500))
+# Larger batches are queued and return a batch id to poll instead of the results
+BULK_SCAN_SYNC_MAX_ITEMS = int(os.environ.get('BULK_SCAN_SYNC_MAX_ITEMS', 16))
+# Pairs scanned together in the request; Vision takes at most 16 images per batch call
+BULK_SCAN_CHUNK_SIZE = 16
+# Largest image accepted from a zip archive, in bytes
+BULK_SCAN_MAX_IMAGE_BYTES = 25 * 1024 * 1024
+# Django refuses requests with more files than this; a bulk upload sends two per pair
+DATA_UPLOAD_MAX_NUMBER_FILES = 2 * BULK_SCAN_MAX_ITEMS + 10
+
+# Where CPU-bound image work (decode, resize, hash, encode) runs: inline, thread or process.
+# process is for deployments: each worker process re-imports Django and the image libraries
+IMAGE_WORK_MODE = os.environ.get('IMAGE_WORK_MODE', 'thread')
+# Worker threads/processes for that work; defaults to one per core
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', os.cpu_count() or 1))
+# Image tasks running or waiting at once; further uploads wait up to IMAGE_WORK_QUEUE_TIMEOUT
+# seconds for a slot and then get a 503 asking them to retry after IMAGE_WORK_RETRY_AFTER seconds
+IMAGE_WORK_MAX_PENDING = int(os.environ.get('IMAGE_WORK_MAX_PENDING', IMAGE_WORKERS * 2))
+IMAGE_WORK_QUEUE_TIMEOUT = float(os.environ.get('IMAGE_WORK_QUEUE_TIMEOUT', 1.0))
+IMAGE_WORK_RETRY_AFTER = 2
+# Of those, how many background work (thumbnails) may hold at once; defaults to half, leaving
+# the rest for uploads
+IMAGE_WORK_MAX_BACKGROUND = int(os.environ.get('IMAGE_WORK_MAX_BACKGROUND', max(1, IMAGE_WORK_MAX_PENDING // 2)))
+
+# Resized front images for list screens (python3 manage.py generate_thumbnails backfills them)
+# Widths in pixels, and the formats each width is stored in
+THUMBNAIL_SIZES = [128, 512]
+THUMBNAIL_FORMATS = ['webp', 'jpeg']
+# Encoder quality (0-100) for both formats
+THUMBNAIL_QUALITY = 80
+# Background threads per process rendering thumbnails after uploads
+THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', 2))
+
+# Local card catalog (python3 manage.py sync_catalog)
+# Fall back to the live Scryfall/PokémonTCG APIs for cards missing from the mirror
+CATALOG_FALLBACK_TO_API = os.environ.get('CATALOG_FALLBACK_TO_API', 'true').lower() in ('1', 'true', 'yes')
+# Pokémon lookups scoring below this (0-1) go to the manual flow instead of creating the card
+POKEMON_MATCH_MIN_CONFIDENCE = float(os.environ.get('POKEMON_MATCH_MIN_CONFIDENCE', 0.5))
+
+# LLM identification memo
+LLM_CACHE_ENABLED = True
+# Entries kept before the least recently used are evicted
+LLM_CACHE_MAX_ENTRIES = 50000
+# Entries unused for this many days are evicted
+LLM_CACHE_MAX_AGE_DAYS = 90
+# Run eviction in a background thread after this many new entries (per process); 0 leaves it
+# to manage.py prune_llm_cache
+LLM_CACHE_PRUNE_EVERY = 500
+
+# Price cache
+# Seconds a cached price stays fresh, per card_company ('default' covers everything else)
+PRICE_CACHE_TTL = {
+    'default': 7 * 24 * 60 * 60,
+    'Pokémon': 24 * 60 * 60,
+}
+# Prices kept in each worker's in-memory LRU in front of the CachedPrice table
+PRICE_CACHE_LRU_SIZE = 2048
+# Upstream price requests in flight at once for a batch price lookup
+PRICE_FETCH_CONCURRENCY = 8
+# Largest number of cards accepted by /api/card_price/batch/
+PRICE_BATCH_MAX_CARDS = 1000
+# Most price snapshots returned by /api/card_price/<id>/history/
+PRICE_HISTORY_MAX_POINTS = 500
+# Background refresh (manage.py refresh_prices): refresh owned cards' prices once they are
+# this far through their TTL, so requests rarely find them expired
+PRICE_REFRESH_AFTER = 0.75
+# Upstream requests the refresh may make per run, and per minute, for each price source
+PRICE_REFRESH_BUDGETS = {
+    'pokemontcg': {'per_run': int(os.environ.get('PRICE_REFRESH_POKEMONTCG_PER_RUN', 500)), 'per_minute': 60},
+    'ebay': {'per_run': int(os.environ.get('PRICE_REFRESH_EBAY_PER_RUN', 100)), 'per_minute': 10},
+}
+
+# Card shop locations
+# Geocoder for shop addresses: api.geocoding.NominatimGeocoder, or OfflineGeocoder to never call out
+GEOCODER_BACKEND = os.environ.get('GEOCODER_BACKEND', 'api.geocoding.NominatimGeocoder')
+# Nominatim-style search endpoint NominatimGeocoder uses (a self-hosted one, or benchmarks/upstreams.py)
+GEOCODER_URL = os.environ.get('GEOCODER_URL', 'https://nominatim.openstreetmap.org/search')
+# Radius /api/cardshops/nearby/ searches when none is given, and the largest it accepts, in km
+CARDSHOP_NEARBY_RADIUS_KM = 25
+CARDSHOP_NEARBY_MAX_RADIUS_KM = 500
+
+# Collection value (/api/user/collection_value/)
+# Top movers are the cards whose price changed in the last this many days
+COLLECTION_MOVERS_DAYS = 7
+# Top movers returned
+COLLECTION_MOVERS_LIMIT = 10
+
+# Metrics (/metrics, in the Prometheus text format)
+# Bearer token scrapers must send; unset turns the endpoint off (404)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+# Requests slower than this many seconds are logged with their stage breakdown; unset disables it
+SLOW_REQUEST_SECONDS = float(os.environ['SLOW_REQUEST_SECONDS']) if os.environ.get('SLOW_REQUEST_SECONDS') else None
+
+# Logging (api/log.py). Records are written to stderr by a background thread.
+# Level of the api loggers
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+# 'text' or 'json' (one object per line)
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')
+# Also log verbose payloads (request data, OCR text, upstream responses, LLM answers)
+LOG_PAYLOADS = os.environ.get('LOG_PAYLOADS', 'false').lower() in ('1', 'true', 'yes')
+# Fraction (0-1) of those payloads that are logged
+LOG_PAYLOAD_SAMPLE_RATE = float(os.environ.get('LOG_PAYLOAD_SAMPLE_RATE', 0.1))
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'text': {'format': '%(asctime)s %(levelname)s %(name)s %(message)s'},
+        'json': {'()': 'api.log.JSONFormatter'},
+    },
+    'filters': {
+        'payload_sample': {'()': 'api.log.SampleFilter', 'name': 'payload', 'rate': LOG_PAYLOAD_SAMPLE_RATE},
+    },
+    'handlers': {
+        'queue': {'class': 'api.log.QueueLogHandler', 'formatter': LOG_FORMAT, 'filters': ['payload_sample']},
+    },
+    'loggers': {
+        'api': {'handlers': ['queue'], 'level': LOG_LEVEL, 'propagate': False},
+        'payload': {
+            'handlers': ['queue'],
+            'level': 'DEBUG' if LOG_PAYLOADS else 'CRITICAL',
+            'propagate': False,
+        },
+    },
+}
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -17,12 +17,20 @@ Including another URLconf
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
+from api.metrics import metrics_view
+from api.thumbnails import THUMBNAIL_DIR, serve_thumbnail
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
+    path('metrics', metrics_view),
 ]
 
 if settings.DEBUG:
+    # Thumbnails have content-hash names and are served with long-lived cache headers; in
+    # production the web server or storage backend sets them (see README)
+    urlpatterns += [
+        re_path(rf'^{settings.MEDIA_URL.strip("/")}/{THUMBNAIL_DIR}/(?P<path>.+)$', serve_thumbnail),
+    ]
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
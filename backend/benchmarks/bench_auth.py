@@ -0,0 +1,123 @@
+"""
+Per-request cost of JWT authentication, simplejwt's JWTAuthentication against
+CachedJWTAuthentication (api/authentication.py).
+
+Run from /backend:
+    python benchmarks/bench_auth.py [--users 1000] [--requests 20000] [--threads 8]
+
+    authenticate  authenticate() alone on requests spread over --users users' tokens, one thread
+    user_view     GET /api/user/ through the DRF view from --threads threads, as many requests
+                  at once as a busy threaded server handles
+
+Each is reported per authentication class with the queries it ran per request (the
+user_view queries include the shops UserDetailView prefetches). Results are saved to
+benchmarks/results/auth-<timestamp>.json; compare two runs with benchmarks/results.py.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from django_setup import setup_django
+from results import save_results, summarize
+
+
+def seed(users):
+    from django.contrib.auth.models import User
+    from rest_framework_simplejwt.tokens import AccessToken
+    from api.models import CardShop
+
+    User.objects.bulk_create([User(username=f'user{i}', email=f'user{i}@example.com') for i in range(users)])
+    accounts = list(User.objects.order_by('id'))
+    CardShop.objects.bulk_create([
+        CardShop(owner=user, name=f'Shop {user.id}', address='1 Main St', city='City', state='CA',
+                 postal_code='00000', country='US')
+        for user in accounts[::4]
+    ])
+    return [f'Bearer {AccessToken.for_user(user)}' for user in accounts]
+
+
+class QueryCounter:
+    """Counts the queries run on every thread's connection while installed."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+
+def run(fn, headers, threads):
+    """Call fn(header) once per header from threads threads. Returns (latencies_ms, queries, elapsed)."""
+    from django.db import connection
+
+    counter = QueryCounter()
+
+    def call(header):
+        with connection.execute_wrapper(counter):
+            start = time.perf_counter()
+            fn(header)
+            return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = list(pool.map(call, headers))
+    return latencies, counter.count, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+    setup_django()
+
+    from rest_framework.test import APIRequestFactory
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from api import authentication
+    from api.authentication import CachedJWTAuthentication
+    from api.views import UserDetailView
+
+    tokens = seed(args.users)
+    headers = [tokens[i % len(tokens)] for i in range(args.requests)]
+    factory = APIRequestFactory()
+
+    results = {}
+    print(f"{args.users} users, {args.requests} requests, {args.threads} threads for user_view")
+    for auth_class in (JWTAuthentication, CachedJWTAuthentication):
+        authenticator = auth_class()
+        view = UserDetailView.as_view(authentication_classes=[auth_class])
+
+        def authenticate(header):
+            authenticator.authenticate(factory.get('/api/user/', HTTP_AUTHORIZATION=header))
+
+        def user_view(header):
+            response = view(factory.get('/api/user/', HTTP_AUTHORIZATION=header))
+            assert response.status_code == 200, response.status_code
+
+        for name, fn, threads in (('authenticate', authenticate, 1), ('user_view', user_view, args.threads)):
+            authentication._users.clear()
+            # Warm up on one pass over the users, so the cached class is measured hitting its cache
+            run(fn, tokens, threads)
+            latencies, queries, elapsed = run(fn, headers, threads)
+            result = summarize(latencies)
+            result['rps'] = len(latencies) / elapsed
+            result['queries_per_request'] = queries / len(latencies)
+            results[f'{name}.{auth_class.__name__}'] = result
+            print(f"{name:<13} {auth_class.__name__:<24} {result['rps']:8.0f} req/s   p50 {result['p50_ms']:7.3f} ms   "
+                  f"p99 {result['p99_ms']:7.3f} ms   {result['queries_per_request']:.2f} queries/request")
+
+    params = {'users': args.users, 'requests': args.requests, 'threads': args.threads}
+    print(f"Saved {save_results('auth', params, results)}")
+
+
+if __name__ == '__main__':
+    main()
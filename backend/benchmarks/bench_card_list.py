@@ -0,0 +1,82 @@
+"""
+Query count and latency of the collection list for a large collection.
+
+Run from /backend:
+    python benchmarks/bench_card_list.py [cards]
+
+"before" serializes the whole collection with the nested CardSerializer and no
+select_related (the old /api/cards/ response); "after" is one page of the cursor-paginated,
+compact list served by the current view.
+"""
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from django_setup import setup_django
+
+setup_django()
+
+from django.contrib.auth.models import User
+from django.db import connection
+from rest_framework.test import APIClient
+
+from api.models import Card, CardImage
+from api.serializers import CardSerializer
+
+
+def populate(user, count):
+    images = CardImage.objects.bulk_create(
+        CardImage(card_front_image=f"images/front_{i}.jpg", card_back_image=f"images/back_{i}.jpg",
+                  extracted_text="OCR text " * 40)
+        for i in range(count)
+    )
+    Card.objects.bulk_create(
+        Card(owner=user, card_image=image, name=f"Card {i}", set="Set", number=str(i),
+             card_company="Topps", autograph=False, is_graded=False)
+        for i, image in enumerate(images)
+    )
+
+
+def measure(label, fn, runs=5):
+    timings, size = [], 0
+    queries = [0]
+
+    def count(execute, sql, params, many, context):
+        queries[0] += 1
+        return execute(sql, params, many, context)
+
+    for _ in range(runs):
+        queries[0] = 0
+        with connection.execute_wrapper(count):
+            start = time.perf_counter()
+            size = fn()
+            timings.append((time.perf_counter() - start) * 1000)
+    queries = queries[0]
+    print(f"{label:<30} {statistics.median(timings):9.1f} ms   {queries:6d} queries   {size / 1024:9.1f} KiB")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    user = User.objects.create_user("collector", "collector@example.com", "benchmark-password")
+    populate(user, count)
+    print(f"{count} cards")
+
+    def before():
+        from rest_framework.renderers import JSONRenderer
+        data = CardSerializer(Card.objects.filter(owner=user), many=True).data
+        return len(JSONRenderer().render(data))
+
+    client = APIClient()
+    client.force_authenticate(user)
+
+    def after():
+        return len(client.get("/api/cards/").content)
+
+    measure("before (full, nested)", before, runs=2)
+    measure("after (one cursor page)", after)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Exercise api.card_types.http_client against a local stand-in upstream.
+
+Run from /backend:
+    python benchmarks/bench_http_client.py [requests]
+
+The stand-in server answers /ok after a short delay, fails every other /flaky request
+with a 503, and never answers /hang within the client's read timeout. The script compares
+bare requests.get with the pooled client, then checks retries, timeouts and the
+per-host concurrency cap, and prints the client's metrics. The stand-in speaks
+plain HTTP, so the pooled numbers understate the TLS handshakes saved in production.
+"""
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+from api.card_types import http_client
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    flaky_calls = 0
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        try:
+            if self.path.startswith('/hang'):
+                time.sleep(2)
+                self._send(200, b'late')
+            elif self.path.startswith('/flaky'):
+                with cls.lock:
+                    cls.flaky_calls += 1
+                    fail = cls.flaky_calls % 2 == 1
+                self._send(503 if fail else 200, b'{"ok": true}')
+            else:
+                time.sleep(0.005)
+                self._send(200, b'{"ok": true}')
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+
+    def _send(self, code, body):
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client already gave up (the /hang timeout case)
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def timed(label, fn, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed / n * 1000:8.2f} ms/request")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host = f"127.0.0.1:{server.server_port}"
+    base = f"http://{host}"
+
+    http_client.configure_host(host, timeout=(1, 0.5), retries=2, backoff_factor=0.01, max_concurrency=4)
+
+    timed("bare requests.get", lambda: requests.get(f"{base}/ok"), n)
+    timed("pooled http_client.get", lambda: http_client.get(f"{base}/ok"), n)
+
+    response = http_client.get(f"{base}/flaky")
+    print(f"flaky endpoint after retry   -> {response.status_code}")
+
+    start = time.perf_counter()
+    try:
+        http_client.get(f"{base}/hang")
+        print("hang endpoint                -> answered (unexpected)")
+    except requests.exceptions.RequestException as e:
+        print(f"hang endpoint                -> {type(e).__name__} after {time.perf_counter() - start:.2f}s")
+
+    # Let the abandoned /hang requests finish before measuring concurrency
+    while StandInHandler.in_flight:
+        time.sleep(0.05)
+    StandInHandler.max_in_flight = 0
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        list(pool.map(lambda _: http_client.get(f"{base}/ok"), range(64)))
+    print(f"max in flight with 16 callers -> {StandInHandler.max_in_flight} (cap 4)")
+
+    for name, stats in http_client.metrics().items():
+        print(name, stats)
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
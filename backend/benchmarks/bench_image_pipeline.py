@@ -0,0 +1,122 @@
+"""
+Compare time and peak memory per scan of the old and new image preparation for 12MP photos.
+
+Run from /backend:
+    python benchmarks/bench_image_pipeline.py [iterations]
+
+"before" is the old path: cv2.imread both originals from disk at full resolution, resize
+to a common height, np.hstack and JPEG-encode. "after" is combine_image_bytes + encode_jpeg
+on the uploaded bytes, with reduced-scale decoding into a preallocated canvas.
+
+Each mode runs in its own subprocess. Peak memory is the process's peak RSS (VmHWM) while
+scanning, above its RSS after imports; the peak is reset after imports through
+/proc/self/clear_refs, so this needs Linux.
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+
+
+WIDTH, HEIGHT = 3024, 4032  # 12MP portrait phone photo
+
+
+def make_photo(path, seed):
+    """A 12MP JPEG with card-like text and sensor noise, so it compresses like a real photo."""
+    rng = np.random.default_rng(seed)
+    image = rng.integers(90, 170, size=(HEIGHT, WIDTH, 3), dtype=np.uint8)
+    image = cv2.GaussianBlur(image, (0, 0), 3)
+    cv2.rectangle(image, (300, 400), (WIDTH - 300, HEIGHT - 400), (235, 225, 60), 40)
+    for i, line in enumerate(["Pikachu", "HP 60", "Thunder Jolt 30", "58/102", "Illus. Mitsuhiro Arita"]):
+        cv2.putText(image, line, (450, 900 + i * 500), cv2.FONT_HERSHEY_SIMPLEX, 6, (20, 20, 20), 14)
+    cv2.imwrite(path, image, [cv2.IMWRITE_JPEG_QUALITY, 92])
+
+
+def before(front_path, back_path):
+    front_image = cv2.imread(front_path)
+    back_image = cv2.imread(back_path)
+    height = max(front_image.shape[0], back_image.shape[0])
+    front_image = cv2.resize(front_image, (front_image.shape[1], height))
+    back_image = cv2.resize(back_image, (back_image.shape[1], height))
+    combined_image = np.hstack((front_image, back_image))
+    _, buffer = cv2.imencode('.jpg', combined_image)
+    return buffer.tobytes()
+
+
+def after(front_path, back_path):
+    from api.ai_card.card_to_text import combine_image_bytes, encode_jpeg
+
+    with open(front_path, "rb") as f:
+        front_content = f.read()
+    with open(back_path, "rb") as f:
+        back_content = f.read()
+    return encode_jpeg(combine_image_bytes(front_content, back_content))
+
+
+def _status_mib(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024  # reported in kB
+    raise RuntimeError(f"{field} missing from /proc/self/status")
+
+
+def reset_peak_rss():
+    """Reset VmHWM to the current RSS and return that RSS."""
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+    return _status_mib("VmRSS")
+
+
+def run_mode(mode, front_path, back_path, iterations):
+    """Child process: time one mode and print 'mean_ms p50_ms peak_mib output_kib output_shape'."""
+    from django.conf import settings
+    settings.configure()
+    import api.ai_card.card_to_text  # noqa: F401  (import cost is not part of the scan)
+
+    fn = before if mode == "before" else after
+    baseline = reset_peak_rss()
+    samples = []
+    output = b""
+    for _ in range(iterations):
+        start = time.perf_counter()
+        output = fn(front_path, back_path)
+        samples.append((time.perf_counter() - start) * 1000)
+    peak = _status_mib("VmHWM") - baseline
+    shape = cv2.imdecode(np.frombuffer(output, np.uint8), cv2.IMREAD_COLOR).shape
+    print(f"{statistics.mean(samples)} {statistics.median(samples)} {peak} "
+          f"{len(output) / 1024} {shape[1]}x{shape[0]}")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    workdir = tempfile.mkdtemp(prefix="cruzin-bench-")
+    front_path = os.path.join(workdir, "front.jpg")
+    back_path = os.path.join(workdir, "back.jpg")
+    make_photo(front_path, 1)
+    make_photo(back_path, 2)
+    print(f"Inputs: two {WIDTH}x{HEIGHT} JPEGs ({os.path.getsize(front_path) // 1024} KiB, "
+          f"{os.path.getsize(back_path) // 1024} KiB), {iterations} iterations")
+
+    for mode in ("before", "after"):
+        result = subprocess.run(
+            [sys.executable, __file__, "--child", mode, front_path, back_path, str(iterations)],
+            capture_output=True, text=True, check=True,
+        )
+        mean_ms, p50_ms, peak_mib, output_kib, shape = result.stdout.split()
+        print(f"{mode:<8} mean {float(mean_ms):8.1f} ms   p50 {float(p50_ms):8.1f} ms   "
+              f"peak +{float(peak_mib):6.1f} MiB   output {shape} {float(output_kib):7.0f} KiB")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        run_mode(sys.argv[2], sys.argv[3], sys.argv[4], int(sys.argv[5]))
+    else:
+        main()
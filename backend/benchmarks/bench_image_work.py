@@ -0,0 +1,105 @@
+"""
+Compare the inline, thread and process modes of the image work pool under concurrent uploads.
+
+Run from /backend:
+    python benchmarks/bench_image_work.py [concurrency] [uploads]
+
+Each mode runs the upload image task (hash + combine + JPEG encode of two 12MP photos)
+from `concurrency` request threads, like a threaded WSGI server would. Besides throughput
+and latency it reports how late a 5ms ticker on another thread runs, which is how much
+the image work starves everything else in the server process (other requests, the event
+loop under ASGI). Uploads refused with ImageWorkBusy are counted as 503s.
+"""
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_image_pipeline import make_photo
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def ticker(stop, lateness):
+    """Sleep 5ms at a time and record how much later than that each wakeup comes."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        time.sleep(0.005)
+        lateness.append((time.perf_counter() - start - 0.005) * 1000)
+
+
+def run_mode(mode, images, concurrency, uploads):
+    from api.ai_card.image_tasks import upload_task
+    from api.image_work import ImageWorkBusy, configure_image_work, run_image_task, scan_image_limits
+
+    pool = configure_image_work(mode=mode)
+    # Warm up so process start-up isn't counted
+    for _ in range(pool.workers):
+        run_image_task(upload_task, *images, True, *scan_image_limits(), block=True)
+
+    latencies = []
+    busy = 0
+    lock = threading.Lock()
+
+    def upload():
+        nonlocal busy
+        start = time.perf_counter()
+        try:
+            run_image_task(upload_task, *images, True, *scan_image_limits())
+        except ImageWorkBusy:
+            with lock:
+                busy += 1
+            return
+        with lock:
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    stop = threading.Event()
+    lateness = []
+    tick_thread = threading.Thread(target=ticker, args=(stop, lateness))
+    tick_thread.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as clients:
+        for _ in range(uploads):
+            clients.submit(upload)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    tick_thread.join()
+    pool.shutdown()
+
+    print(f"{mode:<8} {len(latencies) / elapsed:6.1f} uploads/s   "
+          f"p50 {statistics.median(latencies):7.0f} ms   p99 {percentile(latencies, 0.99):7.0f} ms   "
+          f"503s {busy:3d}   ticker p99 late {percentile(lateness, 0.99):6.1f} ms")
+
+
+def main():
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    uploads = int(sys.argv[2]) if len(sys.argv) > 2 else 48
+
+    from django.conf import settings
+    # Queue generously so the modes are compared on throughput rather than on refusals
+    settings.configure(IMAGE_WORK_MAX_PENDING=concurrency, IMAGE_WORK_QUEUE_TIMEOUT=60)
+
+    import tempfile
+    workdir = tempfile.mkdtemp(prefix="cruzin-bench-")
+    paths = [os.path.join(workdir, name) for name in ("front.jpg", "back.jpg")]
+    for seed, path in enumerate(paths):
+        make_photo(path, seed)
+    images = []
+    for path in paths:
+        with open(path, "rb") as f:
+            images.append(f.read())
+
+    print(f"{concurrency} concurrent uploads, {uploads} total, {os.cpu_count()} cores")
+    for mode in ("inline", "thread", "process"):
+        run_mode(mode, images, concurrency, uploads)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Per-call cost of logging a scan's OCR text from the request thread.
+
+Run from /backend:
+    python benchmarks/bench_logging.py [calls]
+
+Output goes to a pipe that a reader thread drains, like a container's stdout. Four
+setups are compared:
+
+    print            the old print(extracted_text)
+    stream handler   logger.info through a plain StreamHandler, written on the caller's thread
+    queue handler    logger.info through api.log.QueueLogHandler, written by its listener thread
+    payload, off     log_payload() with LOG_PAYLOADS unset, the default
+
+The times are for the calling thread only, which is what a request pays.
+"""
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.log import QueueLogHandler, log_payload
+
+
+TEXT = "Pokémon Pikachu 58/102 Basic Pokémon HP 40 Thunder Jolt Flip a coin. " * 20
+
+
+def pipe():
+    """A write end whose output is read and thrown away by a background thread."""
+    read_fd, write_fd = os.pipe()
+    reader = os.fdopen(read_fd, 'rb')
+    threading.Thread(target=lambda: [None for _ in iter(lambda: reader.read(65536), b'')], daemon=True).start()
+    return os.fdopen(write_fd, 'w', encoding='utf-8')
+
+
+def logger_with(name, handler):
+    handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s %(message)s'))
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return logger
+
+
+def timed(label, fn, calls):
+    times = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1e6)
+    times.sort()
+    print(f"{label:<16} mean {statistics.mean(times):7.2f} us   p50 {times[len(times) // 2]:7.2f} us   "
+          f"p99 {times[int(len(times) * 0.99)]:7.2f} us", file=sys.__stdout__)
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    out = pipe()
+    timed("print", lambda: print(TEXT, file=out, flush=True), calls)
+
+    stream_handler = logging.StreamHandler(pipe())
+    stream = logger_with('bench.stream', stream_handler)
+    timed("stream handler", lambda: stream.info("OCR text of %s: %s", 1, TEXT), calls)
+
+    queue_handler = QueueLogHandler(pipe(), max_size=calls + 1)
+    queued = logger_with('bench.queue', queue_handler)
+    timed("queue handler", lambda: queued.info("OCR text of %s: %s", 1, TEXT), calls)
+
+    logging.getLogger('payload').setLevel(logging.CRITICAL)
+    timed("payload, off", lambda: log_payload(queued, "OCR text of %s: %s", 1, TEXT), calls)
+
+    queue_handler.close()
+    print(f"queue handler dropped {queue_handler.dropped} records", file=sys.__stdout__)
+
+
+if __name__ == '__main__':
+    main()
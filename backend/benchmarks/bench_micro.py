@@ -0,0 +1,147 @@
+"""
+Micro-benchmarks of the hot paths a scan, list or price request goes through.
+
+Run from /backend:
+    python benchmarks/bench_micro.py [--iterations 50] [--only combine,symspell]
+
+    combine      combine_image_bytes + encode_jpeg for a 12MP front and back, as sent to OCR
+    symspell     card_name_index.correct() on Pokémon names with one typo (20 lookups per iteration)
+    ebay_parse   parsing a 60-result eBay sold listings page and summarizing the prices
+    card_list    CardListSerializer for a 50 card page, as /api/cards/ returns
+    card_detail  CardSerializer (with the nested CardImage) for 50 cards
+
+Results are printed and saved to benchmarks/results/micro-<timestamp>.json; compare two
+runs with benchmarks/results.py.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from django_setup import setup_django
+from results import save_results, summarize
+
+
+def timed(fn, iterations, warmup=2):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def photo(width, height, seed):
+    """A JPEG with gradients and noise, so it decodes and compresses like a photo rather than a flat image."""
+    import cv2
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    image = np.stack([(x + y) / 2, np.broadcast_to(x, (height, width)), np.broadcast_to(y, (height, width))], axis=2)
+    image += rng.normal(0, 12, image.shape)
+    return cv2.imencode('.jpg', np.clip(image, 0, 255).astype(np.uint8), [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+
+
+def bench_combine(iterations):
+    from api.ai_card.card_to_text import combine_image_bytes, encode_jpeg
+
+    front, back = photo(3024, 4032, 1), photo(3024, 4032, 2)
+    return timed(lambda: encode_jpeg(combine_image_bytes(front, back)), iterations)
+
+
+def bench_symspell(iterations):
+    from api.card_types.pokemon import CARD_NAMES_PATH, card_name_index
+
+    with open(CARD_NAMES_PATH, encoding='utf-8') as f:
+        names = [line.rstrip('\n').rpartition(' ')[0] for line in f if line.strip()]
+    rng = random.Random(0)
+    queries = []
+    for name in rng.sample(names, 200):
+        i = rng.randrange(1, len(name) - 1) if len(name) > 3 else 0
+        queries.append(name[:i] + name[i + 1:])
+    card_name_index.correct(queries[0])  # load the index outside the timings
+
+    position = iter(range(10 ** 9))
+    return timed(lambda: card_name_index.correct(queries[next(position) % len(queries)]), iterations * 20)
+
+
+def bench_ebay_parse(iterations):
+    from types import SimpleNamespace
+    from api.card_types.price_scraper import _summary_from_response
+    from upstreams import ebay_page
+
+    response = SimpleNamespace(status_code=200, text=ebay_page('https://www.ebay.com/sch/i.html?_nkw=Mike+Trout'))
+    return timed(lambda: _summary_from_response(response), iterations)
+
+
+def _cards(count):
+    from django.contrib.auth.models import User
+    from api.models import Card, CardImage
+
+    user = User.objects.create_user(f'micro{random.random()}', 'micro@example.com', 'micro-password')
+    images = CardImage.objects.bulk_create([
+        CardImage(card_front_image=f'front_{i}.jpg', card_back_image=f'back_{i}.jpg',
+                  extracted_text='Pokémon Pikachu HP 60 58/102 ' * 10,
+                  variants={'128.webp': f'thumbnails/{i}.128.webp', '512.webp': f'thumbnails/{i}.512.webp'})
+        for i in range(count)
+    ])
+    Card.objects.bulk_create([
+        Card(owner=user, card_image=image, name='Pikachu', set='Base', number=f'{i}/102', card_company='Pokémon',
+             autograph=False, is_graded=False)
+        for i, image in enumerate(images)
+    ])
+    return list(Card.objects.filter(owner=user).select_related('card_image'))
+
+
+def bench_card_list(iterations):
+    from api.serializers import CardListSerializer
+
+    cards = _cards(50)
+    return timed(lambda: CardListSerializer(cards, many=True).data, iterations)
+
+
+def bench_card_detail(iterations):
+    from api.serializers import CardSerializer
+
+    cards = _cards(50)
+    return timed(lambda: CardSerializer(cards, many=True).data, iterations)
+
+
+BENCHMARKS = {
+    'combine': bench_combine,
+    'symspell': bench_symspell,
+    'ebay_parse': bench_ebay_parse,
+    'card_list': bench_card_list,
+    'card_detail': bench_card_detail,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--only', default=','.join(BENCHMARKS), help='comma-separated benchmarks to run')
+    args = parser.parse_args()
+    names = [name for name in args.only.split(',') if name]
+
+    setup_django()
+    results = {}
+    for name in names:
+        summary = summarize(BENCHMARKS[name](args.iterations))
+        summary['ops_per_second'] = 1000 / summary['mean_ms']
+        results[name] = summary
+        print(f"{name:<12} mean {summary['mean_ms']:9.3f} ms   p50 {summary['p50_ms']:9.3f} ms   "
+              f"p95 {summary['p95_ms']:9.3f} ms   p99 {summary['p99_ms']:9.3f} ms")
+
+    path = save_results('micro', {'iterations': args.iterations, 'benchmarks': names}, results)
+    print(f"Saved {path}")
+
+
+if __name__ == '__main__':
+    main()
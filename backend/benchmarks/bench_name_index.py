@@ -0,0 +1,78 @@
+"""
+Compare Pokémon name correction latency with and without the shared SymSpell index.
+
+Run from /backend:
+    python benchmarks/bench_name_index.py [iterations]
+
+"before" rebuilds SymSpell from card_names.txt on every lookup (the old per-request
+behaviour), "after" goes through the process-wide card_name_index.
+"""
+import os
+import random
+import statistics
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+
+from symspellpy import SymSpell, Verbosity
+
+from api.card_types.pokemon import CARD_NAMES_PATH, CardNameIndex
+
+
+def load_names():
+    with open(CARD_NAMES_PATH, encoding="utf-8") as f:
+        return [line.rstrip("\n").rpartition(" ")[0] for line in f if line.strip()]
+
+
+def typo(name, rng):
+    if len(name) < 4:
+        return name
+    i = rng.randrange(1, len(name) - 1)
+    return name[:i] + name[i + 1:]
+
+
+def lookup_rebuild(name):
+    # The old loader split names on the first space, which SymSpell warns about per line
+    warnings.simplefilter("ignore", UserWarning)
+    sym_spell = SymSpell(max_dictionary_edit_distance=2)
+    sym_spell.load_dictionary(CARD_NAMES_PATH, term_index=0, count_index=1)
+    suggestions = sym_spell.lookup(name, Verbosity.ALL, max_edit_distance=2)
+    return suggestions[0].term if suggestions else name
+
+
+def timed(fn, queries):
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(label, samples):
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{label:<22} mean {statistics.mean(samples):9.3f} ms   "
+          f"p50 {statistics.median(samples):9.3f} ms   p99 {p99:9.3f} ms")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    rng = random.Random(42)
+    names = load_names()
+    queries = [typo(rng.choice(names), rng) for _ in range(iterations)]
+
+    index = CardNameIndex(CARD_NAMES_PATH)
+    start = time.perf_counter()
+    index.get()
+    print(f"first build / pickle load: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    report("before (per request)", timed(lookup_rebuild, queries))
+    report("after (shared index)", timed(index.correct, queries))
+
+
+if __name__ == "__main__":
+    main()
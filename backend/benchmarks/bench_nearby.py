@@ -0,0 +1,91 @@
+"""
+/api/cardshops/nearby/ lookups against a large table of shops.
+
+Run from /backend:
+    python benchmarks/bench_nearby.py [shops] [queries]
+
+Seeds a throwaway database with shops (50,000 by default) clustered around 60 city
+centres, like real shops, then times radius searches and k-nearest searches from points
+near those cities. The same radius search done as a scan of every located shop is timed
+for comparison, and its answers are checked against the geohash index's.
+"""
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from django_setup import setup_django
+
+
+def seed(count, rng):
+    from django.contrib.auth.models import User
+    from api.geo import encode
+    from api.models import CardShop
+
+    owner = User.objects.create_user('shops', 'shops@example.com', 'shops-password')
+    cities = [(rng.uniform(26, 48), rng.uniform(-122, -70)) for _ in range(60)]
+    shops = []
+    for i in range(count):
+        lat, lng = rng.choice(cities)
+        lat, lng = lat + rng.gauss(0, 0.3), lng + rng.gauss(0, 0.3)
+        # bulk_create doesn't call save(), which normally fills in the geohash
+        shops.append(CardShop(
+            owner=owner, name=f'Shop {i}', address=f'{i} Main St', city='City', state='CA',
+            postal_code='00000', country='US', latitude=lat, longitude=lng, geohash=encode(lat, lng),
+        ))
+    CardShop.objects.bulk_create(shops, batch_size=2000)
+    return cities
+
+
+def full_scan(queryset, lat, lng, radius_km):
+    from api.geo import distance_km
+
+    hits = []
+    for id, y, x in queryset.exclude(geohash='').values_list('id', 'latitude', 'longitude'):
+        distance = distance_km(lat, lng, y, x)
+        if distance <= radius_km:
+            hits.append((distance, id))
+    hits.sort()
+    return hits
+
+
+def timed(fn, points):
+    samples, results = [], []
+    for lat, lng in points:
+        start = time.perf_counter()
+        results.append(fn(lat, lng))
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), max(samples), results
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    setup_django()
+    from api.geo import nearest, within_radius
+    from api.models import CardShop
+
+    rng = random.Random(0)
+    print(f"Seeding {count} shops...")
+    cities = seed(count, rng)
+    points = [(lat + rng.gauss(0, 0.2), lng + rng.gauss(0, 0.2)) for lat, lng in (rng.choice(cities) for _ in range(queries))]
+    shops = CardShop.objects.all()
+
+    for radius in (5, 25, 100):
+        median, worst, indexed = timed(lambda lat, lng: within_radius(shops, lat, lng, radius), points)
+        found = statistics.median(len(hits) for hits in indexed)
+        print(f"radius {radius:>3} km    median {median:7.2f} ms   max {worst:7.2f} ms   ({found:.0f} shops found)")
+        scan_median, _, scanned = timed(lambda lat, lng: full_scan(shops, lat, lng, radius), points[:10])
+        assert scanned == indexed[:10], "geohash search and full scan disagree"
+        print(f"  full scan        median {scan_median:7.2f} ms")
+
+    for k in (1, 10):
+        median, worst, _ = timed(lambda lat, lng: nearest(shops, lat, lng, k), points)
+        print(f"nearest {k:>2}       median {median:7.2f} ms   max {worst:7.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
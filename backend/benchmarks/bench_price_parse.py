@@ -0,0 +1,64 @@
+"""
+Parse time per eBay sold listings page, over the saved pages in fixtures/ebay/.
+
+Run from /backend:
+    python benchmarks/bench_price_parse.py [iterations]
+
+For each page it times price_scraper's incremental parser (sold_prices + summarize_prices)
+and, when beautifulsoup4 is installed, the old approach of building the whole page as a
+BeautifulSoup html.parser tree to read the s-item__price spans. Save more pages
+(view-source of an eBay sold search) into fixtures/ebay/ to benchmark them too.
+"""
+import glob
+import os
+import statistics
+import sys
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+
+from api.card_types.price_scraper import sold_prices, summarize_prices
+
+
+FIXTURES = os.path.join(BENCHMARKS_DIR, 'fixtures', 'ebay', '*.html')
+
+
+def incremental(html):
+    return summarize_prices(sold_prices(html))
+
+
+def full_tree(html):
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, 'html.parser')
+    return [price.text.strip() for price in soup.find_all('span', class_='s-item__price')[:7]]
+
+
+def median_ms(fn, html, iterations):
+    fn(html)
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn(html)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    try:
+        import bs4  # noqa: F401
+        parsers = {'incremental': incremental, 'bs4 tree': full_tree}
+    except ImportError:
+        parsers = {'incremental': incremental}
+
+    for path in sorted(glob.glob(FIXTURES)):
+        with open(path, encoding='utf-8') as f:
+            html = f.read()
+        print(f"{os.path.basename(path)} ({len(html) // 1024} KB): {incremental(html)}")
+        for name, fn in parsers.items():
+            print(f"  {name:<12} {median_ms(fn, html, iterations):8.2f} ms per page")
+
+
+if __name__ == '__main__':
+    main()
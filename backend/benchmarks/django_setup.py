@@ -0,0 +1,36 @@
+"""
+Django bootstrap shared by the benchmarks that need the ORM or the API.
+
+Each run gets a throwaway SQLite database and media directory under a temp folder,
+so benchmarks never touch db.sqlite3 or media/. Pass workdir to attach another process
+(e.g. a server started by the benchmark) to a database that was already set up.
+"""
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_django(workdir=None, **overrides):
+    sys.path.insert(0, BACKEND_DIR)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+    os.environ.setdefault("GROQ_API_KEY", "benchmark")
+
+    import django
+    from django.conf import settings
+
+    migrate = workdir is None
+    if workdir is None:
+        workdir = tempfile.mkdtemp(prefix="cruzin-bench-")
+    settings.DATABASES["default"]["NAME"] = os.path.join(workdir, "bench.sqlite3")
+    settings.MEDIA_ROOT = os.path.join(workdir, "media")
+    settings.ALLOWED_HOSTS = list(settings.ALLOWED_HOSTS) + ["testserver"]
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+    django.setup()
+
+    if migrate:
+        from django.core.management import call_command
+        call_command("migrate", verbosity=0)
+    return workdir
@@ -0,0 +1,222 @@
+"""
+End-to-end load scenarios against the API, with every upstream replaced by the local
+stand-ins in upstreams.py.
+
+Run from /backend:
+    python benchmarks/load_api.py [--scenarios upload,list,price,price_cold] [--stack wsgi]
+        [--concurrency 8] [--requests 200] [--latency groq=0.4,scraper=1.5] [--error-rate 0.01]
+
+    upload       POST /api/upload/ with a different 3MP front and back each time, scanned in
+                 the request: combine, Vision, Groq, card API lookup and insert
+    list         GET /api/cards/ (50 per page) of a 500 card collection
+    price        GET /api/card_price/<id>/ for cards whose price is already cached
+    price_cold   GET /api/card_price/<id>/ for cards never priced, so each one scrapes eBay
+
+--stack is wsgi (a pooled WSGI server with 8 threads, like gunicorn --threads 8), asgi
+(uvicorn, same views) or asgi-async (uvicorn, with the async upload and price views).
+The server runs in its own process against a throwaway SQLite database, so write-heavy
+scenarios at high concurrency are limited by SQLite's single writer.
+
+Each scenario reports requests/second, p50/p95/p99 latency, the status codes and how
+many upstream calls it made. Results are saved to benchmarks/results/load-<timestamp>.json;
+compare two runs with benchmarks/results.py.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from django_setup import setup_django
+from results import save_results, summarize
+from servers import serve_asgi, serve_wsgi, wait_for_port
+from upstreams import SERVICES, _parse_services, start_upstreams, upstream_env
+
+
+SCENARIOS = ('upload', 'list', 'price', 'price_cold')
+PORT = 8611
+SERVER_SETTINGS = {'ALLOWED_HOSTS': ['127.0.0.1', 'localhost', 'testserver']}
+COLLECTION_SIZE = 500
+
+
+def card_photo(seed, width=1512, height=2016):
+    """A JPEG whose coarse layout differs per seed, so scan dedup doesn't treat two uploads as the same card."""
+    import cv2
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    blocks = rng.integers(0, 256, (6, 4, 3), dtype=np.uint8)
+    image = cv2.resize(blocks, (width, height), interpolation=cv2.INTER_CUBIC).astype(np.int16)
+    image += rng.integers(-10, 10, image.shape, dtype=np.int16)
+    return cv2.imencode('.jpg', np.clip(image, 0, 255).astype(np.uint8), [cv2.IMWRITE_JPEG_QUALITY, 88])[1].tobytes()
+
+
+# Server process
+
+def run_server(stack, port, workdir):
+    setup_django(workdir=workdir, **SERVER_SETTINGS)
+    from api.card_types import http_client
+    # Let the stand-ins take as many concurrent requests as the server sends
+    http_client.configure_host(os.environ['SCRYFALL_API_URL'].split('/')[2], max_concurrency=1000)
+    serve_wsgi(port) if stack == 'wsgi' else serve_asgi(port)
+
+
+# Load generator
+
+async def run_load(send, concurrency, total):
+    """Call send(client, i) total times from concurrency workers. Returns (latencies_ms, statuses, elapsed)."""
+    import httpx
+
+    latencies = []
+    statuses = {}
+    next_index = 0
+
+    async with httpx.AsyncClient(
+        base_url=f'http://127.0.0.1:{PORT}', timeout=300, limits=httpx.Limits(max_connections=concurrency),
+    ) as client:
+        async def worker():
+            nonlocal next_index
+            while next_index < total:
+                index = next_index
+                next_index += 1
+                start = time.perf_counter()
+                try:
+                    status = (await send(client, index)).status_code
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+                if status in (200, 201):
+                    latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return latencies, statuses, elapsed
+
+
+def scenario_requests(name, fixtures, stack):
+    """The send(client, i) function for a scenario."""
+    headers = {'Authorization': f"Bearer {fixtures['token']}"}
+    prefix = '/api/async' if stack == 'asgi-async' else '/api'
+
+    if name == 'upload':
+        photos = fixtures['photos']
+
+        async def send(client, i):
+            front, back = photos[i % len(photos)]
+            return await client.post(f'{prefix}/upload/', headers=headers, files={
+                'card_front_image': (f'front_{i}.jpg', front, 'image/jpeg'),
+                'card_back_image': (f'back_{i}.jpg', back, 'image/jpeg'),
+            })
+    elif name == 'list':
+        async def send(client, i):
+            return await client.get('/api/cards/', headers=headers)
+    else:
+        ids = fixtures['priced_ids'] if name == 'price' else fixtures['unpriced_ids']
+
+        async def send(client, i):
+            return await client.get(f'{prefix}/card_price/{ids[i % len(ids)]}/', headers=headers)
+    return send
+
+
+def seed(requests, warmup):
+    """Create the benchmark user, their collection and the upload images. Returns the fixtures."""
+    from django.contrib.auth.models import User
+    from rest_framework_simplejwt.tokens import RefreshToken
+    from api.models import Card, CardImage
+    from api.price_cache import store_price
+
+    user = User.objects.create_user('load', 'load@example.com', 'load-password')
+    images = CardImage.objects.bulk_create([
+        CardImage(card_front_image=f'front_{i}.jpg', card_back_image=f'back_{i}.jpg')
+        for i in range(COLLECTION_SIZE + requests + warmup)
+    ])
+    cards = Card.objects.bulk_create([
+        Card(owner=user, card_image=image, name=f'Collection Card {i}', set='2020 Topps', number=str(i),
+             card_company='Topps', autograph=False, is_graded=False, price_key=f'Collection Card {i} 2020 Topps {i}')
+        for i, image in enumerate(images)
+    ])
+    collection, unpriced = cards[:COLLECTION_SIZE], cards[COLLECTION_SIZE:]
+    for card in collection:
+        store_price(card.price_key, card.card_company, 12.5)
+
+    print(f"Generating {requests + warmup} upload image pairs...")
+    photos = [(card_photo(2 * i), card_photo(2 * i + 1)) for i in range(requests + warmup)]
+    return {
+        'token': str(RefreshToken.for_user(user).access_token),
+        'priced_ids': [card.id for card in collection],
+        'unpriced_ids': [card.id for card in unpriced],
+        'photos': photos,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--stack', choices=('wsgi', 'asgi', 'asgi-async'), default='wsgi')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=8)
+    parser.add_argument('--latency', type=_parse_services, default={}, help='seconds per upstream, e.g. groq=0.4,vision=0.2')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of upstream requests answered with a 503')
+    args = parser.parse_args()
+    scenarios = [name for name in args.scenarios.split(',') if name]
+    for name in scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"Unknown scenario {name!r}")
+
+    upstreams = start_upstreams(latency=args.latency, error_rate=args.error_rate)
+    os.environ.update(upstream_env(upstreams.url))
+    workdir = setup_django(**SERVER_SETTINGS)
+    fixtures = seed(args.requests, args.warmup)
+
+    server_stack = 'wsgi' if args.stack == 'wsgi' else 'asgi'
+    # In its own session, so stopping it also stops its image work processes
+    server = subprocess.Popen(
+        [sys.executable, __file__, '--serve', server_stack, str(PORT), workdir],
+        stdout=subprocess.DEVNULL, env={**os.environ, 'LOG_LEVEL': 'WARNING'}, start_new_session=True,
+    )
+    results = {}
+    try:
+        wait_for_port(PORT)
+        print(f"{args.stack}, {args.concurrency} concurrent clients, {args.requests} requests per scenario")
+        for name in scenarios:
+            send = scenario_requests(name, fixtures, args.stack)
+            if name == 'upload':
+                # Warm up on the images after the measured ones, so no measured upload is a repeat
+                fixtures['photos'] = fixtures['photos'][args.warmup:] + fixtures['photos'][:args.warmup]
+            if name != 'price_cold':
+                asyncio.run(run_load(send, args.concurrency, args.warmup))
+
+            calls_before = dict(upstreams.counts)
+            latencies, statuses, elapsed = asyncio.run(run_load(send, args.concurrency, args.requests))
+            result = summarize(latencies)
+            result['rps'] = len(latencies) / elapsed
+            result['errors'] = args.requests - len(latencies)
+            result['statuses'] = statuses
+            result['upstream_calls'] = {s: upstreams.counts[s] - calls_before[s] for s in SERVICES if upstreams.counts[s] != calls_before[s]}
+            results[name] = result
+            print(f"{name:<11} {result['rps']:7.1f} req/s   p50 {result.get('p50_ms', 0):7.0f} ms   "
+                  f"p95 {result.get('p95_ms', 0):7.0f} ms   p99 {result.get('p99_ms', 0):7.0f} ms   "
+                  f"errors {result['errors']}   upstream {result['upstream_calls']}")
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait()
+        upstreams.stop()
+
+    params = {
+        'stack': args.stack, 'concurrency': args.concurrency, 'requests': args.requests, 'warmup': args.warmup,
+        'upstream_latency': upstreams.latency, 'upstream_error_rate': args.error_rate, 'scenarios': scenarios,
+    }
+    print(f"Saved {save_results('load', params, results)}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--serve':
+        run_server(sys.argv[2], int(sys.argv[3]), sys.argv[4])
+    else:
+        main()
@@ -0,0 +1,175 @@
+"""
+Load test: card price requests through the sync (WSGI) and async (ASGI) stacks while the
+upstream price API is slow.
+
+Run from /backend:
+    python benchmarks/load_async_vs_sync.py [concurrency] [requests] [upstream_delay_ms]
+
+A stand-in PokémonTCG server answers every price query after upstream_delay_ms. The price
+cache TTL is set to 0, so every request goes upstream. Three setups are measured:
+
+    wsgi  sync   RetrieveCardPrice on a WSGI server with 8 worker threads
+                 (like gunicorn --threads 8)
+    asgi  sync   the same view on uvicorn; Django gives each sync request its own
+                 executor thread, so threads grow with concurrency
+    asgi  async  AsyncCardPriceView on uvicorn, which waits on the upstream
+                 without holding a thread
+
+Each server runs in its own process against the same SQLite database. It reports
+requests/second and latency percentiles.
+"""
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from django_setup import setup_django
+from servers import serve_asgi, serve_wsgi, wait_for_port
+
+
+SERVER_SETTINGS = {
+    'PRICE_CACHE_TTL': {'default': 0},
+    'PRICE_CACHE_LRU_SIZE': 0,
+    'ALLOWED_HOSTS': ['127.0.0.1', 'localhost', 'testserver'],
+}
+
+
+class UpstreamServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class SlowPokemonAPI(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    delay = 0.25
+    body = json.dumps({
+        'totalCount': 1,
+        'data': [{'id': 'base1-58', 'name': 'Pikachu', 'number': '58',
+                  'cardmarket': {'prices': {'averageSellPrice': 4.5}}}],
+    }).encode()
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        try:
+            self.wfile.write(self.body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Server processes
+
+def run_server(stack, port, workdir):
+    setup_django(workdir=workdir, **SERVER_SETTINGS)
+    from api.card_types import http_client, pokemon
+    # Let the stand-in take as many concurrent requests as the stacks can send
+    http_client.configure_host(pokemon.POKEMON_API_URL.split('/')[2], max_concurrency=1000)
+    serve_wsgi(port) if stack == 'wsgi' else serve_asgi(port)
+
+
+# Load generator
+
+async def load(url, token, concurrency, total):
+    import httpx
+
+    latencies = []
+    errors = 0
+    remaining = total
+
+    async with httpx.AsyncClient(
+        headers={'Authorization': f'Bearer {token}'},
+        timeout=120,
+        limits=httpx.Limits(max_connections=concurrency),
+    ) as client:
+        async def worker():
+            nonlocal remaining, errors
+            while remaining > 0:
+                remaining -= 1
+                start = time.perf_counter()
+                try:
+                    response = await client.get(url)
+                    ok = response.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append((time.perf_counter() - start) * 1000)
+                else:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+def report(label, latencies, errors, elapsed):
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0
+    p50 = statistics.median(latencies) if latencies else 0
+    print(f"{label:<12} {len(latencies) / elapsed:7.1f} req/s   p50 {p50:7.0f} ms   "
+          f"p99 {p99:7.0f} ms   errors {errors}")
+
+
+def main():
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    total = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    SlowPokemonAPI.delay = (int(sys.argv[3]) if len(sys.argv) > 3 else 250) / 1000
+
+    upstream = UpstreamServer(('127.0.0.1', 0), SlowPokemonAPI)
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    os.environ['POKEMONTCG_API_URL'] = f'http://127.0.0.1:{upstream.server_port}/v2'
+
+    workdir = setup_django(**SERVER_SETTINGS)
+    from django.contrib.auth.models import User
+    from rest_framework_simplejwt.tokens import RefreshToken
+    from api.models import Card, CardImage
+
+    user = User.objects.create_user('bench', 'bench@example.com', 'bench-password')
+    card = Card.objects.create(
+        owner=user, card_image=CardImage.objects.create(card_front_image='f.jpg', card_back_image='b.jpg'),
+        name='Pikachu', set='Base', number='58/102', card_company='Pokémon', autograph=False, is_graded=False,
+    )
+    token = str(RefreshToken.for_user(user).access_token)
+
+    print(f"{concurrency} concurrent clients, {total} requests, upstream {SlowPokemonAPI.delay * 1000:.0f} ms")
+    servers = {}
+    try:
+        for port, stack in ((8601, 'wsgi'), (8602, 'asgi')):
+            servers[stack] = subprocess.Popen(
+                [sys.executable, __file__, '--serve', stack, str(port), workdir], stdout=subprocess.DEVNULL
+            )
+            wait_for_port(port)
+
+        for label, url in (
+            ('wsgi  sync', f'http://127.0.0.1:8601/api/card_price/{card.id}/'),
+            ('asgi  sync', f'http://127.0.0.1:8602/api/card_price/{card.id}/'),
+            ('asgi  async', f'http://127.0.0.1:8602/api/async/card_price/{card.id}/'),
+        ):
+            asyncio.run(load(url, token, concurrency, concurrency))  # warm up
+            report(label, *asyncio.run(load(url, token, concurrency, total)))
+    finally:
+        for server in servers.values():
+            server.terminate()
+            server.wait()
+        upstream.shutdown()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--serve':
+        run_server(sys.argv[2], int(sys.argv[3]), sys.argv[4])
+    else:
+        main()
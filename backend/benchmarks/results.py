@@ -0,0 +1,98 @@
+"""
+Benchmark results as JSON files, so runs can be compared over time.
+
+bench_micro.py and load_api.py save {'kind', 'timestamp', 'environment', 'params',
+'results': {name: {metric: value}}} under benchmarks/results/. To compare two runs:
+
+    python benchmarks/results.py results/load-20261018T090000Z.json results/load-20261019T090000Z.json
+"""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# Metrics where a higher number is better; for the rest (times) lower is better
+HIGHER_IS_BETTER = {'rps', 'ops_per_second'}
+
+
+def summarize(samples_ms):
+    """Mean and percentiles of a list of millisecond timings."""
+    if not samples_ms:
+        return {'count': 0}
+    ordered = sorted(samples_ms)
+
+    def percentile(fraction):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+    return {
+        'count': len(ordered),
+        'mean_ms': statistics.fmean(ordered),
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'max_ms': ordered[-1],
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def save_results(kind, params, results, directory=RESULTS_DIR):
+    """Write a run to <directory>/<kind>-<UTC timestamp>.json and return the path."""
+    now = datetime.now(timezone.utc)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{kind}-{now.strftime('%Y%m%dT%H%M%SZ')}.json")
+    with open(path, 'w') as f:
+        json.dump({
+            'kind': kind,
+            'timestamp': now.isoformat(),
+            'environment': environment(),
+            'params': params,
+            'results': results,
+        }, f, indent=2, sort_keys=True)
+    return path
+
+
+def compare(old, new):
+    """Print every metric the two runs share, with the change from old to new."""
+    print(f"old: {old['timestamp']} ({old['environment'].get('git_commit')})")
+    print(f"new: {new['timestamp']} ({new['environment'].get('git_commit')})")
+    if old.get('params') != new.get('params'):
+        print("warning: the runs used different parameters")
+    for name in sorted(set(old['results']) & set(new['results'])):
+        print(name)
+        before, after = old['results'][name], new['results'][name]
+        for metric in sorted(set(before) & set(after)):
+            a, b = before[metric], after[metric]
+            if not isinstance(a, (int, float)) or not isinstance(b, (int, float)) or metric == 'count':
+                continue
+            change = (b - a) / a * 100 if a else 0.0
+            better = change > 0 if metric in HIGHER_IS_BETTER else change < 0
+            marker = '' if abs(change) < 5 else ' better' if better else ' worse'
+            print(f"  {metric:<16} {a:12.2f} -> {b:12.2f}  {change:+7.1f}%{marker}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit(__doc__)
+    with open(sys.argv[1]) as f_old, open(sys.argv[2]) as f_new:
+        compare(json.load(f_old), json.load(f_new))
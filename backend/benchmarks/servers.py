@@ -0,0 +1,61 @@
+"""
+The project served over HTTP for load tests: a WSGI server with a fixed thread pool (like
+gunicorn --threads), or uvicorn for the ASGI stack. Load tests run these in a subprocess,
+so the load generator doesn't share a GIL with the server.
+"""
+import socket
+import time
+
+
+WSGI_THREADS = 8
+
+
+def serve_wsgi(port, threads=WSGI_THREADS):
+    from concurrent.futures import ThreadPoolExecutor
+    from django.core.servers.basehttp import WSGIRequestHandler, WSGIServer
+    from django.core.wsgi import get_wsgi_application
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    class PooledWSGIServer(WSGIServer):
+        """A WSGI server with a fixed pool of request threads, like gunicorn's gthread worker."""
+        request_queue_size = 1024
+
+        def __init__(self, *args, threads, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.pool = ThreadPoolExecutor(max_workers=threads)
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self._handle, request, client_address)
+
+        def _handle(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    server = PooledWSGIServer(('127.0.0.1', port), QuietHandler, threads=threads)
+    server.set_app(get_wsgi_application())
+    server.serve_forever()
+
+
+def serve_asgi(port):
+    import uvicorn
+    from django.core.asgi import get_asgi_application
+
+    uvicorn.run(get_asgi_application(), host='127.0.0.1', port=port, log_level='warning', backlog=1024)
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server on port {port} did not start")
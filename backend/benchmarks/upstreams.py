@@ -0,0 +1,297 @@
+"""
+Local stand-ins for every upstream the API calls, on one port.
+
+    POST /v1/images:annotate              Google Vision (REST transport)
+    POST /openai/v1/chat/completions      Groq
+    GET  /v2/cards                        pokemontcg.io
+    GET  /cards/search                    Scryfall
+    GET  /scraper/                        ScraperAPI fetching an eBay sold listings page
+    GET  /geocode/search                  Nominatim, placing each address somewhere in the US
+
+Every stand-in answers after a configurable latency and fails a configurable fraction
+of requests with a 503. The answers are consistent with each other. Vision "reads" one
+of the CARDS from each image (picked by a hash of the image bytes), and Groq, Scryfall
+and pokemontcg.io know the same cards, so a scan runs the whole pipeline end to end.
+
+Point the app at it with the variables from upstream_env(url). Run it on its own with:
+    python benchmarks/upstreams.py [--port 8700] [--latency groq=0.4,vision=0.2] [--error-rate 0.01]
+"""
+import argparse
+import base64
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+SERVICES = ('vision', 'groq', 'pokemon', 'scryfall', 'scraper', 'geocoder')
+
+# Roughly what the real services take, in seconds
+DEFAULT_LATENCY = {'vision': 0.25, 'groq': 0.4, 'pokemon': 0.3, 'scryfall': 0.1, 'scraper': 1.5, 'geocoder': 0.2}
+
+# What Vision reads off a scan, and what Groq and the card APIs know about each card
+CARDS = [
+    {'kind': 'pokemon', 'text': 'Pokémon Pikachu HP 60 58/102', 'name': 'Pikachu', 'number': '58', 'set': 'Base', 'total': 102},
+    {'kind': 'pokemon', 'text': 'Pokémon Charizard HP 120 4/102', 'name': 'Charizard', 'number': '4', 'set': 'Base', 'total': 102},
+    {'kind': 'pokemon', 'text': 'Pokémon Eevee HP 50 51/64', 'name': 'Eevee', 'number': '51', 'set': 'Jungle', 'total': 64},
+    {'kind': 'pokemon', 'text': 'Pokémon Mewtwo HP 70 10/102', 'name': 'Mewtwo', 'number': '10', 'set': 'Base', 'total': 102},
+    {'kind': 'pokemon', 'text': 'Pokémon Snorlax HP 90 11/64', 'name': 'Snorlax', 'number': '11', 'set': 'Jungle', 'total': 64},
+    {'kind': 'magic', 'text': 'MAGIC Lightning Bolt Instant 2021', 'name': 'Lightning Bolt', 'number': '141', 'set': 'Strixhaven Mystical Archive', 'year': '2021'},
+    {'kind': 'magic', 'text': 'MAGIC Counterspell Instant 2022', 'name': 'Counterspell', 'number': '45', 'set': 'Dominaria Remastered', 'year': '2022'},
+    {'kind': 'card', 'text': 'Topps 2011 Update Mike Trout US175', 'name': 'Mike Trout', 'number': 'US175', 'set': '2011 Topps Update', 'company': 'Topps'},
+    {'kind': 'card', 'text': 'Panini Prizm 2020 Lionel Messi 1', 'name': 'Lionel Messi', 'number': '1', 'set': '2020 Panini Prizm', 'company': 'Panini'},
+    {'kind': 'card', 'text': 'Upper Deck 1989 Ken Griffey Jr 1', 'name': 'Ken Griffey Jr', 'number': '1', 'set': '1989 Upper Deck', 'company': 'Upper Deck'},
+]
+CARDS_BY_TEXT = {card['text']: card for card in CARDS}
+
+
+def card_for_image(content):
+    return CARDS[int.from_bytes(hashlib.sha256(content).digest()[:4], 'big') % len(CARDS)]
+
+
+def _price(seed):
+    return round(1 + int.from_bytes(hashlib.sha256(seed.encode()).digest()[:2], 'big') % 5000 / 100, 2)
+
+
+class Upstreams(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address=('127.0.0.1', 0), latency=None, error_rate=0.0):
+        super().__init__(address, UpstreamHandler)
+        self.latency = {**DEFAULT_LATENCY, **(latency or {})}
+        self.error_rate = error_rate if isinstance(error_rate, dict) else {service: error_rate for service in SERVICES}
+        self.counts = {service: 0 for service in SERVICES}
+        self.errors = {service: 0 for service in SERVICES}
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def fail(self, service):
+        """Count a request to service, and decide whether it gets a 503."""
+        failed = random.random() < self.error_rate.get(service, 0.0)
+        with self._lock:
+            self.counts[service] += 1
+            self.errors[service] += int(failed)
+        return failed
+
+
+def upstream_env(url):
+    """Environment variables pointing a server process at the stand-ins."""
+    return {
+        'VISION_API_ENDPOINT': url,
+        'GROQ_BASE_URL': url,
+        'POKEMONTCG_API_URL': f'{url}/v2',
+        'SCRYFALL_API_URL': url,
+        'SCRAPER_API_URL': f'{url}/scraper/',
+        'GEOCODER_URL': f'{url}/geocode/search',
+    }
+
+
+def start_upstreams(latency=None, error_rate=0.0):
+    return Upstreams(latency=latency, error_rate=error_rate).start()
+
+
+class UpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path == '/v2/cards':
+            self.answer('pokemon', lambda: self.json(pokemon_cards(query)))
+        elif url.path == '/cards/search':
+            self.answer('scryfall', lambda: self.json(*scryfall_search(query)))
+        elif url.path == '/scraper/':
+            self.answer('scraper', lambda: self.html(ebay_page(query.get('url', ''))))
+        elif url.path == '/geocode/search':
+            self.answer('geocoder', lambda: self.json(geocode_search(query)))
+        else:
+            self.json({'error': 'not found'}, 404)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if self.path.startswith('/v1/images:annotate'):
+            self.answer('vision', lambda: self.json(vision_annotate(body)))
+        elif self.path == '/openai/v1/chat/completions':
+            self.answer('groq', lambda: self.json(groq_completion(body)))
+        else:
+            self.json({'error': 'not found'}, 404)
+
+    def answer(self, service, respond):
+        time.sleep(self.server.latency[service])
+        if self.server.fail(service):
+            self.json({'error': {'code': 503, 'message': f'{service} stand-in failure'}}, 503)
+        else:
+            respond()
+
+    def json(self, data, status=200):
+        self.send(status, 'application/json', json.dumps(data).encode())
+
+    def html(self, text):
+        self.send(200, 'text/html; charset=utf-8', text.encode())
+
+    def send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Stand-in responses
+
+def vision_annotate(body):
+    responses = []
+    for request in body.get('requests', []):
+        card = card_for_image(base64.b64decode(request['image']['content']))
+        responses.append({'textAnnotations': [{'description': card['text']}]})
+    return {'responses': responses}
+
+
+def _llm_answer(kind, text):
+    card = CARDS_BY_TEXT.get(text.strip())
+    if card is None:
+        card = {'name': text.strip()[:40], 'number': '1', 'set': 'Unknown', 'year': '2020', 'company': 'Unknown'}
+    if kind == 'pokemon':
+        return {'name': card['name'], 'set_number': card['number']}
+    if kind == 'magic':
+        return {'name': card['name'], 'year': card.get('year', '2020')}
+    return {
+        'name': card['name'], 'number': card['number'], 'set': card['set'],
+        'card_company': card.get('company', 'Unknown'), 'autograph': False, 'is_graded': False,
+    }
+
+
+def groq_completion(body):
+    system, user = body['messages'][0]['content'], body['messages'][1]['content']
+    kind = 'pokemon' if 'set_number' in system else 'magic' if '"year"' in system else 'card'
+    texts = re.findall(r": '(.*?)'(?:\n\nCard \d+:|$)", user, re.DOTALL)
+    if user.startswith('Card 1:'):
+        content = {'cards': [_llm_answer(kind, text) for text in texts]}
+    else:
+        content = _llm_answer(kind, texts[0] if texts else user)
+    return {
+        'id': 'chatcmpl-stand-in', 'object': 'chat.completion', 'created': int(time.time()), 'model': body.get('model'),
+        'choices': [{'index': 0, 'finish_reason': 'stop',
+                     'message': {'role': 'assistant', 'content': json.dumps(content)}}],
+        'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+    }
+
+
+def pokemon_cards(query):
+    q = query.get('q', '')
+    name = re.search(r'name:"([^"]*)"', q)
+    number = re.search(r'number:"([^"]*)"', q)
+    cards = [
+        {
+            'id': f"{card['set'].lower()}-{card['number']}", 'name': card['name'], 'number': card['number'],
+            'set': {'id': card['set'].lower(), 'name': card['set'], 'printedTotal': card['total'], 'releaseDate': '1999/01/09'},
+            'cardmarket': {'prices': {'averageSellPrice': _price(card['name'] + card['number'])}},
+        }
+        for card in CARDS
+        if card['kind'] == 'pokemon'
+        and (name is None or name.group(1).lower() == card['name'].lower())
+        and (number is None or number.group(1) == card['number'])
+    ]
+    return {'data': cards, 'page': int(query.get('page', 1)), 'pageSize': len(cards), 'count': len(cards), 'totalCount': len(cards)}
+
+
+def scryfall_search(query):
+    name = re.search(r'!"([^"]*)"', query.get('q', ''))
+    cards = [
+        {'object': 'card', 'name': card['name'], 'set_name': card['set'], 'collector_number': card['number'],
+         'released_at': f"{card['year']}-01-01", 'prices': {'usd': str(_price(card['name']))}}
+        for card in CARDS
+        if card['kind'] == 'magic' and name is not None and name.group(1).lower() == card['name'].lower()
+    ]
+    if not cards:
+        return {'object': 'error', 'code': 'not_found', 'status': 404, 'details': 'No cards found.'}, 404
+    return {'object': 'list', 'total_cards': len(cards), 'has_more': False, 'data': cards}, 200
+
+
+def ebay_page(url):
+    """A sold listings page shaped like eBay's, with 60 results and a few kilobytes of markup around each."""
+    base = _price(url)
+    items = []
+    for index in range(60):
+        price = round(base * (0.8 + (index % 9) / 20), 2)
+        items.append(
+            f'<li class="s-item s-item__pl-on-bottom" data-view="mi:1686|iid:{index + 1}">'
+            f'<div class="s-item__wrapper clearfix"><div class="s-item__image-section">'
+            f'<img src="https://i.ebayimg.com/thumbs/images/g/{index}/s-l140.jpg" alt="listing"></div>'
+            f'<div class="s-item__info clearfix"><a class="s-item__link" href="https://www.ebay.com/itm/{index}">'
+            f'<div class="s-item__title"><span role="heading">Sold listing {index + 1}</span></div></a>'
+            f'<div class="s-item__details clearfix"><div class="s-item__detail s-item__detail--primary">'
+            f'<span class="s-item__price">${price:,.2f}</span></div>'
+            f'<div class="s-item__detail s-item__detail--primary"><span class="s-item__shipping">+$4.99 shipping</span>'
+            f'</div></div></div></div></li>'
+        )
+    return (
+        '<!DOCTYPE html><html><head><title>Sold listings | eBay</title></head><body>'
+        + '<div class="srp-river">' + '<script>var x = 1;</script>' * 50
+        + '<ul class="srp-results srp-list clearfix">' + ''.join(items) + '</ul></div></body></html>'
+    )
+
+
+def geocode_search(query):
+    """One match per address, at a point in the continental US that depends only on the address."""
+    address = query.get('q', '').strip()
+    if not address:
+        return []
+    digest = hashlib.sha256(address.lower().encode()).digest()
+    lat = 25 + int.from_bytes(digest[:4], 'big') / 2 ** 32 * 24
+    lng = -124 + int.from_bytes(digest[4:8], 'big') / 2 ** 32 * 57
+    return [{'lat': f'{lat:.7f}', 'lon': f'{lng:.7f}', 'display_name': address}]
+
+
+def _parse_services(value, cast=float):
+    """'groq=0.4,vision=0.2' -> {'groq': 0.4, 'vision': 0.2}."""
+    result = {}
+    for part in filter(None, (value or '').split(',')):
+        service, _, amount = part.partition('=')
+        if service not in SERVICES:
+            raise argparse.ArgumentTypeError(f"Unknown service {service!r}; expected one of {', '.join(SERVICES)}")
+        result[service] = cast(amount)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--port', type=int, default=8700)
+    parser.add_argument('--latency', type=_parse_services, default={}, help='seconds per service, e.g. groq=0.4,vision=0.2')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with a 503')
+    args = parser.parse_args()
+
+    server = Upstreams(('127.0.0.1', args.port), latency=args.latency, error_rate=args.error_rate)
+    for name, value in upstream_env(server.url).items():
+        print(f'export {name}={value}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
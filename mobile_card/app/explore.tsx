@@ -44,13 +44,21 @@ export default function ViewCards() {
   const fetchCards = async () => {
     try {
       const token = await AsyncStorage.getItem("access_token");
-      const response = await axios.get(`${API_URL}/cards/`, {
-        headers: {
-          Authorization: `Bearer ${token}`,
-        },
-      });
-      setCards(response.data);
-      setFilteredCards(response.data);
+      // The list is cursor-paginated; follow `next` until every page is loaded
+      let url: string | null = `${API_URL}/cards/`;
+      const allCards: any[] = [];
+      while (url) {
+        const response: { data: { results: any[]; next: string | null } } =
+          await axios.get(url, {
+            headers: {
+              Authorization: `Bearer ${token}`,
+            },
+          });
+        allCards.push(...response.data.results);
+        url = response.data.next;
+      }
+      setCards(allCards);
+      setFilteredCards(allCards);
     } catch (error) {
       console.error("Error fetching cards:", error);
     }
@@ -107,7 +115,7 @@ export default function ViewCards() {
           <Text>Number: {item.number}</Text>
         </View>
         <Image
-          source={{ uri: item.card_image.card_front_image }}
+          source={{ uri: item.thumbnail }}
           style={styles.image}
         />
       </View>
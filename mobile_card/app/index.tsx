@@ -26,15 +26,21 @@ export default function HomeScreen() {
   const fetchCards = async () => {
     try {
       const token = await AsyncStorage.getItem("access_token");
-      const response = await axios.get(
-        "https://specifically-eugene-factor-trades.trycloudflare.com/api/cards/",
-        {
-          headers: {
-            Authorization: `Bearer ${token}`,
-          },
-        }
-      );
-      setCards(response.data);
+      // The list is cursor-paginated; follow `next` until every page is loaded
+      let url: string | null =
+        "https://specifically-eugene-factor-trades.trycloudflare.com/api/cards/";
+      const allCards: any[] = [];
+      while (url) {
+        const response: { data: { results: any[]; next: string | null } } =
+          await axios.get(url, {
+            headers: {
+              Authorization: `Bearer ${token}`,
+            },
+          });
+        allCards.push(...response.data.results);
+        url = response.data.next;
+      }
+      setCards(allCards);
     } catch (error) {
       console.error("Failed to fetch cards:", error);
       Alert.alert("Error", "Failed to load cards. Please try again.");